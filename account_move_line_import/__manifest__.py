@@ -11,7 +11,10 @@
     'website': 'https://github.com/OCA/account-financial-tools',
     'category': 'Accounting & Finance',
     'summary': 'Import Accounting Entries',
-    'depends': ['account'],
+    'depends': [
+        'account',
+        'import_xlsx_helpers',
+    ],
     'data': [
         'views/account_move.xml',
         'wizard/import_move_line_wizard.xml',
@@ -2,10 +2,17 @@
 # Copyright 2009-2018 Noviat
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import unittest
+
 from odoo import fields
 from odoo.tests.common import TransactionCase
 from odoo.modules.module import get_module_resource
 
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
 
 class TestAccountMoveLineImport(TransactionCase):
 
@@ -39,3 +46,65 @@ class TestAccountMoveLineImport(TransactionCase):
              'decimal_separator': ','})
         aml_import.with_context({'active_id': am.id}).aml_import()
         self.assertEquals(am.amount, 5000.00)
+
+    def test_aml_file_import_chunked(self):
+
+        am = self.am_model.create({
+            'date': fields.Date.today(),
+            'journal_id': self.j_misc.id})
+        aml_file_path = get_module_resource(
+            self.module_name, 'tests',
+            'test_account_move_lines.csv')
+        aml_data = open(aml_file_path, 'rb').read().encode('base64')
+        aml_import = self.aml_import_model.create(
+            {'aml_data': aml_data,
+             'csv_separator': ';',
+             'decimal_separator': ',',
+             'chunk_size': 2})
+        aml_import.with_context({'active_id': am.id}).aml_import()
+        self.assertEquals(len(am.line_ids), 3)
+        self.assertEquals(am.amount, 5000.00)
+
+    @unittest.skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_aml_xlsx_file_import(self):
+
+        am = self.am_model.create({
+            'date': fields.Date.today(),
+            'journal_id': self.j_misc.id})
+        aml_file_path = get_module_resource(
+            self.module_name, 'tests',
+            'test_account_move_lines.xlsx')
+        aml_data = open(aml_file_path, 'rb').read().encode('base64')
+        aml_import = self.aml_import_model.create(
+            {'aml_data': aml_data,
+             'csv_separator': ';',
+             'decimal_separator': ','})
+        aml_import.with_context({'active_id': am.id}).aml_import()
+        self.assertEquals(len(am.line_ids), 3)
+        self.assertEquals(am.amount, 5000.00)
+
+    @unittest.skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_aml_xlsx_cell_types(self):
+        """
+        Numeric and date cells are used as such,
+        numbers stored as text use the decimal separator.
+        """
+        am = self.am_model.create({
+            'date': fields.Date.today(),
+            'journal_id': self.j_misc.id})
+        aml_file_path = get_module_resource(
+            self.module_name, 'tests',
+            'test_account_move_lines_xlsx_cells.xlsx')
+        aml_data = open(aml_file_path, 'rb').read().encode('base64')
+        aml_import = self.aml_import_model.create(
+            {'aml_data': aml_data,
+             'csv_separator': ';',
+             'decimal_separator': ','})
+        aml_import.with_context({'active_id': am.id}).aml_import()
+        self.assertEquals(len(am.line_ids), 3)
+        self.assertEquals(am.amount, 5000.00)
+        amls = {l.name: l for l in am.line_ids}
+        self.assertEquals(amls['PI14/0101'].credit, 3500.50)
+        self.assertEquals(amls['PI14/0101'].date_maturity, '2018-01-12')
+        self.assertEquals(amls['PI14/0250'].credit, 1499.50)
+        self.assertEquals(amls['PI14/0250'].date_maturity, '2018-02-01')
@@ -2,23 +2,26 @@
 # Copyright 2009-2018 Noviat
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-try:
-    import cStringIO as StringIO
-except ImportError:
-    import StringIO
 import base64
 import csv
 import time
 from datetime import datetime
+from functools import partial
+from itertools import islice
 from sys import exc_info
 from traceback import format_exception
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.addons.import_xlsx_helpers.xlsx_helpers import \
+    NumericCell, is_xlsx, iter_xlsx_rows
 
 import logging
 _logger = logging.getLogger(__name__)
 
+# number of input rows per lookup prefetch
+PREFETCH_BLOCK_SIZE = 5000
+
 
 class AccountMoveLineImport(models.TransientModel):
     _name = 'aml.import'
@@ -26,8 +29,6 @@ class AccountMoveLineImport(models.TransientModel):
 
     aml_data = fields.Binary(string='File', required=True)
     aml_fname = fields.Char(string='Filename')
-    lines = fields.Binary(
-        compute='_compute_lines', string='Input Lines', required=True)
     dialect = fields.Binary(
         compute='_compute_dialect', string='Dialect', required=True)
     csv_separator = fields.Selection(
@@ -42,6 +43,14 @@ class AccountMoveLineImport(models.TransientModel):
         default=lambda self: self._default_codepage(),
         help="Code Page of the system that has generated the csv file."
              "\nE.g. Windows-1252, utf-8")
+    chunk_size = fields.Integer(
+        string='Chunk Size',
+        help="Number of lines that are written to the database at once."
+             "\nSet this field for very large input files in order to "
+             "limit the memory usage of the import."
+             "\nThe balance of the Journal Entry is only checked "
+             "after the last chunk."
+             "\nKeep empty to write all lines at once.")
     note = fields.Text('Log')
 
     @api.model
@@ -49,79 +58,151 @@ class AccountMoveLineImport(models.TransientModel):
         return 'Windows-1252'
 
     @api.one
-    @api.depends('aml_data')
-    def _compute_lines(self):
-        if self.aml_data:
-            lines = base64.decodestring(self.aml_data)
-            # convert windows & mac line endings to unix style
-            self.lines = lines.replace('\r\n', '\n').replace('\r', '\n')
-
-    @api.one
-    @api.depends('lines', 'csv_separator')
+    @api.depends('aml_data', 'csv_separator')
     def _compute_dialect(self):
-        if self.lines:
+        if self.aml_data and self._is_xlsx():
+            # xlsx input is not parsed with the csv module
+            self.dialect = csv.excel()
+        elif self.aml_data:
+            # the dialect is determined on the start of the file
+            # in order to avoid decoding the complete upload
+            sample = ''
+            for ln in self._iter_lines():
+                sample += ln
+                if len(sample) > 128:
+                    break
             try:
                 self.dialect = csv.Sniffer().sniff(
-                    self.lines[:128], delimiters=';,')
+                    sample[:128], delimiters=';,')
             except:
                 # csv.Sniffer is not always reliable
                 # in the detection of the delimiter
                 self.dialect = csv.Sniffer().sniff(
                     '"header 1";"header 2";\r\n')
-                if ',' in self.lines[128]:
+                if ',' in sample[128:129]:
                     self.dialect.delimiter = ','
-                elif ';' in self.lines[128]:
+                elif ';' in sample[128:129]:
                     self.dialect.delimiter = ';'
-        if self.csv_separator:
+        if self.csv_separator and self.dialect:
             self.dialect.delimiter = str(self.csv_separator)
 
     @api.onchange('aml_data')
     def _onchange_aml_data(self):
-        if self.lines:
+        if self.aml_data and not self._is_xlsx():
             self.csv_separator = self.dialect.delimiter
             if self.csv_separator == ';':
                 self.decimal_separator = ','
+        elif self.aml_data:
+            # xlsx input, the separators are only used for the log
+            # and for numbers stored as text
+            self.csv_separator = self.csv_separator or ','
 
     @api.onchange('csv_separator')
     def _onchange_csv_separator(self):
-        if self.csv_separator and self.aml_data:
+        if self.csv_separator and self.aml_data and not self._is_xlsx():
             self.dialect.delimiter = self.csv_separator
 
+    def _is_xlsx(self):
+        return is_xlsx(self.aml_data)
+
+    def _iter_xlsx_rows(self):
+        return iter_xlsx_rows(self.aml_data)
+
+    def _read_input(self):
+        """
+        Returns the header fields and an iterator over the
+        rows after the header line.
+        """
+        self._xlsx = self._is_xlsx()
+        if self._xlsx:
+            rows = self._iter_xlsx_rows()
+            for row in rows:
+                # remove leading blank or comment lines
+                if not row or row[0] == '' or row[0][:1] == '#':
+                    continue
+                return [unicode(x).lower() for x in row], rows
+            raise UserError(
+                _("No header line found in the input file !"))
+        lines, header = self._remove_leading_lines(self._iter_lines())
+        header_fields = csv.reader(
+            [header], dialect=self.dialect).next()
+        return header_fields, csv.reader(lines, dialect=self.dialect)
+
+    def _iter_data(self, chunk_size=65536):
+        """ decode the base64 encoded upload incrementally """
+        data = self.aml_data or ''
+        pending = ''
+        for i in xrange(0, len(data), chunk_size):
+            chunk = pending + ''.join(data[i:i + chunk_size].split())
+            cut = len(chunk) - len(chunk) % 4
+            pending = chunk[cut:]
+            if cut:
+                yield base64.b64decode(chunk[:cut])
+
+    def _iter_lines(self):
+        """
+        Generator of the lines of the upload with
+        windows & mac line endings converted to unix style.
+        """
+        pending = ''
+        for chunk in self._iter_data():
+            lines = (pending + chunk).splitlines(True)
+            # the last line may continue in the next chunk
+            pending = lines.pop()
+            for ln in lines:
+                yield ln.rstrip('\r\n') + '\n'
+        if pending:
+            yield pending.rstrip('\r\n') + '\n'
+
     def _remove_leading_lines(self, lines):
-        """ remove leading blank or comment lines """
-        input = StringIO.StringIO(lines)
+        """
+        remove leading blank or comment lines
+
+        :param lines: iterator over the input lines
+        :return: iterator positioned after the header line, header line
+        """
         header = False
         while not header:
-            ln = input.next()
+            try:
+                ln = lines.next()
+            except StopIteration:
+                raise UserError(
+                    _("No header line found in the input file !"))
             if not ln or ln and ln[0] in [self.csv_separator, '#']:
                 continue
             else:
                 header = ln.lower()
-        if not header:
-            raise UserError(
-                _("No header line found in the input file !"))
-        output = input.read()
-        return output, header
+        return lines, header
 
     def _input_fields(self):
         """
         Extend this dictionary if you want to add support for
         fields requiring pre-processing before being added to
         the move line values dict.
+        The 'prefetch' method resolves all distinct values of the
+        column with a minimum number of queries before processing
+        the input lines.
         """
         res = {
             'account': {'method': self._handle_account},
             'account_id': {'required': True},
             'debit': {'method': self._handle_debit, 'required': True},
             'credit': {'method': self._handle_credit, 'required': True},
-            'partner': {'method': self._handle_partner},
-            'product': {'method': self._handle_product},
+            'partner': {'method': self._handle_partner,
+                        'prefetch': self._prefetch_partners},
+            'product': {'method': self._handle_product,
+                        'prefetch': self._prefetch_products},
             'date_maturity': {'method': self._handle_date_maturity},
             'due date': {'method': self._handle_date_maturity},
-            'currency': {'method': self._handle_currency},
-            'tax account': {'method': self._handle_tax_code},
-            'tax_code': {'method': self._handle_tax_code},
-            'analytic account': {'method': self._handle_analytic_account},
+            'currency': {'method': self._handle_currency,
+                         'prefetch': self._prefetch_currencies},
+            'tax account': {'method': self._handle_tax_code,
+                            'prefetch': self._prefetch_tax_codes},
+            'tax_code': {'method': self._handle_tax_code,
+                         'prefetch': self._prefetch_tax_codes},
+            'analytic account': {
+                'method': self._handle_analytic_account,
+                'prefetch': self._prefetch_analytic_accounts},
         }
         return res
 
@@ -305,50 +386,76 @@ class AccountMoveLineImport(models.TransientModel):
             aml_vals['credit'] = credit
             self._sum_credit += credit
 
+    def _partner_domain(self):
+        return ['|', ('parent_id', '=', False), ('is_company', '=', True)]
+
+    def _prefetch_partners(self, move, values):
+        partners = self.env['res.partner'].search(
+            self._partner_domain()
+            + ['|', ('ref', 'in', values), ('name', 'in', values)])
+        self._partners_dict.update(
+            self._group_by_keys(values, partners, ['ref', 'name']))
+
+    def _get_partners(self, input):
+        if input in self._partners_dict:
+            return self._partners_dict[input]
+        part_mod = self.env['res.partner']
+        dom = self._partner_domain()
+        dom_ref = dom + [('ref', '=', input)]
+        partners = part_mod.search(dom_ref)
+        if not partners:
+            dom_name = dom + [('name', '=', input)]
+            partners = part_mod.search(dom_name)
+        return partners.ids
+
     def _handle_partner(self, field, line, move, aml_vals):
         if not aml_vals.get('partner_id'):
             input = line[field]
-            part_mod = self.env['res.partner']
-            dom = ['|', ('parent_id', '=', False), ('is_company', '=', True)]
-            dom_ref = dom + [('ref', '=', input)]
-            partners = part_mod.search(dom_ref)
-            if not partners:
-                dom_name = dom + [('name', '=', input)]
-                partners = part_mod.search(dom_name)
-            if not partners:
+            partner_ids = self._get_partners(input)
+            if not partner_ids:
                 msg = _("Partner '%s' not found !") % input
                 self._log_line_error(line, msg)
                 return
-            elif len(partners) > 1:
+            elif len(partner_ids) > 1:
                 msg = _("Multiple partners with Reference "
                         "or Name '%s' found !") % input
                 self._log_line_error(line, msg)
                 return
             else:
-                partner = partners[0]
-                aml_vals['partner_id'] = partner.id
+                aml_vals['partner_id'] = partner_ids[0]
+
+    def _prefetch_products(self, move, values):
+        products = self.env['product.product'].search(
+            ['|', ('default_code', 'in', values), ('name', 'in', values)])
+        self._products_dict.update(
+            self._group_by_keys(values, products, ['default_code', 'name']))
+
+    def _get_products(self, input):
+        if input in self._products_dict:
+            return self._products_dict[input]
+        prod_mod = self.env['product.product']
+        products = prod_mod.search([
+            ('default_code', '=', input)])
+        if not products:
+            products = prod_mod.search(
+                [('name', '=', input)])
+        return products.ids
 
     def _handle_product(self, field, line, move, aml_vals):
         if not aml_vals.get('product_id'):
             input = line[field]
-            prod_mod = self.env['product.product']
-            products = prod_mod.search([
-                ('default_code', '=', input)])
-            if not products:
-                products = prod_mod.search(
-                    [('name', '=', input)])
-            if not products:
+            product_ids = self._get_products(input)
+            if not product_ids:
                 msg = _("Product '%s' not found !") % input
                 self._log_line_error(line, msg)
                 return
-            elif len(products) > 1:
+            elif len(product_ids) > 1:
                 msg = _("Multiple products with Internal Reference "
                         "or Name '%s' found !") % input
                 self._log_line_error(line, msg)
                 return
             else:
-                product = products[0]
-                aml_vals['product_id'] = product.id
+                aml_vals['product_id'] = product_ids[0]
 
     def _handle_date_maturity(self, field, line, move, aml_vals):
         if not aml_vals.get('date_maturity'):
@@ -362,63 +469,171 @@ class AccountMoveLineImport(models.TransientModel):
                         " should be YYYY-MM-DD") % (field, due)
                 self._log_line_error(line, msg)
 
+    def _prefetch_currencies(self, move, values):
+        currencies = self.env['res.currency'].search([])
+        for value in values:
+            self._currencies_dict[value] = [
+                c.id for c in currencies
+                if c.name.lower() == value.lower()]
+
+    def _get_currencies(self, name):
+        if name in self._currencies_dict:
+            return self._currencies_dict[name]
+        return self.env['res.currency'].search([
+            ('name', '=ilike', name)]).ids
+
     def _handle_currency(self, field, line, move, aml_vals):
         if not aml_vals.get('currency_id'):
             name = line[field]
-            curr = self.env['res.currency'].search([
-                ('name', '=ilike', name)])
-            if curr:
-                aml_vals['currency_id'] = curr[0].id
+            currency_ids = self._get_currencies(name)
+            if currency_ids:
+                aml_vals['currency_id'] = currency_ids[0]
             else:
                 msg = _("Currency '%s' not found !") % name
                 self._log_line_error(line, msg)
 
+    def _prefetch_tax_codes(self, move, values):
+        codes = self.env['account.tax.code'].search(
+            ['|', ('code', 'in', values), ('name', 'in', values)])
+        self._tax_codes_dict.update(
+            self._group_by_keys(values, codes, ['code', 'name']))
+
+    def _get_tax_codes(self, input):
+        if input in self._tax_codes_dict:
+            return self._tax_codes_dict[input]
+        tc_mod = self.env['account.tax.code']
+        codes = tc_mod.search([
+            ('code', '=', input)])
+        if not codes:
+            codes = tc_mod.search(
+                [('name', '=', input)])
+        return codes.ids
+
     def _handle_tax_code(self, field, line, move, aml_vals):
         if not aml_vals.get('tax_code_id'):
             input = line[field]
-            tc_mod = self.env['account.tax.code']
-            codes = tc_mod.search([
-                ('code', '=', input)])
-            if not codes:
-                codes = tc_mod.search(
-                    [('name', '=', input)])
-            if not codes:
+            code_ids = self._get_tax_codes(input)
+            if not code_ids:
                 msg = _("%s '%s' not found !") % (field, input)
                 self._log_line_error(line, msg)
                 return
-            elif len(codes) > 1:
+            elif len(code_ids) > 1:
                 msg = _("Multiple %s entries with Code "
                         "or Name '%s' found !") % (field, input)
                 self._log_line_error(line, msg)
                 return
             else:
-                code = codes[0]
-                aml_vals['tax_code_id'] = code.id
+                aml_vals['tax_code_id'] = code_ids[0]
+
+    def _analytic_account_domain(self, move):
+        return [('type', '!=', 'view'),
+                ('company_id', '=', move.company_id.id),
+                ('state', 'not in', ['close', 'cancelled'])]
+
+    def _prefetch_analytic_accounts(self, move, values):
+        analytic_accounts = self.env['account.analytic.account'].search(
+            self._analytic_account_domain(move)
+            + ['|', ('code', 'in', values), ('name', 'in', values)])
+        by_code = self._group_by_keys(values, analytic_accounts, ['code'])
+        by_name = self._group_by_keys(values, analytic_accounts, ['name'])
+        for value in values:
+            if len(by_code[value]) == 1:
+                self._analytic_accounts_dict[value] = by_code[value]
+            else:
+                self._analytic_accounts_dict[value] = by_name[value]
+
+    def _get_analytic_accounts(self, move, input):
+        if input in self._analytic_accounts_dict:
+            return self._analytic_accounts_dict[input]
+        ana_mod = self.env['account.analytic.account']
+        domain = self._analytic_account_domain(move)
+        analytic_accounts = ana_mod.search(
+            domain + [('code', '=', input)])
+        if len(analytic_accounts) != 1:
+            analytic_accounts = ana_mod.search(
+                domain + [('name', '=', input)])
+        return analytic_accounts.ids
 
     def _handle_analytic_account(self, field, line, move, aml_vals):
         if not aml_vals.get('analytic_account_id'):
-            ana_mod = self.env['account.analytic.account']
             input = line[field]
-            domain = [('type', '!=', 'view'),
-                      ('company_id', '=', move.company_id.id),
-                      ('state', 'not in', ['close', 'cancelled'])]
-            analytic_accounts = ana_mod.search(
-                domain + [('code', '=', input)])
-            if len(analytic_accounts) == 1:
-                aml_vals['analytic_account_id'] = analytic_accounts.id
-            else:
-                analytic_accounts = ana_mod.search(
-                    domain + [('name', '=', input)])
-                if len(analytic_accounts) == 1:
-                    aml_vals['analytic_account_id'] = analytic_accounts.id
-            if not analytic_accounts:
+            analytic_account_ids = self._get_analytic_accounts(move, input)
+            if len(analytic_account_ids) == 1:
+                aml_vals['analytic_account_id'] = analytic_account_ids[0]
+            elif not analytic_account_ids:
                 msg = _("Invalid Analytic Account '%s' !") % input
                 self._log_line_error(line, msg)
-            elif len(analytic_accounts) > 1:
+            else:
                 msg = _("Multiple Analytic Accounts found "
                         "that match with '%s' !") % input
                 self._log_line_error(line, msg)
 
+    def _group_by_keys(self, values, records, keys):
+        """
+        Map the input values to the ids of the records that match
+        with the first key (in the order of 'keys') that gives a result.
+        """
+        res = {}
+        for value in values:
+            res[value] = []
+        for key in keys:
+            key_map = {}
+            for record in records:
+                key_map.setdefault(record[key], []).append(record.id)
+            for value in values:
+                if not res[value]:
+                    res[value] = key_map.get(value, [])
+        return res
+
+    def _init_prefetch(self):
+        self._partners_dict = {}
+        self._products_dict = {}
+        self._currencies_dict = {}
+        self._tax_codes_dict = {}
+        self._analytic_accounts_dict = {}
+        self._prefetch_cols = []
+        self._prefetched = {}
+        for i, hf in enumerate(self._header_fields):
+            if hf not in self._skip_fields \
+                    and self._field_methods[hf].get('prefetch'):
+                method = self._field_methods[hf]['prefetch']
+                self._prefetch_cols.append((i, method))
+                self._prefetched[method] = set()
+
+    def _prefetch(self, move, rows):
+        """
+        Collect the distinct values of the columns with a 'prefetch'
+        method in the input rows and resolve the values which have
+        not been resolved before with a single query per column.
+        """
+        if not self._prefetch_cols:
+            return
+
+        values = {}
+        for i, method in self._prefetch_cols:
+            values[method] = set()
+        for row in rows:
+            if row and row[0][:1] == '#':
+                continue
+            for i, method in self._prefetch_cols:
+                if i < len(row):
+                    if self._xlsx:
+                        value = row[i]
+                    else:
+                        try:
+                            value = row[i].decode(self.codepage).strip()
+                        except UnicodeError:
+                            # reported while processing the input lines
+                            continue
+                    if value:
+                        values[method].add(value)
+
+        for method in values:
+            todo = values[method] - self._prefetched[method]
+            if todo:
+                method(move, list(todo))
+                self._prefetched[method] |= todo
+
     def _process_line_vals(self, line, move, aml_vals):
         """
         Use this method if you want to check/modify the
@@ -445,10 +660,7 @@ class AccountMoveLineImport(models.TransientModel):
             # of the previous entry is added
             aml_vals['partner_id'] = False
 
-        all_fields = self._field_methods
-        required_fields = [x for x in all_fields
-                           if all_fields[x].get('required')]
-        for rf in required_fields:
+        for rf in self._required_fields:
             if rf not in aml_vals:
                 msg = _("The '%s' field is a required field "
                         "that must be correctly set.") % rf
@@ -478,15 +690,163 @@ class AccountMoveLineImport(models.TransientModel):
     def _process_vals(self, move, vals):
         """
         Use this method if you want to check/modify the
-        input values dict before calling the move write() method
+        input values dict before calling the move write() method.
+        The vals contain all lines of the Journal Entry.
+        This method is not called by the chunked import,
+        cf. _process_chunk_vals.
         """
+        return vals
+
+    def _process_chunk_vals(self, move, vals):
+        """
+        Use this method if you want to check/modify the
+        input values dict of a chunk before the creation of the
+        move lines of the chunk by the chunked import.
+        The vals only contain the lines of the chunk hence checks
+        on the complete Journal Entry must be performed after the
+        import, e.g. by extending _aml_import_chunked.
+        """
+        return vals
+
+    def _check_balance(self, move):
         dp = self.env['decimal.precision'].precision_get('Account')
         if round(self._sum_debit, dp) != round(self._sum_credit, dp):
             self._err_log += '\n' + _(
                 "Error in CSV file, Total Debit (%s) is "
                 "different from Total Credit (%s) !"
             ) % (self._sum_debit, self._sum_credit) + '\n'
-        return vals
+
+    def _compile_row_processor(self):
+        """
+        Compile the processed header into a tuple of
+        (column index, header field, handler) in order to avoid
+        the evaluation of the header field definitions for every line.
+        """
+        processor = []
+        skip_fields = set(self._skip_fields)
+        for i, hf in enumerate(self._header_fields):
+            if hf in skip_fields:
+                continue
+            field_method = self._field_methods[hf]
+            if field_method.get('orm_field'):
+                handler = partial(
+                    field_method['method'],
+                    orm_field=field_method['orm_field'])
+            else:
+                handler = field_method['method']
+            processor.append((i, hf, handler))
+        self._row_processor = tuple(processor)
+        all_fields = self._field_methods
+        self._required_fields = tuple(
+            [x for x in all_fields if all_fields[x].get('required')])
+
+    def _iter_move_line_vals(self, move, reader):
+        """ generator of the move line values dicts of the input lines """
+        self._compile_row_processor()
+        header_fields = self._header_fields
+        column_cnt = len(header_fields)
+        processor = self._row_processor
+        codepage = self.codepage
+        xlsx = self._xlsx
+
+        for row in reader:
+
+            if not row:
+                continue
+            if len(row) < column_cnt:
+                row += [''] * (column_cnt - len(row))
+            aml_vals = {}
+
+            # step 1: handle codepage
+            try:
+                if xlsx:
+                    values = row[:column_cnt]
+                else:
+                    values = [
+                        x.decode(codepage).strip() for x in row[:column_cnt]]
+                line = dict(zip(header_fields, values))
+            except:
+                tb = ''.join(format_exception(*exc_info()))
+                raise UserError(
+                    _("Wrong Code Page"),
+                    _("Error while processing line '%s' :\n%s")
+                    % (row, tb))
+
+            # step 2: process input fields
+            if column_cnt and line[header_fields[0]][:1] == '#':
+                # lines starting with # are considered as comment lines
+                continue
+            for i, hf, handler in processor:
+                if line[hf] == '':
+                    continue
+                handler(hf, line, move, aml_vals)
+
+            if aml_vals:
+                self._process_line_vals(line, move, aml_vals)
+                yield aml_vals
+
+    def _iter_move_line_vals_prefetched(self, move, reader):
+        """
+        Read the input rows in blocks of PREFETCH_BLOCK_SIZE rows.
+        The lookup values of every block are resolved with a single
+        query per column before the rows of the block are processed,
+        hence the input file is only read once.
+        """
+        self._init_prefetch()
+        while True:
+            rows = list(islice(reader, PREFETCH_BLOCK_SIZE))
+            if not rows:
+                break
+            self._prefetch(move, rows)
+            for aml_vals in self._iter_move_line_vals(move, rows):
+                yield aml_vals
+
+    def _write_chunk(self, move, move_lines):
+        """
+        Create the move lines of a chunk without checking the balance
+        of the Journal Entry.
+        Nothing is written as soon as errors have been detected since
+        the import will be rolled back.
+        """
+        if not move_lines or self._err_log:
+            return
+        vals = [(0, 0, l) for l in move_lines]
+        vals = self._process_chunk_vals(move, vals)
+        # the move write() checks the balance of the Journal Entry
+        # hence the lines are created via the account.move.line model
+        aml_mod = self.env['account.move.line'].with_context(
+            check_move_validity=False)
+        with self.env.norecompute():
+            for x in vals:
+                aml_mod.create(dict(x[2], move_id=move.id))
+        aml_mod.recompute()
+        # release the records of this chunk from the cache
+        self.env.invalidate_all()
+
+    def _aml_import_chunked(self, move, aml_vals_iter):
+        """
+        Write the move lines in chunks of 'chunk_size' lines
+        and check the balance after the last chunk.
+        The complete import is rolled back in case of errors.
+        """
+        chunk_size = self.chunk_size
+        try:
+            with self._cr.savepoint():
+                move_lines = []
+                for aml_vals in aml_vals_iter:
+                    move_lines.append(aml_vals)
+                    if len(move_lines) == chunk_size:
+                        self._write_chunk(move, move_lines)
+                        move_lines = []
+                self._write_chunk(move, move_lines)
+                self._check_balance(move)
+                if self._err_log:
+                    raise UserError(self._err_log)
+                move.assert_balanced()
+        except UserError:
+            if not self._err_log:
+                raise
+            self.env.invalidate_all()
 
     @api.multi
     def aml_import(self):
@@ -502,54 +862,17 @@ class AccountMoveLineImport(models.TransientModel):
         self._accounts_dict = {a.code: a.id for a in accounts}
         self._sum_debit = self._sum_credit = 0.0
         self._get_orm_fields()
-        lines, header = self._remove_leading_lines(self.lines)
-        header_fields = csv.reader(
-            StringIO.StringIO(header), dialect=self.dialect).next()
+        header_fields, reader = self._read_input()
         self._header_fields = self._process_header(header_fields)
-        reader = csv.DictReader(
-            StringIO.StringIO(lines), fieldnames=self._header_fields,
-            dialect=self.dialect)
-
-        move_lines = []
-        for line in reader:
+        aml_vals_iter = self._iter_move_line_vals_prefetched(move, reader)
 
-            aml_vals = {}
-
-            # step 1: handle codepage
-            for i, hf in enumerate(self._header_fields):
-                try:
-                    line[hf] = line[hf].decode(self.codepage).strip()
-                except:
-                    tb = ''.join(format_exception(*exc_info()))
-                    raise UserError(
-                        _("Wrong Code Page"),
-                        _("Error while processing line '%s' :\n%s")
-                        % (line, tb))
-
-            # step 2: process input fields
-            for i, hf in enumerate(self._header_fields):
-                if i == 0 and line[hf] and line[hf][0] == '#':
-                    # lines starting with # are considered as comment lines
-                    break
-                if hf in self._skip_fields:
-                    continue
-                if line[hf] == '':
-                    continue
-
-                if self._field_methods[hf].get('orm_field'):
-                    self._field_methods[hf]['method'](
-                        hf, line, move, aml_vals,
-                        orm_field=self._field_methods[hf]['orm_field'])
-                else:
-                    self._field_methods[hf]['method'](
-                        hf, line, move, aml_vals)
-
-            if aml_vals:
-                self._process_line_vals(line, move, aml_vals)
-                move_lines.append(aml_vals)
-
-        vals = [(0, 0, l) for l in move_lines]
-        vals = self._process_vals(move, vals)
+        if self.chunk_size > 0:
+            self._aml_import_chunked(move, aml_vals_iter)
+        else:
+            move_lines = list(aml_vals_iter)
+            vals = [(0, 0, l) for l in move_lines]
+            vals = self._process_vals(move, vals)
+            self._check_balance(move)
 
         if self._err_log:
             self.note = self._err_log
@@ -567,8 +890,9 @@ class AccountMoveLineImport(models.TransientModel):
                 'type': 'ir.actions.act_window',
             }
         else:
-            ctx = dict(self._context, check_move_validity=True)
-            move.with_context(ctx).write({'line_ids': vals})
+            if self.chunk_size <= 0:
+                ctx = dict(self._context, check_move_validity=True)
+                move.with_context(ctx).write({'line_ids': vals})
             import_time = time.time() - time_start
             _logger.warn(
                 'account.move %s import time = %.3f seconds',
@@ -577,6 +901,8 @@ class AccountMoveLineImport(models.TransientModel):
 
 
 def str2float(amount, decimal_separator):
+    if isinstance(amount, NumericCell):
+        return float(amount.value)
     if not amount:
         return 0.0
     try:
@@ -589,6 +915,10 @@ def str2float(amount, decimal_separator):
 
 
 def str2int(amount, decimal_separator):
+    if isinstance(amount, NumericCell):
+        if float(amount.value).is_integer():
+            return int(amount.value)
+        return False
     if not amount:
         return 0
     try:
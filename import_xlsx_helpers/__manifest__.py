@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+{
+    'name': 'Import xlsx helpers',
+    'version': '10.0.1.0.0',
+    'license': 'AGPL-3',
+    'author': 'Noviat',
+    'website': 'http://www.noviat.com',
+    'category': 'Hidden',
+    'summary': 'Helpers for the import of Excel (.xlsx) files',
+    'depends': ['base'],
+    'installable': True,
+}
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+import base64
+from datetime import date, datetime
+
+from odoo import _
+from odoo.exceptions import UserError
+
+import logging
+_logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    _logger.debug("Cannot import 'openpyxl', xlsx input is not available")
+    openpyxl = None
+
+
+class NumericCell(unicode):
+    """
+    Numeric spreadsheet cell.
+    The text value is used for lookups, the numeric value
+    is returned by the str2float and str2int functions
+    of the import wizards.
+    """
+
+    def __new__(cls, value):
+        if isinstance(value, float) and value.is_integer():
+            text = u'%d' % value
+        else:
+            text = unicode(value)
+        res = super(NumericCell, cls).__new__(cls, text)
+        res.value = value
+        return res
+
+
+def xlsx2unicode(value):
+    if value is None:
+        return u''
+    elif isinstance(value, bool):
+        return unicode(value)
+    elif isinstance(value, (int, long, float)):
+        return NumericCell(value)
+    elif isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return unicode(value.strftime('%Y-%m-%d'))
+        return unicode(value.strftime('%Y-%m-%d %H:%M:%S'))
+    elif isinstance(value, date):
+        return unicode(value.strftime('%Y-%m-%d'))
+    return unicode(value).strip()
+
+
+def is_xlsx(data):
+    """
+    Check if a base64 encoded upload is an xlsx file.
+    xlsx files are zip archives.
+    """
+    return base64.b64decode((data or '')[:8])[:4] == 'PK\x03\x04'
+
+
+def iter_xlsx_rows(data):
+    """
+    Generator of the rows of the first worksheet of a base64 encoded
+    xlsx upload.
+    The workbook is read in read-only mode and numeric cells
+    are returned as NumericCell.
+    """
+    if not openpyxl:
+        raise UserError(_(
+            "The 'openpyxl' python library is required "
+            "for the import of xlsx files."))
+    wb = openpyxl.load_workbook(
+        StringIO.StringIO(base64.b64decode(data)),
+        read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        for row in ws.iter_rows():
+            yield [xlsx2unicode(c.value) for c in row]
+    finally:
+        # a read-only workbook keeps the zip archive open
+        wb.close()
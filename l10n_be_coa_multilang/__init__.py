@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
+import logging
+
 from . import models
 from . import report
 from . import wizards
 
+_logger = logging.getLogger(__name__)
+
+
+def pre_init_hook(cr):
+    refine_tax_template_constraint(cr)
+    init_aml_inv_type(cr)
+
 
 def refine_tax_template_constraint(cr):
     """
@@ -18,3 +27,37 @@ def refine_tax_template_constraint(cr):
         "ALTER TABLE account_tax_template "
         "ADD CONSTRAINT account_tax_template_name_company_uniq "
         "UNIQUE (name, company_id, type_tax_use, chart_template_id)")
+
+
+def init_aml_inv_type(cr, chunk_size=100000):
+    """
+    Create and populate the account_move_line inv_type column
+    with SQL updates in chunks of move line ids in order to
+    avoid the recomputation of the stored related field
+    by the ORM on large databases.
+    """
+    cr.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = 'account_move_line' "
+        "AND column_name = 'inv_type'")
+    if cr.fetchone():
+        return
+    cr.execute(
+        "ALTER TABLE account_move_line ADD COLUMN inv_type varchar")
+    cr.execute(
+        "SELECT MIN(id), MAX(id) FROM account_move_line "
+        "WHERE invoice_id IS NOT NULL")
+    min_id, max_id = cr.fetchone()
+    if min_id:
+        for start in xrange(min_id, max_id + 1, chunk_size):
+            cr.execute(
+                "UPDATE account_move_line aml SET inv_type = inv.type "
+                "FROM account_invoice inv "
+                "WHERE inv.id = aml.invoice_id "
+                "AND aml.id >= %s AND aml.id < %s",
+                (start, start + chunk_size))
+            _logger.info(
+                "account_move_line inv_type: %s lines updated", cr.rowcount)
+    cr.execute(
+        "CREATE INDEX account_move_line_inv_type_index "
+        "ON account_move_line (inv_type)")
@@ -4,7 +4,7 @@
 
 {
     'name': 'Belgium - Multilingual Chart of Accounts (en/nl/fr)',
-    'version': '10.0.1.2.1',
+    'version': '10.0.1.3.0',
     'license': 'AGPL-3',
     'author': "Noviat",
     'website': 'http://www.noviat.com',
@@ -21,6 +21,7 @@
         'account_fiscal_year',
         'account_move_line_tax_editable',
         'report_xlsx_helper',
+        'report_xlsx_helpers',
     ],
     'data': [
         'security/ir.model.access.csv',
@@ -52,8 +53,9 @@
         'wizards/l10n_be_vat_declaration.xml',
         'wizards/l10n_be_vat_intracom.xml',
         'wizards/l10n_be_vat_listing.xml',
+        'views/l10n_be_vat_summary.xml',
         'data/account_chart_template_data.yml',
     ],
     'installable': True,
-    'pre_init_hook': 'refine_tax_template_constraint',
+    'pre_init_hook': 'pre_init_hook',
 }
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.addons.l10n_be_coa_multilang import init_aml_inv_type
+
+
+def migrate(cr, version):
+    """
+    Populate the new account_move_line inv_type column via SQL.
+    """
+    init_aml_inv_type(cr)
@@ -3,7 +3,10 @@ from . import account_account
 from . import account_chart_template
 from . import account_config_settings
 from . import account_financial_report
+from . import account_move
+from . import account_move_line
 from . import account_tax_code_chart
 from . import be_legal_financial_reportscheme
+from . import l10n_be_vat_summary
 from . import res_config
 from . import res_partner
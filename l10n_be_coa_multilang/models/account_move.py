@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    @api.model
+    def create(self, vals):
+        """
+        Invalidate the monthly VAT totals once for all journal items
+        instead of per journal item.
+        """
+        move = super(AccountMove, self.with_context(
+            defer_vat_summary=True)).create(vals)
+        self.env['l10n.be.vat.summary']._invalidate(
+            move._get_vat_summary_months())
+        return self.browse(move.id)
+
+    @api.multi
+    def write(self, vals):
+        """
+        The date and company of the journal items are related fields
+        which are updated without account.move.line write.
+        The journal items changed via line_ids are invalidated
+        once for all moves instead of per journal item.
+        """
+        if not ('date' in vals or 'journal_id' in vals
+                or 'line_ids' in vals):
+            return super(AccountMove, self).write(vals)
+        company_months = self._get_vat_summary_months()
+        res = super(AccountMove, self.with_context(
+            defer_vat_summary=True)).write(vals)
+        company_months |= self._get_vat_summary_months()
+        self.env['l10n.be.vat.summary']._invalidate(company_months)
+        return res
+
+    @api.multi
+    def _get_vat_summary_months(self):
+        """
+        Return the set of (company_id, month) pairs of the journal items
+        with taxes.
+        """
+        if not self.ids:
+            return set()
+        self._cr.execute(
+            "SELECT DISTINCT company_id, "
+            "date_trunc('month', date)::date::varchar "
+            "FROM account_move_line aml WHERE move_id IN %s AND "
+            + self.env['account.move.line']._vat_summary_tax_where(),
+            (tuple(self.ids),))
+        return set(self._cr.fetchall())
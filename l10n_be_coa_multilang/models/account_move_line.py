@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+from .l10n_be_vat_summary import SUMMARY_AML_FIELDS
+
+
+class AccountMoveLine(models.Model):
+    """
+    The invoice type is stored on the journal items in order to
+    avoid a join with the invoices in the VAT declaration queries.
+    The column is created and populated by SQL at installation/upgrade,
+    cf. init_aml_inv_type.
+
+    The monthly VAT totals of the journal items with taxes are
+    invalidated per create/write/unlink call, except within the
+    account.move create and write (context key 'defer_vat_summary')
+    which invalidate the months of all lines of the moves at once.
+    """
+    _inherit = 'account.move.line'
+
+    inv_type = fields.Selection(
+        related='invoice_id.type', string='Invoice Type',
+        store=True, index=True, readonly=True)
+
+    @api.model
+    def create(self, vals):
+        aml = super(AccountMoveLine, self).create(vals)
+        if not self._context.get('defer_vat_summary'):
+            aml._invalidate_vat_summary()
+        return aml
+
+    @api.multi
+    def write(self, vals):
+        if self._context.get('defer_vat_summary') \
+                or not set(vals) & set(SUMMARY_AML_FIELDS):
+            return super(AccountMoveLine, self).write(vals)
+        company_months = self._get_vat_summary_months()
+        res = super(AccountMoveLine, self).write(vals)
+        company_months |= self._get_vat_summary_months()
+        self.env['l10n.be.vat.summary']._invalidate(company_months)
+        return res
+
+    @api.multi
+    def unlink(self):
+        if not self._context.get('defer_vat_summary'):
+            self._invalidate_vat_summary()
+        return super(AccountMoveLine, self).unlink()
+
+    @api.multi
+    def _get_vat_summary_months(self):
+        """
+        Return the set of (company_id, month) pairs of the journal items
+        with taxes.
+        """
+        if not self.ids:
+            return set()
+        self._cr.execute(
+            "SELECT DISTINCT company_id, "
+            "date_trunc('month', date)::date::varchar "
+            "FROM account_move_line aml WHERE id IN %s AND "
+            + self._vat_summary_tax_where(),
+            (tuple(self.ids),))
+        return set(self._cr.fetchall())
+
+    @api.model
+    def _vat_summary_tax_where(self):
+        """
+        SQL condition on the journal items 'aml' with taxes,
+        cf. l10n.be.vat.summary, _compute_month.
+        """
+        rel = self._fields['tax_ids']
+        return (
+            "(aml.tax_line_id IS NOT NULL "
+            "OR EXISTS (SELECT 1 FROM {rel} r "
+            "WHERE r.{col1} = aml.id))".format(
+                rel=rel.relation, col1=rel.column1))
+
+    @api.multi
+    def _invalidate_vat_summary(self):
+        self.env['l10n.be.vat.summary']._invalidate(
+            self._get_vat_summary_months())
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import calendar
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# account.move.line fields used by the summary
+SUMMARY_AML_FIELDS = [
+    'company_id', 'date', 'partner_id', 'tax_line_id', 'tax_ids',
+    'invoice_id', 'journal_id', 'move_id', 'debit', 'credit']
+
+
+class L10nBeVatSummary(models.Model):
+    """
+    Monthly totals of the journal items with taxes, used by the
+    Belgian VAT declarations.
+
+    The totals are grouped by the move line attributes used in the
+    tax case selections: partner, tax of the tax line, taxes of the
+    base line, invoice type and sale journal.
+
+    The months are computed on first use. Every transaction which
+    creates, changes or removes journal items with taxes inserts an
+    l10n.be.vat.summary.change row for their months. A month is
+    recomputed when its change rows are visible, the computation
+    removes those rows.
+
+    The change rows are only inserted, hence the postings of a month
+    do not wait for each other. The change rows of an uncommitted
+    transaction are invisible to the computation, which therefore
+    cannot flag that transaction's journal items as included.
+    Concurrent computations of the same month are serialised via the
+    l10n.be.vat.summary.month row.
+    """
+    _name = 'l10n.be.vat.summary'
+    _description = 'Belgian VAT monthly totals'
+    _order = 'month, company_id'
+
+    company_id = fields.Many2one(
+        comodel_name='res.company', string='Company',
+        readonly=True, index=True)
+    month = fields.Date(
+        string='Month', readonly=True, index=True,
+        help="First day of the month")
+    partner_id = fields.Many2one(
+        comodel_name='res.partner', string='Partner', readonly=True)
+    tax_line_id = fields.Many2one(
+        comodel_name='account.tax', string='Originator tax', readonly=True)
+    tax_ids = fields.Char(
+        string='Taxes', readonly=True,
+        help="Comma separated ids of the taxes of the journal items.")
+    inv_type = fields.Char(string='Invoice Type', readonly=True)
+    sale_journal = fields.Boolean(readonly=True)
+    debit = fields.Float(readonly=True)
+    credit = fields.Float(readonly=True)
+
+    @api.model
+    def _is_month_range(self, date_from, date_to):
+        if not (date_from and date_to) or date_from[8:10] != '01':
+            return False
+        year, month = int(date_to[:4]), int(date_to[5:7])
+        return int(date_to[8:10]) == calendar.monthrange(year, month)[1]
+
+    @api.model
+    def _get_months(self, date_from, date_to):
+        months = []
+        year, month = int(date_from[:4]), int(date_from[5:7])
+        while '%04d-%02d-01' % (year, month) <= date_to:
+            months.append('%04d-%02d-01' % (year, month))
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+        return months
+
+    @api.model
+    def _update(self, company_id, date_from, date_to):
+        """
+        Compute the months of the period which are not available.
+        """
+        months = self._get_months(date_from, date_to)
+        self._cr.execute(
+            "SELECT m.month FROM l10n_be_vat_summary_month m "
+            "WHERE m.company_id = %s AND m.month IN %s "
+            "AND NOT EXISTS (SELECT 1 FROM l10n_be_vat_summary_change c "
+            "  WHERE c.company_id = m.company_id AND c.month = m.month)",
+            (company_id, tuple(months)))
+        done = [x[0] for x in self._cr.fetchall()]
+        for month in months:
+            if month not in done:
+                self._compute_month(company_id, month)
+
+    @api.model
+    def _compute_month(self, company_id, month):
+        self._cr.execute(
+            "INSERT INTO l10n_be_vat_summary_month "
+            "(create_uid, create_date, write_uid, write_date, "
+            "company_id, month) "
+            "VALUES (%s, now() at time zone 'UTC', "
+            "%s, now() at time zone 'UTC', %s, %s) "
+            "ON CONFLICT (company_id, month) DO UPDATE "
+            "SET write_uid = EXCLUDED.write_uid, "
+            "write_date = EXCLUDED.write_date",
+            (self._uid, self._uid, company_id, month))
+        self._cr.execute(
+            "DELETE FROM l10n_be_vat_summary_change "
+            "WHERE company_id = %s AND month = %s",
+            (company_id, month))
+        rel = self.env['account.move.line']._fields['tax_ids']
+        self._cr.execute(
+            "DELETE FROM l10n_be_vat_summary "
+            "WHERE company_id = %s AND month = %s",
+            (company_id, month))
+        self._cr.execute(
+            "INSERT INTO l10n_be_vat_summary "
+            "(create_uid, create_date, write_uid, write_date, "
+            "company_id, month, partner_id, tax_line_id, tax_ids, "
+            "inv_type, sale_journal, debit, credit) "
+            "SELECT %s, now() at time zone 'UTC', "
+            "%s, now() at time zone 'UTC', "
+            "%s, %s, partner_id, tax_line_id, tax_ids, "
+            "inv_type, sale_journal, SUM(debit), SUM(credit) "
+            "FROM ("
+            "  SELECT aml.partner_id, aml.tax_line_id, "
+            "  aml.debit, aml.credit, aml.inv_type, "
+            "  array_to_string(ARRAY(SELECT r.{col2} FROM {rel} r "
+            "    WHERE r.{col1} = aml.id ORDER BY r.{col2}), ',') "
+            "    AS tax_ids, "
+            "  aj.type = 'sale' AS sale_journal "
+            "  FROM account_move_line aml "
+            "  JOIN account_journal aj ON aj.id = aml.journal_id "
+            "  WHERE aml.company_id = %s "
+            "  AND aml.date >= %s "
+            "  AND aml.date < (%s::date + interval '1 month') "
+            "  AND (aml.tax_line_id IS NOT NULL "
+            "       OR EXISTS (SELECT 1 FROM {rel} r "
+            "                  WHERE r.{col1} = aml.id))"
+            ") AS aml "
+            "GROUP BY partner_id, tax_line_id, tax_ids, "
+            "inv_type, sale_journal".format(
+                rel=rel.relation, col1=rel.column1, col2=rel.column2),
+            (self._uid, self._uid, company_id, month,
+             company_id, month, month))
+
+    @api.model
+    def _invalidate(self, company_months):
+        """
+        Insert a change row for the (company_id, month) pairs.
+        """
+        company_months = sorted(set(company_months))
+        if not company_months:
+            return
+        self._cr.execute(
+            "INSERT INTO l10n_be_vat_summary_change "
+            "(create_uid, create_date, write_uid, write_date, "
+            "company_id, month) VALUES %s" % ', '.join(
+                [self._cr.mogrify(
+                    "(%s, now() at time zone 'UTC', "
+                    "%s, now() at time zone 'UTC', %s, %s)",
+                    (self._uid, self._uid, company_id, month))
+                 for company_id, month in company_months]))
+
+    @api.model
+    def rebuild(self):
+        """
+        Recompute the totals of all months with journal items.
+        """
+        self._cr.execute("DELETE FROM l10n_be_vat_summary_month")
+        self._cr.execute("DELETE FROM l10n_be_vat_summary_change")
+        self._cr.execute("DELETE FROM l10n_be_vat_summary")
+        self._cr.execute(
+            "SELECT DISTINCT company_id, "
+            "date_trunc('month', date)::date::varchar "
+            "FROM account_move_line")
+        company_months = self._cr.fetchall()
+        for company_id, month in company_months:
+            self._compute_month(company_id, month)
+        _logger.info(
+            "%s rebuild: %s months computed",
+            self._name, len(company_months))
+        return True
+
+    @api.model
+    def _read_totals(self, company_id, date_from, date_to, groupby):
+        """
+        Return the debit/credit totals of the period grouped by the
+        fields in groupby.
+        The tax_ids entries are returned as a set of tax ids.
+        """
+        self._update(company_id, date_from, date_to)
+        months = self._get_months(date_from, date_to)
+        self._cr.execute(
+            "SELECT {groupby}, SUM(debit), SUM(credit) "
+            "FROM l10n_be_vat_summary "
+            "WHERE company_id = %s AND month IN %s "
+            "GROUP BY {groupby}".format(groupby=', '.join(groupby)),
+            (company_id, tuple(months)))
+        res = []
+        for row in self._cr.fetchall():
+            vals = dict(zip(groupby, row[:-2]))
+            vals.update(debit=row[-2], credit=row[-1])
+            if 'tax_ids' in vals:
+                vals['tax_ids'] = set(
+                    int(x) for x in (vals['tax_ids'] or '').split(',') if x)
+            res.append(vals)
+        return res
+
+
+class L10nBeVatSummaryMonth(models.Model):
+    _name = 'l10n.be.vat.summary.month'
+    _description = 'Belgian VAT monthly totals - computed months'
+    _order = 'month, company_id'
+
+    company_id = fields.Many2one(
+        comodel_name='res.company', string='Company', readonly=True)
+    month = fields.Date(string='Month', readonly=True)
+
+    _sql_constraints = [
+        ('month_uniq', 'unique(company_id, month)',
+         'The month must be unique per company !'),
+    ]
+
+
+class L10nBeVatSummaryChange(models.Model):
+    _name = 'l10n.be.vat.summary.change'
+    _description = 'Belgian VAT monthly totals - changed months'
+
+    company_id = fields.Many2one(
+        comodel_name='res.company', string='Company', readonly=True)
+    month = fields.Date(string='Month', readonly=True)
+
+    @api.model_cr
+    def init(self):
+        self._cr.execute(
+            "SELECT indexname FROM pg_indexes WHERE indexname = %s",
+            ('l10n_be_vat_summary_change_month_index',))
+        if not self._cr.fetchone():
+            self._cr.execute(
+                "CREATE INDEX l10n_be_vat_summary_change_month_index "
+                "ON l10n_be_vat_summary_change (company_id, month)")
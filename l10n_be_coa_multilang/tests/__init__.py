@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+from . import test_l10n_be_vat_declaration
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests.common import TransactionCase
+
+DATE = '2017-03-15'
+
+
+class TestL10nBeVatDeclaration(TransactionCase):
+
+    def setUp(self):
+        super(TestL10nBeVatDeclaration, self).setUp()
+        self.company = self.env.user.company_id
+        self.partner = self.env['res.partner'].create({
+            'name': 'Test VAT Declaration Partner'})
+        self.sale_journal = self.env['account.journal'].search(
+            [('company_id', '=', self.company.id),
+             ('type', '=', 'sale')], limit=1)
+        self.misc_journal = self.env['account.journal'].search(
+            [('company_id', '=', self.company.id),
+             ('type', '=', 'general')], limit=1)
+        self.receivable = self._get_account('receivable')
+        self.revenue = self._get_account('revenue')
+        self.expense = self._get_account('expenses')
+
+        module = 'l10n_be_coa_multilang'
+        Tax = self.env['account.tax']
+        self.tax_sale = Tax.create({
+            'name': 'Test VAT 21% sale',
+            'type_tax_use': 'sale',
+            'amount': 21.0,
+            'tag_ids': [(6, 0, [
+                self.env.ref('%s.tax_tag_%s' % (module, x)).id
+                for x in ['03', '49', '54', '64']])],
+        })
+        self.tax_purchase = Tax.create({
+            'name': 'Test VAT 21% purchase',
+            'type_tax_use': 'purchase',
+            'amount': 21.0,
+            'tag_ids': [(6, 0, [
+                self.env.ref('%s.tax_tag_%s' % (module, x)).id
+                for x in ['82D', '59']])],
+        })
+        self.tax_v59 = Tax.search(
+            [('company_id', '=', self.company.id),
+             ('code', '=', 'VAT-V59')], limit=1)
+        if not self.tax_v59:
+            self.tax_v59 = Tax.create({
+                'name': 'Test VAT-V59',
+                'code': 'VAT-V59',
+                'type_tax_use': 'purchase',
+                'amount': 0.0,
+            })
+
+        self.declaration = self.env['l10n.be.vat.declaration'].create({
+            'company_id': self.company.id,
+            'declarant_id': self.env.user.partner_id.id,
+            'date_from': '2017-03-01',
+            'date_to': '2017-03-31',
+        })
+        self.case_root = self.env['account.tax.code.chart'].search(
+            [('country_id', '=', self.env.ref('base.be').id),
+             ('parent_id', '=', False)])
+
+    def _get_account(self, user_type):
+        user_type = self.env.ref('account.data_account_type_%s' % user_type)
+        return self.env['account.account'].search(
+            [('company_id', '=', self.company.id),
+             ('user_type_id', '=', user_type.id)], limit=1)
+
+    def _create_move(self, journal, lines):
+        line_ids = []
+        for account, debit, credit, taxes, tax_line in lines:
+            line_ids.append((0, 0, {
+                'name': 'Test VAT Declaration',
+                'partner_id': self.partner.id,
+                'account_id': account.id,
+                'debit': debit,
+                'credit': credit,
+                'tax_ids': [(6, 0, taxes.ids)],
+                'tax_line_id': tax_line.id,
+            }))
+        move = self.env['account.move'].create({
+            'journal_id': journal.id,
+            'date': DATE,
+            'line_ids': line_ids,
+        })
+        move.post()
+        return move
+
+    def _create_entries(self):
+        no_tax = self.env['account.tax']
+        # POS order, no invoice in a sale journal
+        self._create_move(self.sale_journal, [
+            (self.receivable, 121.0, 0.0, no_tax, no_tax),
+            (self.revenue, 0.0, 100.0, self.tax_sale, no_tax),
+            (self.revenue, 0.0, 21.0, no_tax, self.tax_sale),
+        ])
+        # POS refund, no invoice in a sale journal
+        self._create_move(self.sale_journal, [
+            (self.receivable, 0.0, 48.4, no_tax, no_tax),
+            (self.revenue, 40.0, 0.0, self.tax_sale, no_tax),
+            (self.revenue, 8.4, 0.0, no_tax, self.tax_sale),
+        ])
+        # credit note without invoice in a miscellaneous journal
+        self._create_move(self.misc_journal, [
+            (self.receivable, 0.0, 12.1, no_tax, no_tax),
+            (self.revenue, 10.0, 0.0, self.tax_sale, no_tax),
+            (self.revenue, 2.1, 0.0, no_tax, self.tax_sale),
+        ])
+        # purchase with deductible VAT and invoice with only deductible VAT
+        self._create_move(self.misc_journal, [
+            (self.receivable, 0.0, 121.0, no_tax, no_tax),
+            (self.expense, 100.0, 0.0, self.tax_purchase, no_tax),
+            (self.expense, 21.0, 0.0, no_tax, self.tax_purchase),
+        ])
+        self._create_move(self.misc_journal, [
+            (self.receivable, 0.0, 7.0, no_tax, no_tax),
+            (self.expense, 7.0, 0.0, self.tax_v59, no_tax),
+        ])
+        # customer credit note
+        refund = self.env['account.invoice'].create({
+            'partner_id': self.partner.id,
+            'type': 'out_refund',
+            'journal_id': self.sale_journal.id,
+            'account_id': self.receivable.id,
+            'date_invoice': DATE,
+            'invoice_line_ids': [(0, 0, {
+                'name': 'Test VAT Declaration',
+                'account_id': self.revenue.id,
+                'quantity': 1.0,
+                'price_unit': 30.0,
+                'invoice_line_tax_ids': [(6, 0, self.tax_sale.ids)],
+            })],
+        })
+        refund.action_invoice_open()
+
+    def _get_read_group_amounts(self):
+        """
+        The case amounts computed with a read_group per case.
+        """
+        declaration = self.declaration
+        cases = self.case_root.search(
+            [('parent_id', 'child_of', self.case_root.id),
+             ('child_ids', '=', False)])
+        amounts = {}
+        for case in cases:
+            aml_dom = declaration._get_move_line_date_domain() \
+                + declaration._get_case_domain(case)
+            amt = self.env['account.move.line'].read_group(
+                aml_dom, ['debit', 'credit'], [])[0]
+            debit_factor, credit_factor = \
+                declaration._get_case_factors(case)
+            amounts[case.code] = declaration.currency_id.round(
+                debit_factor * (amt['debit'] or 0.0) -
+                credit_factor * (amt['credit'] or 0.0))
+        return amounts
+
+    def _check_case_amounts(self):
+        amounts = self.declaration._get_case_amounts(self.case_root)
+        cases = self.env['account.tax.code.chart'].browse(amounts.keys())
+        case_amounts = {
+            x.code: amounts[x.id] for x in cases if not x.child_ids}
+        expected = self._get_read_group_amounts()
+        self.assertEqual(case_amounts, expected)
+        return case_amounts
+
+    def _is_month_dirty(self):
+        self._cr.execute(
+            "SELECT COUNT(*) FROM l10n_be_vat_summary_month "
+            "WHERE company_id = %s AND month = %s",
+            (self.company.id, '2017-03-01'))
+        if not self._cr.fetchone()[0]:
+            return True
+        return bool(self._get_month_changes())
+
+    def _get_month_changes(self):
+        self._cr.execute(
+            "SELECT COUNT(*) FROM l10n_be_vat_summary_change "
+            "WHERE company_id = %s AND month = %s",
+            (self.company.id, '2017-03-01'))
+        return self._cr.fetchone()[0]
+
+    def test_case_amounts(self):
+        self._create_entries()
+        self.assertTrue(self.declaration._use_vat_summary())
+        amounts = self._check_case_amounts()
+        self.assertFalse(self._is_month_dirty())
+        self.assertTrue(amounts['03'] and amounts['54'])
+        self.assertTrue(amounts['49'] and amounts['64'])
+        self.assertTrue(amounts['59'])
+        # the POS refund in the sale journal is not a credit note
+        self.assertEqual(amounts['49'], 10.0 + 30.0)
+
+    def test_case_amounts_no_month_range(self):
+        self._create_entries()
+        self.declaration.date_to = '2017-03-30'
+        self.assertFalse(self.declaration._use_vat_summary())
+        self._check_case_amounts()
+
+    def test_summary_after_post_and_unlink(self):
+        self._create_entries()
+        amounts = self._check_case_amounts()
+        no_tax = self.env['account.tax']
+        move = self._create_move(self.sale_journal, [
+            (self.receivable, 242.0, 0.0, no_tax, no_tax),
+            (self.revenue, 0.0, 200.0, self.tax_sale, no_tax),
+            (self.revenue, 0.0, 42.0, no_tax, self.tax_sale),
+        ])
+        self.assertTrue(self._is_month_dirty())
+        amounts_posted = self._check_case_amounts()
+        self.assertFalse(self._is_month_dirty())
+        self.assertEqual(amounts_posted['03'], amounts['03'] + 200.0)
+        self.assertEqual(amounts_posted['54'], amounts['54'] + 42.0)
+
+        self.sale_journal.update_posted = True
+        move.button_cancel()
+        move.unlink()
+        self.assertTrue(self._is_month_dirty())
+        self.assertEqual(self._check_case_amounts(), amounts)
+
+    def test_summary_invalidation(self):
+        """
+        Only the journal items with taxes add a change entry,
+        the computed month itself is not updated by the postings.
+        """
+        self._create_entries()
+        amounts = self._check_case_amounts()
+        self.assertFalse(self._is_month_dirty())
+        no_tax = self.env['account.tax']
+        self._create_move(self.misc_journal, [
+            (self.receivable, 50.0, 0.0, no_tax, no_tax),
+            (self.revenue, 0.0, 50.0, no_tax, no_tax),
+        ])
+        self.assertFalse(self._is_month_dirty())
+        move = self._create_move(self.sale_journal, [
+            (self.receivable, 121.0, 0.0, no_tax, no_tax),
+            (self.revenue, 0.0, 100.0, self.tax_sale, no_tax),
+            (self.revenue, 0.0, 21.0, no_tax, self.tax_sale),
+        ])
+        changes = self._get_month_changes()
+        self.assertTrue(changes)
+        # removing the taxes of a journal item also adds a change entry
+        move.line_ids.filtered('tax_ids').with_context(
+            check_move_validity=False).write({'tax_ids': [(5,)]})
+        self.assertGreater(self._get_month_changes(), changes)
+        amounts_changed = self._check_case_amounts()
+        self.assertEqual(self._get_month_changes(), 0)
+        self.assertEqual(amounts_changed['03'], amounts['03'])
+        self.assertEqual(amounts_changed['54'], amounts['54'] + 21.0)
@@ -68,6 +68,11 @@ class l10nBeVatCommon(models.AbstractModel):
         string='Save File', readonly=True)
     comments = fields.Text(string='Comments')
     note = fields.Text(string='Notes')
+    xls_background = fields.Boolean(
+        string='Export in Background',
+        help="Generate the Excel export via a scheduled action."
+             "\nYou receive a notification with a download link "
+             "when the file is ready.")
 
     @api.model
     def _default_company_id(self):
@@ -142,6 +147,27 @@ class l10nBeVatCommon(models.AbstractModel):
         raise UserError(_(
             "The XLS export function is not available."))
 
+    @api.multi
+    def _xls_action(self, report_name):
+        """
+        Return the action of the Excel export or queue the export
+        when 'xls_background' is set, cf. report.xlsx.queue.
+        """
+        self.ensure_one()
+        ctx = dict(self.env.context, xlsx_export=True)
+        data = {'ids': [self.id]}
+        if self.xls_background:
+            return self.env['report.xlsx.queue'].with_context(
+                ctx).enqueue(report_name, [self.id], data=data,
+                             name=self._description)
+        return {
+            'type': 'ir.actions.report.xml',
+            'report_type': 'xlsx',
+            'report_name': report_name,
+            'context': ctx,
+            'datas': data,
+        }
+
     @api.multi
     def create_xml(self):
         raise UserError(_(
@@ -169,6 +195,44 @@ class l10nBeVatCommon(models.AbstractModel):
             ('date', '<=', self.date_to)]
         return aml_dom
 
+    def _use_vat_summary(self):
+        """
+        The monthly VAT totals can be used for periods of whole months.
+        """
+        return self.env['l10n.be.vat.summary']._is_month_range(
+            self.date_from, self.date_to)
+
+    def _read_vat_summary(self, groupby):
+        return self.env['l10n.be.vat.summary']._read_totals(
+            self.company_id.id, self.date_from, self.date_to, groupby)
+
+    def _get_vat_summary_partner_data(self, tax_filter, partners=None):
+        """
+        Return the partner totals of the monthly VAT totals in the format
+        of the account.move.line read_group grouped by partner_id.
+        tax_filter is a function that selects the totals entries.
+        """
+        partner_ids = partners is not None and set(partners.ids)
+        data = {}
+        for entry in self._read_vat_summary(
+                ['partner_id', 'tax_line_id', 'tax_ids']):
+            if not entry['partner_id'] or not tax_filter(entry):
+                continue
+            if partner_ids and entry['partner_id'] not in partner_ids:
+                continue
+            totals = data.setdefault(
+                entry['partner_id'], {'debit': 0.0, 'credit': 0.0})
+            totals['debit'] += entry['debit']
+            totals['credit'] += entry['credit']
+        if partners is None:
+            partners = self.env['res.partner'].browse(data.keys()).sorted(
+                key=lambda r: r.display_name)
+        return [{
+            'partner_id': (p.id, p.display_name),
+            'debit': data[p.id]['debit'],
+            'credit': data[p.id]['credit'],
+        } for p in partners if p.id in data]
+
     def _get_company_data(self):
         cpart = self.company_id.partner_id
         company_vat = self._get_company_vat()
@@ -9,6 +9,8 @@ from lxml import etree
 from odoo import api, fields, models, _
 from odoo.addons.report_xlsx_helper.report.abstract_report_xlsx \
     import AbstractReportXlsx
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import report_progress
 from odoo.report import report_sxw
 from openerp.tools.translate import translate
 from odoo.exceptions import UserError
@@ -79,14 +81,7 @@ class l10nBeVatDeclaration(models.TransientModel):
     def create_xls(self):
         module = __name__.split('addons.')[1].split('.')[0]
         report_name = '%s.report_l10n_be_vat_declaration_xlsx' % module
-        report = {
-            'type': 'ir.actions.report.xml',
-            'report_type': 'xlsx',
-            'report_name': report_name,
-            'context': dict(self.env.context, xlsx_export=True),
-            'datas': {'ids': [self.id]},
-        }
-        return report
+        return self._xls_action(report_name)
 
     @api.multi
     def create_xml(self):
@@ -227,23 +222,7 @@ class l10nBeVatDeclaration(models.TransientModel):
             raise UserError(_(
                 "Configuration error for tax case %s")
                 % case.code)
-        # TODO:
-        # PR to Odoo for adding inv_type as stored related field in aml
-        # so that we can improve the read_group query peformance
-        inv_type = False
-        if case.code in (self._base_out_invoice_cases() +
-                         self._tax_debt_out_invoice_cases()):
-            inv_type = 'out_invoice'
-        elif case.code in (self._base_out_refund_cases() +
-                           self._tax_deductible_out_refund_cases()):
-            inv_type = 'out_refund'
-        elif case.code in (self._base_in_invoice_cases() +
-                           self._tax_debt_in_invoice_cases() +
-                           self._tax_deductible_in_invoice_cases()):
-            inv_type = 'in_invoice'
-        elif case.code in (self._base_in_refund_cases() +
-                           self._tax_debt_in_refund_cases()):
-            inv_type = 'in_refund'
+        inv_type = self._get_case_inv_type(case)
         if inv_type:
             if inv_type in ['out_refund']:
                 # POS orders may not have an invoice but are
@@ -252,7 +231,7 @@ class l10nBeVatDeclaration(models.TransientModel):
                 # journals.
                 inv_type_args = [
                     '|',
-                    ('invoice_id.type', '=', inv_type),
+                    ('inv_type', '=', inv_type),
                     '&',
                     ('invoice_id', '=', False),
                     ('journal_id.type', '!=', 'sale')
@@ -260,12 +239,138 @@ class l10nBeVatDeclaration(models.TransientModel):
             else:
                 inv_type_args = [
                     '|',
-                    ('invoice_id.type', '=', inv_type),
+                    ('inv_type', '=', inv_type),
                     ('invoice_id', '=', False),
                 ]
             aml_dom = ['&'] + aml_dom + inv_type_args
         return aml_dom
 
+    def _get_case_inv_type(self, case):
+        inv_type = False
+        if case.code in (self._base_out_invoice_cases() +
+                         self._tax_debt_out_invoice_cases()):
+            inv_type = 'out_invoice'
+        elif case.code in (self._base_out_refund_cases() +
+                           self._tax_deductible_out_refund_cases()):
+            inv_type = 'out_refund'
+        elif case.code in (self._base_in_invoice_cases() +
+                           self._tax_debt_in_invoice_cases() +
+                           self._tax_deductible_in_invoice_cases()):
+            inv_type = 'in_invoice'
+        elif case.code in (self._base_in_refund_cases() +
+                           self._tax_debt_in_refund_cases()):
+            inv_type = 'in_refund'
+        return inv_type
+
+    def _get_case_factors(self, case):
+        """
+        Return the (debit_factor, credit_factor) of a leaf case.
+        """
+        if case.code in (self._base_out_invoice_cases() +
+                         self._base_in_refund_cases() +
+                         self._tax_debt_out_invoice_cases() +
+                         self._tax_debt_in_invoice_cases() +
+                         self._tax_debt_in_refund_cases()):
+            debit_factor = credit_factor = -1
+        elif case.code in (self._base_in_invoice_cases() +
+                           self._base_out_refund_cases() +
+                           self._base_in_invoice_refund_cases() +
+                           self._tax_deductible_in_invoice_cases() +
+                           self._tax_deductible_out_refund_cases()):
+            debit_factor = credit_factor = 1
+        elif case.code in self._tax_debt_correction_cases():
+            debit_factor = 1
+            credit_factor = 0
+        elif case.code in self._tax_deductible_correction_cases():
+            debit_factor = 0
+            credit_factor = -1
+        elif case.code in self._tax_advance_cases():
+            debit_factor = credit_factor = 1
+        else:
+            raise UserError(_(
+                "Configuration error for tax case %s")
+                % case.code)
+        return debit_factor, credit_factor
+
+    def _get_case_filter(self, case, case_taxes):
+        """
+        Return the (base_tax_ids, tax_line_ids, inv_type) of a leaf case,
+        the equivalent of _get_case_domain for the move line totals
+        returned by _get_tax_totals.
+        """
+        taxes = case_taxes.get(case.code, set())
+        if case.code in self._invoice_base_cases():
+            base_tax_ids, tax_line_ids = taxes, set()
+        elif case.code in self._invoice_tax_cases():
+            base_tax_ids, tax_line_ids = set(), taxes
+            if case.code == '59':
+                base_tax_ids = set(self.env['account.tax'].search(
+                    [('code', '=', 'VAT-V59')]).ids)
+        elif case.code in self._other_cases():
+            base_tax_ids, tax_line_ids = taxes, taxes
+        else:
+            raise UserError(_(
+                "Configuration error for tax case %s")
+                % case.code)
+        return base_tax_ids, tax_line_ids, self._get_case_inv_type(case)
+
+    def _get_case_taxes(self, cases):
+        """
+        Return the set of tax ids per case code.
+        """
+        codes = cases.mapped('code')
+        case_taxes = {}
+        taxes = self.env['account.tax'].search(
+            [('tag_ids.code', 'in', codes)])
+        for tax in taxes:
+            for tag in tax.tag_ids:
+                if tag.code in codes:
+                    case_taxes.setdefault(tag.code, set()).add(tax.id)
+        return case_taxes
+
+    def _get_tax_totals(self, tax_ids):
+        """
+        Return the debit and credit totals of the move lines of the
+        declaration period with a tax in tax_ids, grouped by
+        (tax_line_id, tax_ids, invoice type, sale journal).
+        All tax cases are computed from the result of this single query.
+        """
+        if not tax_ids:
+            return []
+        if self._use_vat_summary():
+            return [
+                (x['tax_line_id'], x['tax_ids'], x['inv_type'],
+                 x['sale_journal'], x['debit'], x['credit'])
+                for x in self._read_vat_summary(
+                    ['tax_line_id', 'tax_ids', 'inv_type', 'sale_journal'])
+                if x['tax_line_id'] in tax_ids or x['tax_ids'] & tax_ids]
+        tax_ids = tuple(tax_ids)
+        rel = self.env['account.move.line']._fields['tax_ids']
+        self._cr.execute(
+            "SELECT tax_line_id, tax_ids, inv_type, sale_journal, "
+            "SUM(debit), SUM(credit) "
+            "FROM ("
+            "  SELECT aml.tax_line_id, aml.debit, aml.credit, "
+            "  ARRAY(SELECT r.{col2} FROM {rel} r "
+            "        WHERE r.{col1} = aml.id ORDER BY r.{col2}) AS tax_ids, "
+            "  aml.inv_type, "
+            "  aj.type = 'sale' AS sale_journal "
+            "  FROM account_move_line aml "
+            "  JOIN account_journal aj ON aj.id = aml.journal_id "
+            "  WHERE aml.company_id = %s "
+            "  AND aml.date >= %s AND aml.date <= %s "
+            "  AND (aml.tax_line_id IN %s "
+            "       OR EXISTS (SELECT 1 FROM {rel} r "
+            "                  WHERE r.{col1} = aml.id "
+            "                  AND r.{col2} IN %s))"
+            ") AS aml "
+            "GROUP BY tax_line_id, tax_ids, inv_type, sale_journal".format(
+                rel=rel.relation, col1=rel.column1, col2=rel.column2),
+            (self.company_id.id, self.date_from, self.date_to,
+             tax_ids, tax_ids))
+        return [(x[0], set(x[1]), x[2], x[3], x[4], x[5])
+                for x in self._cr.fetchall()]
+
     def _calc_parent_case_amount(self, case, amounts):
         if case.id not in amounts:
             for child in case.child_ids:
@@ -278,39 +383,38 @@ class l10nBeVatDeclaration(models.TransientModel):
         cases = case_root.search(
             [('parent_id', 'child_of', case_root.id),
              ('child_ids', '=', False)])
-        amounts = {}
-        date_dom = self._get_move_line_date_domain()
+        case_taxes = self._get_case_taxes(cases)
+        case_filters = {}
+        all_tax_ids = set()
         for case in cases:
-            aml_dom = date_dom + self._get_case_domain(case)
-            flds = ['partner_id', 'debit', 'credit']
-            groupby = []
-            amt = self.env['account.move.line'].read_group(
-                aml_dom, flds, groupby)[0]
-
-            if case.code in (self._base_out_invoice_cases() +
-                             self._base_in_refund_cases() +
-                             self._tax_debt_out_invoice_cases() +
-                             self._tax_debt_in_invoice_cases() +
-                             self._tax_debt_in_refund_cases()):
-                debit_factor = credit_factor = -1
-            elif case.code in (self._base_in_invoice_cases() +
-                               self._base_out_refund_cases() +
-                               self._base_in_invoice_refund_cases() +
-                               self._tax_deductible_in_invoice_cases() +
-                               self._tax_deductible_out_refund_cases()):
-                debit_factor = credit_factor = 1
-            elif case.code in self._tax_debt_correction_cases():
-                debit_factor = 1
-                credit_factor = 0
-            elif case.code in self._tax_deductible_correction_cases():
-                debit_factor = 0
-                credit_factor = -1
-            elif case.code in self._tax_advance_cases():
-                debit_factor = credit_factor = 1
+            case_filters[case.id] = self._get_case_filter(case, case_taxes)
+            all_tax_ids |= case_filters[case.id][0]
+            all_tax_ids |= case_filters[case.id][1]
+        totals = self._get_tax_totals(all_tax_ids)
 
+        amounts = {}
+        for case in cases:
+            base_tax_ids, tax_line_ids, inv_type = case_filters[case.id]
+            debit = credit = 0.0
+            for tax_line_id, tax_ids, aml_inv_type, sale_journal, \
+                    aml_debit, aml_credit in totals:
+                if not (tax_line_id in tax_line_ids
+                        or tax_ids & base_tax_ids):
+                    continue
+                if inv_type and aml_inv_type != inv_type:
+                    # POS orders may not have an invoice but are
+                    # posted in a sale journal hence we need to filter
+                    # out the credit note cases for 'no invoice' entries
+                    # in sale journals, cf. _get_case_domain
+                    if aml_inv_type or (
+                            inv_type == 'out_refund' and sale_journal):
+                        continue
+                debit += aml_debit
+                credit += aml_credit
+
+            debit_factor, credit_factor = self._get_case_factors(case)
             amounts[case.id] = self.currency_id.round(
-                debit_factor * (amt['debit'] or 0.0) -
-                credit_factor * (amt['credit'] or 0.0))
+                debit_factor * debit - credit_factor * credit)
 
         self._calc_parent_case_amount(case_root, amounts)
 
@@ -474,6 +578,12 @@ class l10nBeVatDeclarationXlsx(AbstractReportXlsx):
             self.env.cr, IR_TRANSLATION_NAME, 'report', lang, src) or src
         return val
 
+    def _write_line(self, ws, row_pos, ws_params, **kwargs):
+        res = super(l10nBeVatDeclarationXlsx, self)._write_line(
+            ws, row_pos, ws_params, **kwargs)
+        report_progress()
+        return res
+
     def _get_ws_params(self, workbook, data, declaration):
 
         col_specs = {
@@ -9,6 +9,8 @@ from lxml import etree
 from odoo import api, fields, models, _
 from odoo.addons.report_xlsx_helper.report.abstract_report_xlsx \
     import AbstractReportXlsx
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import report_progress
 from odoo.report import report_sxw
 from openerp.tools.translate import translate
 from odoo.exceptions import UserError
@@ -54,14 +56,7 @@ class l10nBeVatIntracom(models.TransientModel):
     def create_xls(self):
         module = __name__.split('addons.')[1].split('.')[0]
         report_name = '%s.report_l10n_be_vat_intracom_xlsx' % module
-        report = {
-            'type': 'ir.actions.report.xml',
-            'report_type': 'xlsx',
-            'report_name': report_name,
-            'context': dict(self.env.context, xlsx_export=True),
-            'datas': {'ids': [self.id]},
-        }
-        return report
+        return self._xls_action(report_name)
 
     @api.multi
     def create_xml(self):
@@ -104,21 +99,27 @@ class l10nBeVatIntracom(models.TransientModel):
             self, '%s.report_l10nbevatintracom' % module)
 
     def _get_client_vals(self):
-        flds = ['partner_id', 'debit', 'credit']
-        groupby = ['partner_id']
-
-        aml_dom = self._get_move_line_date_domain()
-        S_dom, L_dom, T_dom = self._get_move_line_tax_domains()
-        S_data = self.env['account.move.line'].read_group(
-            aml_dom + S_dom, flds, groupby)
+        if self._use_vat_summary():
+            S_data, L_data, T_data = [
+                self._get_vat_summary_partner_data(
+                    lambda x, tax_ids=set(taxes.ids): x['tax_ids'] & tax_ids)
+                for taxes in self._get_move_line_taxes()]
+        else:
+            flds = ['partner_id', 'debit', 'credit']
+            groupby = ['partner_id']
+
+            aml_dom = self._get_move_line_date_domain()
+            S_dom, L_dom, T_dom = self._get_move_line_tax_domains()
+            S_data = self.env['account.move.line'].read_group(
+                aml_dom + S_dom, flds, groupby)
+            L_data = self.env['account.move.line'].read_group(
+                aml_dom + L_dom, flds, groupby)
+            T_data = self.env['account.move.line'].read_group(
+                aml_dom + T_dom, flds, groupby)
         for entry in S_data:
             entry['code'] = 'S'
-        L_data = self.env['account.move.line'].read_group(
-            aml_dom + L_dom, flds, groupby)
         for entry in L_data:
             entry['code'] = 'L'
-        T_data = self.env['account.move.line'].read_group(
-            aml_dom + T_dom, flds, groupby)
         for entry in T_data:
             entry['code'] = 'T'
 
@@ -149,24 +150,26 @@ class l10nBeVatIntracom(models.TransientModel):
         ic_vals.sort(key=lambda k: k['vat'])
         return ic_vals
 
-    def _get_move_line_tax_domains(self):
+    def _get_move_line_taxes(self):
 
         code_S = '44'
         taxes_S = self.env['account.tax'].search(
             [('tag_ids.code', '=', code_S)])
-        S_dom = [('tax_ids.id', 'in', taxes_S.ids)]
 
         code_L = '46L'
         taxes_L = self.env['account.tax'].search(
             [('tag_ids.code', '=', code_L)])
-        L_dom = [('tax_ids.id', 'in', taxes_L.ids)]
 
         code_T = '46T'
         taxes_T = self.env['account.tax'].search(
             [('tag_ids.code', '=', code_T)])
-        T_dom = [('tax_ids.id', 'in', taxes_T.ids)]
 
-        return S_dom, L_dom, T_dom
+        return taxes_S, taxes_L, taxes_T
+
+    def _get_move_line_tax_domains(self):
+        return tuple(
+            [('tax_ids.id', 'in', taxes.ids)]
+            for taxes in self._get_move_line_taxes())
 
     def _get_intra_list(self):
         intra_list = {}
@@ -293,6 +296,12 @@ class l10nBeVatIntracomXlsx(AbstractReportXlsx):
             self.env.cr, IR_TRANSLATION_NAME, 'report', lang, src) or src
         return val
 
+    def _write_line(self, ws, row_pos, ws_params, **kwargs):
+        res = super(l10nBeVatIntracomXlsx, self)._write_line(
+            ws, row_pos, ws_params, **kwargs)
+        report_progress()
+        return res
+
     def _get_ws_params(self, workbook, data, listing):
 
         col_specs = {
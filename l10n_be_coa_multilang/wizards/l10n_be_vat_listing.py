@@ -9,6 +9,8 @@ from lxml import etree
 from odoo import api, fields, models, _
 from odoo.addons.report_xlsx_helper.report.abstract_report_xlsx \
     import AbstractReportXlsx
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import report_progress
 from odoo.report import report_sxw
 from openerp.tools.translate import translate
 from odoo.exceptions import UserError
@@ -70,14 +72,7 @@ class l10nBeVatListing(models.TransientModel):
     def create_xls(self):
         module = __name__.split('addons.')[1].split('.')[0]
         report_name = '%s.report_l10n_be_vat_listing_xlsx' % module
-        report = {
-            'type': 'ir.actions.report.xml',
-            'report_type': 'xlsx',
-            'report_name': report_name,
-            'context': dict(self.env.context, xlsx_export=True),
-            'datas': {'ids': [self.id]},
-        }
-        return report
+        return self._xls_action(report_name)
 
     @api.multi
     def create_xml(self):
@@ -121,43 +116,23 @@ class l10nBeVatListing(models.TransientModel):
 
     def _get_client_vals(self):
         partner_dom = self._get_partner_domain()
-        partners = self.env['res.partner'].search(partner_dom)
-        if not partners:
+        if not self.env['res.partner'].search(partner_dom, limit=1):
             raise UserError(_(
                 "No Belgian VAT subjected customers found."))
 
-        flds = ['partner_id', 'debit', 'credit']
-        groupby = ['partner_id']
-
-        aml_dom = self._get_move_line_date_domain()
-        aml_dom += [('partner_id', 'in', partners.ids)]
-        base_dom, vat_dom = self._get_move_line_tax_domains()
-
-        base_data = self.env['account.move.line'].read_group(
-            aml_dom + base_dom, flds, groupby)
-        vat_dom += [('partner_id', 'in', partners.ids)]
-        vat_data = self.env['account.move.line'].read_group(
-            aml_dom + vat_dom, flds, groupby)
-
-        partners = partners.filtered(
-            lambda r: r.id in [x['partner_id'][0] for x in base_data])
-        if not partners:
+        records = {}
+        for partner_id, vat, base_amount, vat_amount \
+                in self._get_client_amounts():
+            records[partner_id] = {
+                'vat': self._normalise_vat(vat),
+                'base_amount': base_amount,
+                'vat_amount': vat_amount,
+            }
+        if not records:
             raise UserError(_(
                 "No VAT subjected transactions found for %s."
                 ) % self.year)
 
-        records = {}
-        for i, entry in enumerate(base_data):
-            vat = self._normalise_vat(partners[i].vat)
-            records[entry['partner_id'][0]] = {
-                'name': entry['partner_id'][1],
-                'vat': vat,
-                'base_amount': entry['credit'] - entry['debit'],
-            }
-        for entry in vat_data:
-            records[entry['partner_id'][0]]['vat_amount'] = \
-                entry['credit'] - entry['debit']
-
         # remove entries < limit amount
         client_list = []
         vat_group = {}
@@ -179,6 +154,77 @@ class l10nBeVatListing(models.TransientModel):
         client_list.sort(key=lambda k: k['vat'])
         return client_list
 
+    def _get_client_amounts(self):
+        """
+        Return the (partner_id, vat, base_amount, vat_amount) of the
+        partners selected by _get_partner_domain with base amounts
+        in the listing period.
+        The amounts are read from the monthly VAT totals, cf.
+        l10n.be.vat.summary, or from the journal items.
+        """
+        taxes_base, taxes_vat = self._get_move_line_taxes()
+        if not taxes_base:
+            return []
+        partner_where = self._get_partner_where()
+        if self._use_vat_summary():
+            summary = self.env['l10n.be.vat.summary']
+            summary._update(self.company_id.id, self.date_from, self.date_to)
+            lines = (
+                "SELECT s.partner_id, rp.vat, s.debit, s.credit, "
+                "string_to_array(s.tax_ids, ',')::int[] "
+                "&& %(base_ids)s::int[] AS is_base, "
+                "s.tax_line_id = ANY(%(vat_ids)s::int[]) AS is_vat "
+                "FROM l10n_be_vat_summary s "
+                "JOIN res_partner rp ON rp.id = s.partner_id "
+                "WHERE s.company_id = %(company_id)s "
+                "AND s.month IN %(months)s "
+                "AND " + partner_where)
+        else:
+            rel = self.env['account.move.line']._fields['tax_ids']
+            lines = (
+                "SELECT aml.partner_id, rp.vat, aml.debit, aml.credit, "
+                "EXISTS (SELECT 1 FROM {rel} r "
+                "        WHERE r.{col1} = aml.id "
+                "        AND r.{col2} = ANY(%(base_ids)s::int[])) AS is_base, "
+                "aml.tax_line_id = ANY(%(vat_ids)s::int[]) AS is_vat "
+                "FROM account_move_line aml "
+                "JOIN res_partner rp ON rp.id = aml.partner_id "
+                "WHERE aml.company_id = %(company_id)s "
+                "AND aml.date >= %(date_from)s AND aml.date <= %(date_to)s "
+                "AND ".format(
+                    rel=rel.relation, col1=rel.column1, col2=rel.column2)
+                + partner_where)
+        self._cr.execute(
+            "SELECT partner_id, vat, "
+            "SUM(CASE WHEN is_base THEN credit - debit ELSE 0.0 END), "
+            "SUM(CASE WHEN is_vat THEN credit - debit ELSE 0.0 END) "
+            "FROM (" + lines + ") AS lines "
+            "WHERE is_base OR is_vat "
+            "GROUP BY partner_id, vat "
+            "HAVING bool_or(is_base)",
+            {'base_ids': taxes_base.ids,
+             'vat_ids': taxes_vat.ids,
+             'company_id': self.company_id.id,
+             'date_from': self.date_from,
+             'date_to': self.date_to,
+             'months': tuple(self.env['l10n.be.vat.summary']._get_months(
+                 self.date_from, self.date_to))})
+        return self._cr.fetchall()
+
+    def _get_partner_where(self):
+        """
+        SQL condition on the res_partner rp table for the partners
+        selected by _get_partner_domain.
+        The condition is escaped for use in a query with parameters.
+        """
+        query = self.env['res.partner'].with_context(
+            active_test=False)._where_calc(self._get_partner_domain())
+        from_clause, where_clause, params = query.get_sql()
+        where = self._cr.mogrify(
+            'rp.id IN (SELECT "res_partner".id FROM %s WHERE %s)'
+            % (from_clause, where_clause or 'TRUE'), params)
+        return where.replace('%', '%%')
+
     def _get_partner_domain(self):
         partner_dom = [
             '|', ('active', '=', True), ('active', '=', False),
@@ -187,19 +233,23 @@ class l10nBeVatListing(models.TransientModel):
         ]
         return partner_dom
 
-    def _get_move_line_tax_domains(self):
+    def _get_move_line_taxes(self):
 
         codes_base = ('00', '01', '02', '03', '45')  # base amount codes
         taxes_base = self.env['account.tax'].search(
             [('tag_ids.code', 'in', codes_base)])
-        base_dom = [('tax_ids.id', 'in', taxes_base.ids)]
 
         codes_vat = ('01', '02', '03')  # tax amount codes
         taxes_vat = taxes_base.filtered(
             lambda r:
             any(c in codes_vat for c in r.tag_ids.mapped('code')))
-        vat_dom = [('tax_line_id.id', 'in', taxes_vat.ids)]
 
+        return taxes_base, taxes_vat
+
+    def _get_move_line_tax_domains(self):
+        taxes_base, taxes_vat = self._get_move_line_taxes()
+        base_dom = [('tax_ids.id', 'in', taxes_base.ids)]
+        vat_dom = [('tax_line_id.id', 'in', taxes_vat.ids)]
         return base_dom, vat_dom
 
     def _get_client_list(self):
@@ -321,6 +371,12 @@ class l10nBeVatListingXlsx(AbstractReportXlsx):
             self.env.cr, IR_TRANSLATION_NAME, 'report', lang, src) or src
         return val
 
+    def _write_line(self, ws, row_pos, ws_params, **kwargs):
+        res = super(l10nBeVatListingXlsx, self)._write_line(
+            ws, row_pos, ws_params, **kwargs)
+        report_progress()
+        return res
+
     def _get_ws_params(self, workbook, data, listing):
 
         col_specs = {
@@ -7,3 +7,6 @@ from . import account_coda_trans_type
 from . import account_coda_trans_code
 from . import account_coda_trans_category
 from . import coda_bank_account
+from . import account_journal
+from . import res_partner_bank
+from . import account_move_line
@@ -11,6 +11,13 @@ class AccountBankStatementLine(models.Model):
     coda_transaction_dict = fields.Char(
         string='CODA transaction details',
         help='JSON dictionary with the results of the CODA parsing')
+    coda_reconcile_fingerprint = fields.Char(
+        string='CODA reconcile fingerprint', copy=False,
+        help="Fingerprint of the data used by the last "
+             "Automatic Reconcile of this line.")
+    coda_reconcile_note = fields.Text(
+        string='CODA reconcile remarks', copy=False,
+        help="Remarks of the last Automatic Reconcile of this line.")
 
     @api.one
     @api.constrains('amount')
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+CODA_CACHE_FIELDS = ['bank_account_id', 'company_id', 'type']
+
+
+class AccountJournal(models.Model):
+    _inherit = 'account.journal'
+
+    @api.model
+    def create(self, vals):
+        journal = super(AccountJournal, self).create(vals)
+        if journal.type == 'bank':
+            self.env['coda.bank.account'].clear_caches()
+        return journal
+
+    @api.multi
+    def write(self, vals):
+        res = super(AccountJournal, self).write(vals)
+        if any([x in vals for x in CODA_CACHE_FIELDS]):
+            self.env['coda.bank.account'].clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(AccountJournal, self).unlink()
+        self.env['coda.bank.account'].clear_caches()
+        return res
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
+
+    @api.model_cr
+    def init(self):
+        """
+        Partial indexes on the residual amounts of the open journal
+        items for the automatic reconcile fingerprints of the
+        CODA import, cf. _prepare_reconcile_fingerprints.
+        """
+        indexes = [
+            ('account_move_line_coda_residual_index',
+             '(company_id, amount_residual) '
+             'WHERE full_reconcile_id IS NULL'),
+            ('account_move_line_coda_residual_currency_index',
+             '(company_id, amount_residual_currency) '
+             'WHERE full_reconcile_id IS NULL AND currency_id IS NOT NULL'),
+        ]
+        for name, definition in indexes:
+            self._cr.execute(
+                "SELECT indexname FROM pg_indexes WHERE indexname = %s",
+                (name,))
+            if not self._cr.fetchone():
+                self._cr.execute(
+                    "CREATE INDEX %s ON account_move_line %s"
+                    % (name, definition))
@@ -2,9 +2,11 @@
 # Copyright 2009-2018 Noviat.
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
 
+from ..wizard.coda_helpers import get_iban_and_bban
+
 
 class CodaBankAccount(models.Model):
     _name = 'coda.bank.account'
@@ -164,6 +166,27 @@ class CodaBankAccount(models.Model):
         })
         return super(CodaBankAccount, self).copy(default)
 
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_company_bank_account_numbers(self, company_id):
+        """
+        Return the IBAN and BBAN variants of the bank account numbers
+        of the bank journals of a company.
+        The result is cached, cf. account.journal and res.partner.bank
+        for the cache invalidation.
+        """
+        company = self.env['res.company'].sudo().browse(company_id)
+        acc_numbers = company.bank_journal_ids.mapped(
+            'bank_account_id').mapped('sanitized_acc_number')
+        numbers = set()
+        for acc_number in acc_numbers:
+            if not acc_number:
+                continue
+            numbers.update(get_iban_and_bban(acc_number))
+            if acc_number[:2].isalpha() and acc_number[2:4].isdigit():
+                numbers.add(acc_number[4:])
+        return frozenset(numbers)
+
 
 class CodaAccountMappingRule(models.Model):
     _name = 'coda.account.mapping.rule'
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class ResPartnerBank(models.Model):
+    _inherit = 'res.partner.bank'
+
+    @api.multi
+    def write(self, vals):
+        res = super(ResPartnerBank, self).write(vals)
+        if 'acc_number' in vals and self.env['account.journal'].search(
+                [('bank_account_id', 'in', self.ids)], limit=1):
+            self.env['coda.bank.account'].clear_caches()
+        return res
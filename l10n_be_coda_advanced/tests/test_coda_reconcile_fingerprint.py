@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import json
+
+from mock import patch
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+
+class TestCodaReconcileFingerprint(TransactionCase):
+
+    def setUp(self):
+        super(TestCodaReconcileFingerprint, self).setUp()
+        self.coda_import = self.env['account.coda.import']
+        journal = self.env['account.journal'].create({
+            'name': 'CODA Test Bank',
+            'code': 'TCODA',
+            'type': 'bank',
+        })
+        transfer_account = self.env['account.account'].create({
+            'code': '580099',
+            'name': 'Internal Transfers',
+            'user_type_id': self.env.ref(
+                'account.data_account_type_current_assets').id,
+        })
+        self.cba = self.env['coda.bank.account'].create({
+            'name': 'CODA Test Bank',
+            'journal_id': journal.id,
+            'transfer_account': transfer_account.id,
+            'company_id': journal.company_id.id,
+            'find_partner': True,
+        })
+        self.partner = self.env['res.partner'].create({
+            'name': 'CODA Test Partner',
+            'is_company': True,
+        })
+        self.statement = self.env['account.bank.statement'].create({
+            'name': 'CODA Test Statement',
+            'journal_id': journal.id,
+            'coda_bank_account_id': self.cba.id,
+            'line_ids': [
+                (0, 0, self._st_line_vals(1, 'BE68539007547034', 123.45)),
+                (0, 0, self._st_line_vals(2, 'BE71096123456769', -67.89)),
+            ],
+        })
+        self.line_1, self.line_2 = self.statement.line_ids.sorted(
+            key=lambda r: r.name)
+
+    def _st_line_vals(self, seq, cp_number, amount):
+        transaction = {
+            'ref': '%04d' % seq,
+            'amount': amount,
+            'counterparty_number': cp_number,
+            'partner_name': 'CODA Test Partner',
+            'communication': 'Transaction %s' % seq,
+            'struct_comm_bba': '',
+            'payment_reference': '',
+        }
+        return {
+            'name': 'Line %s' % seq,
+            'date': fields.Date.today(),
+            'amount': amount,
+            'coda_transaction_dict': json.dumps(transaction),
+        }
+
+    def _reconcile(self, side_effect=None, reconcile_all=False):
+        """
+        Run the automatic reconcile and return the refs of
+        the transactions which have been processed.
+        """
+        processed = []
+
+        def st_line_reconcile(st_line, cba, transaction, reconcile_note):
+            processed.append(transaction['ref'])
+            if side_effect:
+                side_effect(transaction)
+            return reconcile_note + '\nNo match for %s' % transaction['ref']
+
+        with patch.object(
+                type(self.coda_import), '_st_line_reconcile',
+                side_effect=st_line_reconcile):
+            note = self.coda_import.with_context(
+                coda_reconcile_all=reconcile_all)._automatic_reconcile(
+                    self.statement)
+        return processed, note
+
+    def test_skip_unchanged_lines(self):
+        processed, note = self._reconcile()
+        self.assertEqual(sorted(processed), ['0001', '0002'])
+        self.assertTrue(self.line_1.coda_reconcile_fingerprint)
+        self.assertEqual(
+            self.line_1.coda_reconcile_note, '\nNo match for 0001')
+
+        processed, note = self._reconcile()
+        self.assertEqual(processed, [])
+        # the remarks of the previous attempt are returned
+        self.assertIn('No match for 0001', note)
+        self.assertIn('No match for 0002', note)
+
+        processed, note = self._reconcile(reconcile_all=True)
+        self.assertEqual(sorted(processed), ['0001', '0002'])
+
+    def test_retry_changed_lines(self):
+        self._reconcile()
+        fingerprint_2 = self.line_2.coda_reconcile_fingerprint
+
+        # a new bank account of the counterparty of the first line
+        # only changes the fingerprint of this line
+        self.env['res.partner.bank'].create({
+            'acc_number': 'BE68539007547034',
+            'partner_id': self.partner.id,
+        })
+        processed, note = self._reconcile()
+        self.assertEqual(processed, ['0001'])
+        self.assertEqual(self.line_2.coda_reconcile_fingerprint, fingerprint_2)
+
+    def test_retry_failed_lines(self):
+
+        def fail(transaction):
+            if transaction['ref'] == '0001':
+                raise ValueError('Test failure')
+
+        processed, note = self._reconcile(side_effect=fail)
+        self.assertEqual(sorted(processed), ['0001', '0002'])
+        self.assertIn('Test failure', note)
+        self.assertFalse(self.line_1.coda_reconcile_fingerprint)
+
+        processed, note = self._reconcile()
+        self.assertEqual(processed, ['0001'])
+
+    def test_retry_lines_changed_by_the_run(self):
+
+        def add_partner_bank(transaction):
+            # the matching of the second line changes the
+            # matching candidates of the first line
+            if transaction['ref'] == '0002':
+                self.env['res.partner.bank'].create({
+                    'acc_number': 'BE68539007547034',
+                    'partner_id': self.partner.id,
+                })
+
+        processed, note = self._reconcile(side_effect=add_partner_bank)
+        self.assertEqual(sorted(processed), ['0001', '0002'])
+        self.assertFalse(self.line_1.coda_reconcile_fingerprint)
+        self.assertTrue(self.line_2.coda_reconcile_fingerprint)
+
+        processed, note = self._reconcile()
+        self.assertEqual(processed, ['0001'])
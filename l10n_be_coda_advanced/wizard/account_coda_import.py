@@ -3,6 +3,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import base64
+import hashlib
 import json
 import logging
 import re
@@ -18,7 +19,7 @@ from traceback import format_exception
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 from .coda_helpers import \
-    calc_iban_checksum, check_bban, check_iban, get_iban_and_bban, \
+    check_bban, convert_to_iban, get_iban_and_bban, \
     repl_special, str2date, str2time, list2float, number2float
 
 _logger = logging.getLogger(__name__)
@@ -128,9 +129,9 @@ class AccountCodaImport(models.TransientModel):
         if cba:
             cba = cba[0]
             coda_statement['coda_bank_params'] = cba
-            self._company_bank_accounts = \
-                cba.company_id.bank_journal_ids.mapped(
-                    'bank_account_id').mapped('sanitized_acc_number')
+            self._company_bank_accounts = self.env[
+                'coda.bank.account']._get_company_bank_account_numbers(
+                    cba.company_id.id)
         else:
             if self.skip_undefined:
                 self._coda_import_note += _(
@@ -1528,14 +1529,38 @@ class AccountCodaImport(models.TransientModel):
         reconcile_note = reconcile_note or ''
         cba = statement.coda_bank_account_id
         if cba:
-            self._company_bank_accounts = \
-                cba.company_id.bank_journal_ids.mapped(
-                    'bank_account_id').mapped('sanitized_acc_number')
-            for st_line in statement.line_ids:
-                if st_line.amount and not st_line.journal_entry_ids:
-                    transaction = st_line.coda_transaction_dict \
+            self._company_bank_accounts = self.env[
+                'coda.bank.account']._get_company_bank_account_numbers(
+                    cba.company_id.id)
+            st_lines = statement.line_ids.filtered(
+                lambda r: r.amount and not r.journal_entry_ids)
+            # skip lines which have been processed before
+            # without changes in the data used by their matching logic
+            fingerprints = self._get_reconcile_fingerprints(cba, st_lines)
+            if not self._context.get('coda_reconcile_all'):
+                retry_ids = set(
+                    [x.id for x in st_lines
+                     if x.coda_reconcile_fingerprint != fingerprints[x.id]])
+            else:
+                retry_ids = set(st_lines.ids)
+            transactions = {}
+            for st_line in st_lines:
+                if st_line.id in retry_ids:
+                    transactions[st_line.id] = \
+                        st_line.coda_transaction_dict \
                         and json.loads(st_line.coda_transaction_dict)
+            self._prepare_reconcile_lookups(
+                statement, cba,
+                [x for x in transactions.values() if x])
+            processed = []
+            for st_line in st_lines:
+                if st_line.id not in retry_ids:
+                    reconcile_note += st_line.coda_reconcile_note or ''
+                    continue
+                if not st_line.journal_entry_ids:
+                    transaction = transactions[st_line.id]
                     if transaction:
+                        line_note_start = len(reconcile_note)
                         try:
                             with self._cr.savepoint():
                                 reconcile_note = self._st_line_reconcile(
@@ -1547,8 +1572,202 @@ class AccountCodaImport(models.TransientModel):
                                 "with ref '%s':\n%s, \n%s"
                             ) % (transaction['ref'], str(exctype),
                                  ', '.join(v for v in value if v))
+                            # retry on the next run
+                            continue
+                        processed.append(
+                            (st_line, reconcile_note[line_note_start:]))
+            # The reconciliations of this run may have modified the data
+            # used by the matching logic of the other lines.
+            # The outcome of such lines is not final hence they are not
+            # stamped and will be retried on the next run.
+            unmatched = self.env['account.bank.statement.line'].browse(
+                [x[0].id for x in processed if not x[0].journal_entry_ids])
+            new_fingerprints = self._get_reconcile_fingerprints(
+                cba, unmatched)
+            for st_line, line_note in processed:
+                if st_line.id in new_fingerprints \
+                        and new_fingerprints[st_line.id] \
+                        == fingerprints[st_line.id]:
+                    st_line.write({
+                        'coda_reconcile_fingerprint': fingerprints[st_line.id],
+                        'coda_reconcile_note': line_note,
+                    })
         return reconcile_note
 
+    def _get_reconcile_fingerprints(self, cba, st_lines):
+        """
+        Fingerprint of the state of the data used by the matching logic
+        of each statement line.
+        Statement lines are only retried by the automatic reconcile when
+        their fingerprint differs from the one of the previous attempt.
+
+        Returns: {st_line.id: fingerprint}
+        """
+        transactions = {}
+        for st_line in st_lines:
+            if st_line.coda_transaction_dict:
+                transactions[st_line.id] = json.loads(
+                    st_line.coda_transaction_dict)
+        self._prepare_reconcile_fingerprints(cba, transactions.values())
+        fingerprints = {}
+        for st_line in st_lines:
+            transaction = transactions.get(st_line.id)
+            if transaction:
+                data = self._get_reconcile_fingerprint_data(
+                    st_line, cba, transaction)
+                fingerprints[st_line.id] = hashlib.md5(
+                    repr(data)).hexdigest()
+            else:
+                fingerprints[st_line.id] = False
+        return fingerprints
+
+    def _get_reconcile_bba_keys(self, transaction):
+        """
+        Structured communications which may be matched with
+        the communication of the transaction.
+        """
+        digits = re.sub('\\D', '', transaction['communication'] or '')
+        keys = set([digits[i:i + 12] for i in xrange(len(digits) - 11)])
+        if transaction['struct_comm_bba']:
+            keys.add(re.sub('\\D', '', transaction['struct_comm_bba']))
+        return keys
+
+    def _prepare_reconcile_fingerprints(self, cba, transactions):
+        """
+        Load the data used by the matching logic of the transactions
+        with a minimum number of queries.
+        The data is grouped by the lookup keys of the transactions
+        (amount, structured communication, counterparty number)
+        so that the fingerprint of a statement line only changes
+        when one of its own matching candidates has been changed.
+        """
+        company_id = cba.company_id.id
+        fp_data = self._reconcile_fingerprint_data = {
+            'invoices': {},
+            'bba_invoices': {},
+            'partner_banks': {},
+            'amls': {},
+        }
+        self._cr.execute(
+            "SELECT count(*), max(write_date) FROM coda_account_mapping_rule "
+            "WHERE coda_bank_account_id = %s", (cba.id,))
+        fp_data['cba'] = [cba.write_date, self._cr.fetchone()]
+
+        amounts = list(set(
+            ['%.2f' % abs(x['amount']) for x in transactions]))
+        if amounts:
+            self._cr.execute(
+                "SELECT amount_total, count(*), max(write_date) "
+                "FROM account_invoice "
+                "WHERE company_id = %s AND amount_total IN %s "
+                "GROUP BY amount_total",
+                (company_id, tuple(amounts)))
+            for amount, count, write_date in self._cr.fetchall():
+                fp_data['invoices']['%.2f' % amount] = (count, write_date)
+
+        if cba.find_bbacom:
+            bba_keys = set()
+            for transaction in transactions:
+                bba_keys |= self._get_reconcile_bba_keys(transaction)
+            if bba_keys:
+                self._cr.execute(
+                    "SELECT ref, count(*), max(write_date) FROM ("
+                    "SELECT regexp_replace(reference, '\\D', '', 'g') AS ref, "
+                    "write_date FROM account_invoice "
+                    "WHERE reference_type = 'bba' "
+                    "UNION ALL "
+                    "SELECT regexp_replace(supplier_payment_ref, '\\D', '', "
+                    "'g'), write_date FROM account_invoice "
+                    "WHERE supplier_payment_ref_type = 'bba'"
+                    ") sq WHERE ref IN %s GROUP BY ref",
+                    (tuple(bba_keys),))
+                for ref, count, write_date in self._cr.fetchall():
+                    fp_data['bba_invoices'][ref] = (count, write_date)
+
+        cp_numbers = list(set(
+            [x['counterparty_number'] for x in transactions
+             if x['counterparty_number']]))
+        if cp_numbers:
+            self._cr.execute(
+                "SELECT pb.sanitized_acc_number, count(*), "
+                "max(pb.write_date), max(rp.write_date) "
+                "FROM res_partner_bank pb "
+                "JOIN res_partner rp ON rp.id = pb.partner_id "
+                "WHERE pb.sanitized_acc_number IN %s "
+                "GROUP BY pb.sanitized_acc_number",
+                (tuple(cp_numbers),))
+            for row in self._cr.fetchall():
+                fp_data['partner_banks'][row[0]] = row[1:]
+
+        if cba.find_account_move_line and amounts:
+            # the open items of reconcilable accounts with a residual
+            # amount of one of the transactions, written as IN lists on
+            # the signed residual amounts to use the partial indexes
+            # of the account_move_line table
+            neg_amounts = tuple('-' + x for x in amounts)
+            self._cr.execute(
+                "SELECT abs(aml.amount_residual), count(*), "
+                "max(aml.write_date) "
+                "FROM account_move_line aml "
+                "JOIN account_account aa ON aa.id = aml.account_id "
+                "WHERE aml.company_id = %s "
+                "AND aml.full_reconcile_id IS NULL AND aa.reconcile "
+                "AND (aml.amount_residual IN %s "
+                "     OR aml.amount_residual IN %s) "
+                "GROUP BY abs(aml.amount_residual)",
+                (company_id, tuple(amounts), neg_amounts))
+            rows = self._cr.fetchall()
+            self._cr.execute(
+                "SELECT abs(aml.amount_residual_currency), count(*), "
+                "max(aml.write_date) "
+                "FROM account_move_line aml "
+                "JOIN account_account aa ON aa.id = aml.account_id "
+                "WHERE aml.company_id = %s "
+                "AND aml.full_reconcile_id IS NULL "
+                "AND aml.currency_id IS NOT NULL AND aa.reconcile "
+                "AND (aml.amount_residual_currency IN %s "
+                "     OR aml.amount_residual_currency IN %s) "
+                "GROUP BY abs(aml.amount_residual_currency)",
+                (company_id, tuple(amounts), neg_amounts))
+            for amount, count, write_date in rows + self._cr.fetchall():
+                key = '%.2f' % amount
+                if key in fp_data['amls']:
+                    prev_count, prev_date = fp_data['amls'][key]
+                    count += prev_count
+                    write_date = max(write_date, prev_date)
+                fp_data['amls'][key] = (count, write_date)
+
+    def _get_reconcile_fingerprint_data(self, st_line, cba, transaction):
+        """
+        Use this method to add data used by the matching logic
+        of a statement line to its automatic reconcile fingerprint.
+        Cf. modules l10n_be_coda_pain, l10n_be_coda_sale for an example.
+        """
+        fp_data = self._reconcile_fingerprint_data
+        amount = '%.2f' % abs(transaction['amount'])
+        cp_number = transaction['counterparty_number']
+        data = fp_data['cba'] + [
+            st_line.coda_transaction_dict,
+            fp_data['invoices'].get(amount),
+            cp_number in self._company_bank_accounts,
+            fp_data['partner_banks'].get(cp_number),
+        ]
+        if cba.find_bbacom:
+            bba_keys = sorted(self._get_reconcile_bba_keys(transaction))
+            data.append(
+                [fp_data['bba_invoices'].get(x) for x in bba_keys])
+        if cba.find_account_move_line:
+            data.append(fp_data['amls'].get(amount))
+        return data
+
+    def _prepare_reconcile_lookups(self, statement, cba, transactions):
+        """
+        Placeholder to resolve statement wide lookup data with a
+        minimum number of queries before matching the individual
+        transactions, cf. module l10n_be_coda_pain.
+        """
+        pass
+
     def _st_line_reconcile(self, st_line, cba, transaction, reconcile_note):
 
         reconcile_note = self._match_and_reconcile(
@@ -1995,10 +2214,7 @@ class AccountCodaImport(models.TransientModel):
         if not cp_number:
             return reconcile_note, match
 
-        transfer_accounts = filter(
-            lambda x: cp_number in x,
-            self._company_bank_accounts)
-        if transfer_accounts:
+        if cp_number in self._company_bank_accounts:
             # exclude transactions from
             # counterparty_number = bank account number of this statement
             if cp_number not in get_iban_and_bban(
@@ -2311,18 +2527,12 @@ class AccountCodaImport(models.TransientModel):
 
         bank_id = False
         feedback = False
-        if check_iban(iban):
+        # convert belgian BBAN numbers to IBAN
+        iban = convert_to_iban([iban], bban_country='BE')[0]
+        if iban:
             bank_id, bic, bank_name, feedback = self.get_bank(bic, iban)
             if not bank_id:
                 return feedback
-        else:
-            # convert belgian BBAN numbers to IBAN
-            if check_bban('BE', iban):
-                kk = calc_iban_checksum('BE', iban)
-                iban = 'BE' + kk + iban
-                bank_id, bic, bank_name, feedback = self.get_bank(bic, iban)
-                if not bank_id:
-                    return feedback
 
         if bank_id:
             self.env['res.partner.bank'].create({
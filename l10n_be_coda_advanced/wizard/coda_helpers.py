@@ -3,6 +3,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import re
+import string
 import time
 
 
@@ -12,15 +13,15 @@ def _format_iban(iban_str):
     return ''
 
 
+def _to_unicode(s):
+    if isinstance(s, unicode):
+        return s
+    return s.decode('utf-8')
+
+
 def calc_iban_checksum(country, bban):
     bban = bban.replace(' ', '').upper() + country.upper() + '00'
-    base = ''
-    for c in bban:
-        if c.isdigit():
-            base += c
-        else:
-            base += str(ord(c) - ord('A') + 10)
-    kk = 98 - int(base) % 97
+    kk = 98 - int(_to_unicode(bban).translate(_iban_digits)) % 97
     return str(kk).rjust(2, '0')
 
 
@@ -40,22 +41,66 @@ def check_iban(iban):
     Check the IBAN number
     Logic partially based upon base_iban module, cf. is_iban_valid method
     """
-    iban = _format_iban(iban).lower()
-    if iban[:2] not in _map_iban_template:
+    iban = _format_iban(iban).upper()
+    if _iban_lengths.get(iban[:2]) != len(iban):
         return False
-    if len(iban) != len(_format_iban(_map_iban_template[iban[:2]])):
+    # the four first characters have to be shifted to the end
+    # and letters transformed into numbers (A = 10, B = 11, ...)
+    try:
+        iban = int(_to_unicode(iban[4:] + iban[:4]).translate(_iban_digits))
+    except ValueError:
         return False
-    # the four first digits have to be shifted to the end
-    iban = iban[4:] + iban[:4]
-    # letters have to be transformed into numbers (a = 10, b = 11, ...)
-    iban2 = ""
-    for char in iban:
-        if char.isalpha():
-            iban2 += str(ord(char) - 87)
-        else:
-            iban2 += char
     # iban is correct if modulo 97 == 1
-    return int(iban2) % 97 == 1
+    return iban % 97 == 1
+
+
+def convert_to_iban(numbers, bban_country='BE'):
+    """
+    Normalise, validate and convert a list of bank account numbers
+    in a single pass.
+
+    Returns a list with for every input number:
+    - the normalised IBAN number for a valid IBAN,
+    - the IBAN number for a valid 'bban_country' BBAN,
+    - False otherwise.
+    """
+    res = []
+    bban_country = bban_country.upper()
+    bban_suffix = _iban_country_digits.get(bban_country) or _to_unicode(
+        bban_country).translate(_iban_digits)
+    bban_suffix += u'00'
+    for number in numbers:
+        if not number:
+            res.append(False)
+            continue
+        number = _to_unicode(number)
+        if not number.isalnum():
+            number = number.translate(_acc_number_strip)
+        number = number.upper()
+        try:
+            if _iban_lengths.get(number[:2]) == len(number):
+                bban = number[4:]
+                if not bban.isdigit():
+                    bban = bban.translate(_iban_digits)
+                valid = int(
+                    bban + _iban_country_digits[number[:2]] + number[2:4]
+                ) % 97 == 1
+            else:
+                valid = False
+            if valid:
+                res.append(number)
+            elif number and check_bban(bban_country, number):
+                if not number.isdigit():
+                    bban = number.translate(_iban_digits)
+                else:
+                    bban = number
+                kk = 98 - int(bban + bban_suffix) % 97
+                res.append(u'%s%02d%s' % (bban_country, kk, number))
+            else:
+                res.append(False)
+        except ValueError:
+            res.append(False)
+    return res
 
 
 def get_iban_and_bban(number):
@@ -186,3 +231,17 @@ _map_iban_template = {
     'vg': 'VGkk BBBB CCCC CCCC CCCC CCCC',  # Virgin Islands
     'xk': 'XKkk BBBB CCCC CCCC CCCC',  # Kosovo
 }
+
+_iban_lengths = dict(
+    [(k.upper(), len(_format_iban(v))) for k, v in _map_iban_template.items()])
+
+# translation tables for the modulo 97 checksum calculation (A = 10, ...)
+# and the removal of separators from account numbers
+_iban_digits = dict(
+    [(ord(c), unicode(ord(c) - ord('A') + 10))
+     for c in string.ascii_uppercase])
+_iban_country_digits = dict(
+    [(k, k.translate(_iban_digits)) for k in
+     [unicode(x) for x in _iban_lengths]])
+_acc_number_strip = dict.fromkeys(
+    [ord(c) for c in string.whitespace + string.punctuation])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""
+Benchmark of the bank account number validation and conversion helpers.
+
+This script doesn't require an Odoo environment:
+
+    python coda_helpers_benchmark.py [number of account numbers]
+"""
+
+import random
+import sys
+import time
+
+from coda_helpers import \
+    calc_iban_checksum, check_bban, check_iban, convert_to_iban
+
+
+def _generate_numbers(size):
+    """
+    Mix of Belgian IBAN, BBAN and invalid account numbers.
+    """
+    random.seed(0)
+    numbers = []
+    for i in xrange(size):
+        bban = '%012d' % random.randint(0, 10 ** 12 - 1)
+        kind = i % 4
+        if kind == 0:
+            numbers.append(u'BE' + calc_iban_checksum('BE', bban) + bban)
+        elif kind == 1:
+            numbers.append(u'BE%s %s %s %s' % (
+                calc_iban_checksum('BE', bban),
+                bban[:4], bban[4:8], bban[8:]))
+        elif kind == 2:
+            numbers.append(unicode(bban))
+        else:
+            numbers.append(u'BE00' + bban)
+    return numbers
+
+
+def _convert_per_number(numbers):
+    res = []
+    for number in numbers:
+        if check_iban(number):
+            res.append(number)
+        elif check_bban('BE', number):
+            res.append('BE' + calc_iban_checksum('BE', number) + number)
+        else:
+            res.append(False)
+    return res
+
+
+def main(size):
+    numbers = _generate_numbers(size)
+    for name, method in [('check_iban/check_bban', _convert_per_number),
+                         ('convert_to_iban', convert_to_iban)]:
+        start = time.time()
+        method(numbers)
+        duration = time.time() - start
+        print('%-25s %d numbers in %.2fs (%d numbers/s)' % (
+            name, size, duration, size / duration))
+
+
+if __name__ == '__main__':
+    main(len(sys.argv) > 1 and int(sys.argv[1]) or 1000000)
@@ -9,6 +9,66 @@ from odoo.exceptions import UserError
 class AccountCodaImport(models.TransientModel):
     _inherit = 'account.coda.import'
 
+    def _prepare_reconcile_lookups(self, statement, cba, transactions):
+        """
+        Resolve the payment references of all debit transactions
+        of the statement with a single query.
+        """
+        super(AccountCodaImport, self)._prepare_reconcile_lookups(
+            statement, cba, transactions)
+        self._bank_payment_lines = {}
+        if not cba.find_payment:
+            return
+        payment_refs = list(set(
+            [x['payment_reference'] for x in transactions
+             if x.get('payment_reference') and x['amount'] < 0]))
+        if payment_refs:
+            bankpaylines = self.env['bank.payment.line'].search(
+                [('name', 'in', payment_refs)])
+            # prefetch the move lines used by _match_payment_reference
+            bankpaylines.mapped('payment_line_ids.move_line_id')
+            for bankpayline in bankpaylines:
+                if bankpayline.name in self._bank_payment_lines:
+                    self._bank_payment_lines[bankpayline.name] |= bankpayline
+                else:
+                    self._bank_payment_lines[bankpayline.name] = bankpayline
+
+    def _prepare_reconcile_fingerprints(self, cba, transactions):
+        super(AccountCodaImport, self)._prepare_reconcile_fingerprints(
+            cba, transactions)
+        fp_data = self._reconcile_fingerprint_data
+        fp_data['bank_payment_lines'] = {}
+        if not cba.find_payment:
+            return
+        payment_refs = list(set(
+            [x['payment_reference'] for x in transactions
+             if x.get('payment_reference')]))
+        if payment_refs:
+            self._cr.execute(
+                "SELECT name, count(*), max(write_date) "
+                "FROM bank_payment_line "
+                "WHERE company_id = %s AND name IN %s GROUP BY name",
+                (cba.company_id.id, tuple(payment_refs)))
+            for name, count, write_date in self._cr.fetchall():
+                fp_data['bank_payment_lines'][name] = (count, write_date)
+
+    def _get_reconcile_fingerprint_data(self, st_line, cba, transaction):
+        data = super(AccountCodaImport, self)._get_reconcile_fingerprint_data(
+            st_line, cba, transaction)
+        if cba.find_payment:
+            data.append(
+                self._reconcile_fingerprint_data['bank_payment_lines'].get(
+                    transaction.get('payment_reference')))
+        return data
+
+    def _get_bank_payment_lines(self, payment_reference):
+        bank_payment_lines = getattr(self, '_bank_payment_lines', None)
+        if bank_payment_lines is None:
+            return self.env['bank.payment.line'].search(
+                [('name', '=', payment_reference)])
+        return bank_payment_lines.get(
+            payment_reference, self.env['bank.payment.line'])
+
     def _match_payment_reference(self, st_line, cba, transaction,
                                  reconcile_note):
         """
@@ -22,8 +82,7 @@ class AccountCodaImport(models.TransientModel):
 
         if payment_reference and cba.find_payment \
                 and transaction['amount'] < 0:
-            bankpaylines = self.env['bank.payment.line'].search(
-                [('name', '=', payment_reference)])
+            bankpaylines = self._get_bank_payment_lines(payment_reference)
             if bankpaylines:
                 if len(bankpaylines) == 1:
                     match['bank_payment_line_id'] = bankpaylines.id
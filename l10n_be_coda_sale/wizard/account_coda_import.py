@@ -2,26 +2,144 @@
 # Copyright 2009-2018 Noviat.
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import re
+
 from odoo import models
 
+SO_ZEROS = re.compile('0{3,10}')
+
 
 class AccountCodaImport(models.TransientModel):
     _inherit = 'account.coda.import'
 
+    def _prepare_reconcile_fingerprints(self, cba, transactions):
+        super(AccountCodaImport, self)._prepare_reconcile_fingerprints(
+            cba, transactions)
+        fp_data = self._reconcile_fingerprint_data
+        fp_data['sale_orders'] = {}
+        if not cba.find_so_number:
+            return
+        so_ids = set()
+        for transaction in transactions:
+            so_ids.update(self._get_reconcile_sale_order_ids(
+                cba, transaction))
+        if so_ids:
+            self._cr.execute(
+                "SELECT id, state, write_date FROM sale_order "
+                "WHERE id IN %s", (tuple(so_ids),))
+            closed = []
+            for so_id, state, write_date in self._cr.fetchall():
+                fp_data['sale_orders'][so_id] = (state, write_date)
+                if state in ('cancel', 'done'):
+                    closed.append(so_id)
+            # the run may have closed some of the matching Sale Orders
+            self._remove_sale_order_index_entries(cba, closed)
+
+    def _get_reconcile_sale_order_ids(self, cba, transaction):
+        if not transaction['communication'] or transaction['amount'] <= 0:
+            return []
+        so_res = self._get_sale_order(None, cba, transaction, '')[1]
+        return sorted([x[0] for x in so_res])
+
+    def _get_reconcile_fingerprint_data(self, st_line, cba, transaction):
+        data = super(AccountCodaImport, self)._get_reconcile_fingerprint_data(
+            st_line, cba, transaction)
+        if cba.find_so_number:
+            sale_orders = self._reconcile_fingerprint_data['sale_orders']
+            so_ids = self._get_reconcile_sale_order_ids(cba, transaction)
+            data.append([(x, sale_orders.get(x)) for x in so_ids])
+        return data
+
+    def _get_sale_order_index(self, cba):
+        """
+        Build an in-memory index of the open Sale Orders of the company.
+
+        The index reproduces the former SQL lookup whereby the first
+        sequence of 3 to 10 zeros in the Sale Order number matches
+        '0%0' in the (case insensitive) free form communication:
+        - 'prefixes': {prefix: {'tails': {tail: [so_ids]}, 'lengths': set}}
+          for numbers with a sequence of zeros, prefix includes the
+          first zero and the communication must contain '0' + tail
+          after the prefix.
+        - 'names': {name: [so_ids]} for the other numbers.
+        - 'keys': {so_id: key} with the ('prefixes', prefix, tail) or
+          ('names', name) entry of the Sale Order.
+        """
+        if not hasattr(self, '_sale_order_index'):
+            self._sale_order_index = {}
+        company_id = cba.company_id.id
+        if company_id in self._sale_order_index:
+            return self._sale_order_index[company_id]
+
+        index = {
+            'prefixes': {}, 'names': {}, 'name_lengths': set(), 'keys': {}}
+        self._cr.execute(
+            "SELECT id, name FROM sale_order "
+            "WHERE state NOT IN ('cancel', 'done') AND company_id = %s",
+            (company_id,))
+        for so_id, name in self._cr.fetchall():
+            name = name.lower()
+            zeros = SO_ZEROS.search(name)
+            if zeros:
+                prefix = name[:zeros.start() + 1]
+                tail = name[zeros.end():]
+                entry = index['prefixes'].setdefault(
+                    prefix, {'tails': {}, 'lengths': set()})
+                entry['tails'].setdefault(tail, []).append(so_id)
+                entry['lengths'].add(len(tail))
+                index['keys'][so_id] = ('prefixes', prefix, tail)
+            else:
+                index['names'].setdefault(name, []).append(so_id)
+                index['name_lengths'].add(len(name))
+                index['keys'][so_id] = ('names', name)
+
+        self._sale_order_index[company_id] = index
+        return index
+
+    def _remove_sale_order_index_entries(self, cba, so_ids):
+        """
+        Remove Sale Orders from the in-memory index,
+        cf. _get_sale_order_index.
+        """
+        index = self._get_sale_order_index(cba)
+        for so_id in so_ids:
+            key = index['keys'].pop(so_id, None)
+            if not key:
+                continue
+            if key[0] == 'prefixes':
+                ids = index['prefixes'][key[1]]['tails'][key[2]]
+            else:
+                ids = index['names'][key[1]]
+            ids.remove(so_id)
+
     def _get_sale_order(self, st_line, cba, transaction, reconcile_note):
         """
         check matching Sales Order number in free form communication
         """
-        free_comm = repl_special(transaction['communication'].strip())
-        select = \
-            "SELECT id FROM (SELECT id, name, '%s'::text AS free_comm, " \
-            "regexp_replace(name, '[0]{3,10}', '0%%0') AS name_match " \
-            "FROM sale_order WHERE state not in ('cancel', 'done') " \
-            "AND company_id = %s) sq " \
-            "WHERE free_comm ILIKE '%%'||name_match||'%%'" \
-            % (free_comm, cba.company_id.id)
-        self._cr.execute(select)
-        res = self._cr.fetchall()
+        index = self._get_sale_order_index(cba)
+        free_comm = transaction['communication'].strip().lower()
+        so_ids = set()
+
+        for prefix, entry in index['prefixes'].iteritems():
+            pos = free_comm.find(prefix)
+            if pos < 0:
+                continue
+            # position of the zero preceding the tail
+            for i in xrange(pos + len(prefix), len(free_comm)):
+                if free_comm[i] != '0':
+                    continue
+                for length in entry['lengths']:
+                    tail = free_comm[i + 1:i + 1 + length]
+                    if len(tail) == length and tail in entry['tails']:
+                        so_ids.update(entry['tails'][tail])
+
+        for length in index['name_lengths']:
+            for i in xrange(len(free_comm) - length + 1):
+                name = free_comm[i:i + length]
+                if name in index['names']:
+                    so_ids.update(index['names'][name])
+
+        res = [(x,) for x in so_ids]
         return reconcile_note, res
 
     def _match_sale_order(self, st_line, cba, transaction, reconcile_note):
@@ -66,8 +184,3 @@ class AccountCodaImport(models.TransientModel):
                                 transaction['reconcile'] = imls[0].id
 
         return reconcile_note, match
-
-
-def repl_special(s):
-    s = s.replace("\'", "\'" + "'")
-    return s
@@ -12,7 +12,14 @@
     'license': 'AGPL-3',
     'external_dependencies': {'python': ['xlsxwriter']},
     'depends': [
+        'mail',
         'report_xlsx',
     ],
+    'data': [
+        'security/ir.model.access.csv',
+        'security/report_xlsx_security.xml',
+        'data/ir_cron.xml',
+        'views/report_xlsx_queue.xml',
+    ],
     'installable': True,
 }
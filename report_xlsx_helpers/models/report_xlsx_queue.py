@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import base64
+import json
+import logging
+from sys import exc_info
+from traceback import format_exception
+
+import odoo
+from odoo import api, fields, models, _
+from odoo.report.interface import report_int
+
+from ..report.abstract_report_xlsx import \
+    AbstractReportXlsx, _queue_progress, report_progress
+
+_logger = logging.getLogger(__name__)
+
+
+class ReportXlsxQueue(models.Model):
+    _name = 'report.xlsx.queue'
+    _inherit = ['mail.thread']
+    _description = 'Excel reports generated in background'
+    _order = 'id desc'
+    # the users have no write access on their queued reports,
+    # the jobs are updated by the scheduled action
+    _mail_post_access = 'read'
+
+    name = fields.Char(string='Report', required=True, readonly=True)
+    report_name = fields.Char(
+        string='Report Service', required=True, readonly=True,
+        help="Technical name of the report, e.g. 'stock.level.xls'.")
+    res_ids = fields.Text(string='Record Ids', readonly=True)
+    data = fields.Text(string='Report Data', readonly=True)
+    context = fields.Text(string='Context', readonly=True)
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')],
+        string='State', required=True, readonly=True, default='queued',
+        track_visibility='onchange')
+    rows_written = fields.Integer(
+        string='Rows Written', compute='_compute_rows_written',
+        help="Number of report lines written, "
+             "updated every 1000 lines while the report is running.")
+    date_start = fields.Datetime(string='Start Time', readonly=True)
+    date_done = fields.Datetime(string='End Time', readonly=True)
+    attachment_id = fields.Many2one(
+        'ir.attachment', string='Attachment', readonly=True)
+    file = fields.Binary(
+        related='attachment_id.datas', string='File', readonly=True)
+    file_name = fields.Char(
+        related='attachment_id.datas_fname', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+    user_id = fields.Many2one(
+        'res.users', string='User', required=True, readonly=True,
+        default=lambda self: self.env.user)
+    company_id = fields.Many2one(
+        'res.company', string='Company', readonly=True,
+        default=lambda self: self.env.user.company_id)
+
+    @api.multi
+    def _compute_rows_written(self):
+        job_ids = [x for x in self.ids if isinstance(x, (int, long))]
+        progress = {}
+        if job_ids:
+            self._cr.execute(
+                "SELECT queue_id, rows_written "
+                "FROM report_xlsx_queue_progress WHERE queue_id IN %s",
+                (tuple(job_ids),))
+            progress = dict(self._cr.fetchall())
+        for job in self:
+            job.rows_written = progress.get(job.id, 0)
+
+    @api.model_cr
+    def _register_hook(self):
+        """
+        Create the write_date indexes used by the data version token
+        of the cached reports, cf. AbstractReportXlsx, _get_cache_version.
+        """
+        res = super(ReportXlsxQueue, self)._register_hook()
+        for report in report_int._reports.values():
+            if isinstance(report, AbstractReportXlsx) \
+                    and report._cache_ttl:
+                report._init_cache_indexes(self.env)
+        return res
+
+    @api.multi
+    def unlink(self):
+        self.env['report.xlsx.queue.progress'].sudo().search(
+            [('queue_id', 'in', self.ids)]).unlink()
+        return super(ReportXlsxQueue, self).unlink()
+
+    @api.model
+    def enqueue(self, report_name, ids, data=None, name=None):
+        """
+        Queue the generation of an xlsx report and return
+        the action to show the queue record.
+        Use this method instead of returning the report action
+        from your report wizard, e.g.
+
+        return self.env['report.xlsx.queue'].enqueue(
+            'stock.level.xls', [self.id], data={'ids': [self.id]})
+        """
+        ctx = dict(self.env.context)
+        ctx.pop('params', None)
+        job = self.create({
+            'name': name or report_name,
+            'report_name': report_name,
+            'res_ids': json.dumps(ids),
+            'data': json.dumps(data or {}, default=repr),
+            'context': json.dumps(ctx, default=repr),
+        })
+        return {
+            'name': _('Excel Report'),
+            'res_id': job.id,
+            'view_type': 'form',
+            'view_mode': 'form',
+            'res_model': self._name,
+            'target': 'current',
+            'type': 'ir.actions.act_window',
+        }
+
+    @api.model
+    def _cron_process_queue(self):
+        jobs = self.search([('state', '=', 'queued')], order='id')
+        for job in jobs:
+            job.write({
+                'state': 'running',
+                'date_start': fields.Datetime.now(),
+            })
+            # make the state and progress visible while the report is running
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+            try:
+                job._generate_report()
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            except Exception:
+                tb = ''.join(format_exception(*exc_info()))
+                _logger.error(
+                    "%s, generation of report %s failed:\n%s",
+                    self._name, job.report_name, tb)
+                self.env.cr.rollback()
+                self.env.clear()
+                job.write({
+                    'state': 'failed',
+                    'error': tb,
+                    'date_done': fields.Datetime.now(),
+                })
+                job._notify_user()
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    @api.multi
+    def _generate_report(self):
+        self.ensure_one()
+        ctx = json.loads(self.context or '{}')
+        ctx.update({
+            'xlsx_export': True,
+            'xlsx_queue_id': self.id,
+        })
+        _queue_progress.callback = self._get_progress_callback(self.id)
+        try:
+            content, fmt = odoo.report.render_report(
+                self.env.cr, self.user_id.id,
+                json.loads(self.res_ids or '[]'), self.report_name,
+                json.loads(self.data or '{}'), context=ctx)
+            report_progress(flush=True)
+        finally:
+            _queue_progress.callback = None
+        attachment = self.env['ir.attachment'].create({
+            'name': self.name,
+            'datas': base64.b64encode(content),
+            'datas_fname': '%s.%s' % (self.name, fmt),
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        self.write({
+            'state': 'done',
+            'attachment_id': attachment.id,
+            'date_done': fields.Datetime.now(),
+        })
+        self._notify_user()
+
+    @api.multi
+    def _notify_user(self):
+        for job in self:
+            if job.state == 'done':
+                body = _(
+                    "Your report <a href='/web/content/%s?download=true'>"
+                    "%s</a> is ready.") % (
+                    job.attachment_id.id, job.attachment_id.datas_fname)
+            else:
+                body = _("The generation of your report %s failed.") \
+                    % job.name
+            job.message_post(
+                body=body, partner_ids=[(4, job.user_id.partner_id.id)],
+                subtype='mail.mt_comment')
+
+    @api.model
+    def _get_progress_callback(self, job_id, interval=1000):
+        """
+        Return a function that counts the report lines and updates
+        the progress of the job every 'interval' lines.
+        Call it with flush=True to write the final count.
+        The progress is written via a separate cursor since the
+        report transaction is only committed at the end, hence it is
+        stored in report.xlsx.queue.progress and not on the job which
+        is updated by the report transaction.
+        """
+        dbname = self.env.cr.dbname
+        counter = [0]
+
+        def progress(flush=False):
+            if not flush:
+                counter[0] += 1
+            if flush or counter[0] % interval == 0:
+                with odoo.registry(dbname).cursor() as cr:
+                    cr.execute(
+                        "UPDATE report_xlsx_queue_progress "
+                        "SET rows_written = %s WHERE queue_id = %s",
+                        (counter[0], job_id))
+                    if not cr.rowcount:
+                        cr.execute(
+                            "INSERT INTO report_xlsx_queue_progress "
+                            "(queue_id, rows_written) VALUES (%s, %s)",
+                            (job_id, counter[0]))
+
+        return progress
+
+
+class ReportXlsxQueueProgress(models.Model):
+    """
+    Number of lines written by the running reports.
+    The queue_id is not a foreign key since the progress is written
+    by a separate transaction.
+    """
+    _name = 'report.xlsx.queue.progress'
+    _description = 'Excel report progress'
+    _log_access = False
+
+    queue_id = fields.Integer(string='Report Job', required=True, index=True)
+    rows_written = fields.Integer(string='Rows Written')
+
+    _sql_constraints = [
+        ('queue_uniq', 'unique(queue_id)',
+         'The progress must be unique per report job !'),
+    ]
@@ -2,26 +2,175 @@
 # Copyright 2009-2018 Noviat.
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from datetime import datetime
+import base64
+from datetime import datetime, timedelta
+import hashlib
+import json
 import re
+import threading
 from types import CodeType
 from xlsxwriter.utility import xl_rowcol_to_cell
 
-from odoo import api, fields, _
+from odoo import api, fields, models, _
 from odoo.addons.report_xlsx.report.report_xlsx import ReportXlsx
 from odoo.exceptions import UserError
 
+CACHE_RES_MODEL = 'report.xlsx.cache'
+
+# progress callback of the reports generated via the report.xlsx.queue,
+# kept per thread since the report objects are shared between report runs
+_queue_progress = threading.local()
+
+
+def report_progress(flush=False):
+    """
+    Count a report line written by a report generated via the
+    report.xlsx.queue, cf. report.xlsx.queue, _generate_report.
+    Reports which are not based on AbstractReportXlsx can call this
+    function from their _write_line method.
+    """
+    progress = getattr(_queue_progress, 'callback', None)
+    if progress:
+        progress(flush=flush)
+
 
 class AbstractReportXlsx(ReportXlsx):
 
+    # Result cache, disabled by default.
+    # Set _cache_ttl (seconds) in your report in order to store the
+    # generated files as ir.attachment and return the stored file for
+    # identical report parameters.
+    # Only enable the cache for reports with a content that doesn't
+    # depend on the access rights of the user (besides the company).
+    _cache_ttl = 0
+    # maximum number of cached files per report (least recently used
+    # files are removed first)
+    _cache_size = 10
+    # the cache is invalidated on changes of the records of these models
+    _cache_models = []
+
     def create(self, cr, uid, ids, data, context=None):
         if context.get('xlsx_export'):
             self.env = api.Environment(cr, uid, context)
+            if self._cache_ttl and not context.get('xlsx_no_cache'):
+                return self._create_xlsx_report_cached(ids, data)
             return self.create_xlsx_report(ids, data, None)
         else:
             return super(AbstractReportXlsx, self).create(
                 cr, uid, ids, data, context=context)
 
+    def _create_xlsx_report_cached(self, ids, data):
+        """
+        Return the cached file for the report parameters or generate
+        the report and add it to the cache.
+        Expired files are removed and the number of cached files
+        is limited to _cache_size.
+        """
+        cache_key = self._get_cache_key(ids, data)
+        fname = '%s.xlsx' % self.name
+        att_mod = self.env['ir.attachment'].sudo()
+        expired = fields.Datetime.to_string(
+            datetime.now() - timedelta(seconds=self._cache_ttl))
+        att_mod.search([
+            ('res_model', '=', CACHE_RES_MODEL),
+            ('datas_fname', '=', fname),
+            ('create_date', '<', expired)]).unlink()
+        cached = att_mod.search([
+            ('res_model', '=', CACHE_RES_MODEL),
+            ('name', '=', cache_key)], limit=1)
+        if cached:
+            # update write_date for the LRU eviction
+            cached.write({'description': fields.Datetime.now()})
+            return base64.b64decode(cached.datas), 'xlsx'
+
+        res = self.create_xlsx_report(ids, data, None)
+        att_mod.create({
+            'name': cache_key,
+            'datas': base64.b64encode(res[0]),
+            'datas_fname': fname,
+            'res_model': CACHE_RES_MODEL,
+            'company_id': self.env.user.company_id.id,
+            'description': fields.Datetime.now(),
+        })
+        cached = att_mod.search([
+            ('res_model', '=', CACHE_RES_MODEL),
+            ('datas_fname', '=', fname)],
+            order='write_date desc, id desc')
+        cached[self._cache_size:].unlink()
+        return res
+
+    def _get_cache_key(self, ids, data):
+        """
+        Hash of the report parameters.
+        """
+        params = {
+            'report': self.name,
+            'company_id': self.env.user.company_id.id,
+            'context': self._get_cache_context(),
+            'data': data,
+            'records': self._get_cache_records(ids),
+            'version': self._get_cache_version(ids, data),
+        }
+        params = json.dumps(params, sort_keys=True, default=repr)
+        return hashlib.sha1(params).hexdigest()
+
+    def _get_cache_context(self):
+        ctx = dict(self.env.context)
+        for k in ['params', 'xlsx_no_cache']:
+            ctx.pop(k, None)
+        return ctx
+
+    def _get_cache_records(self, ids):
+        """
+        The values of the report records are used instead of the ids
+        since the report records are typically transient wizard records.
+        """
+        if not ids or self.table not in self.env:
+            return ids
+        records = self.env[self.table].browse(ids).read()
+        magic = models.MAGIC_COLUMNS + ['display_name', '__last_update']
+        return [{k: v for k, v in x.iteritems() if k not in magic}
+                for x in records]
+
+    def _get_cache_version(self, ids, data):
+        """
+        Data version token.
+        The default implementation returns the highest id and the
+        last update date of the models in _cache_models.
+        Records removed from those models are hence only reflected
+        after the expiry of the cached files unless you override this
+        method, e.g. with a token maintained by your module.
+        """
+        return [self._get_cache_model_version(model)
+                for model in self._cache_models]
+
+    def _get_cache_model_version(self, model):
+        """
+        Both values are read via an index scan on the primary key and
+        on the write_date index, cf. _init_cache_indexes.
+        """
+        self.env.cr.execute(
+            "SELECT MAX(id), MAX(write_date) FROM %s"
+            % self.env[model]._table)
+        return self.env.cr.fetchone()
+
+    def _init_cache_indexes(self, env):
+        """
+        Create an index on the write_date of the _cache_models,
+        cf. report.xlsx.queue, _register_hook.
+        """
+        for model in self._cache_models:
+            if model not in env:
+                continue
+            table = env[model]._table
+            index = '%s_write_date_index' % table
+            env.cr.execute(
+                "SELECT indexname FROM pg_indexes WHERE indexname = %s",
+                (index,))
+            if not env.cr.fetchone():
+                env.cr.execute(
+                    "CREATE INDEX %s ON %s (write_date)" % (index, table))
+
     def generate_xlsx_report(self, workbook, data, objects):
         self._define_formats(workbook)
         for ws_params in self._get_ws_params(workbook, data, objects):
@@ -77,6 +226,9 @@ class AbstractReportXlsx(ReportXlsx):
         This section contains a number of pre-defined formats.
         It is recommended to use these in order to have a
         consistent look & feel between your XLSX reports.
+
+        The cell formats are declared in _get_format_definitions
+        and added to the workbook on first use, cf. _get_format.
         """
 
         # predefined worksheet headers/footers
@@ -96,6 +248,17 @@ class AbstractReportXlsx(ReportXlsx):
                 ) % hf_params,
         }
 
+        self._workbook = workbook
+        self._formats = {}
+        self._formats_by_properties = {}
+        self._format_definitions = self._get_format_definitions()
+
+    def _get_format_definitions(self):
+        """
+        Return a dictionary with the properties of the pre-defined
+        formats by format name.
+        Extend this dictionary in order to add formats to your report.
+        """
         border_grey = '#D3D3D3'
         border = {'border': True, 'border_color': border_grey}
         theader = dict(border, bold=True)
@@ -111,132 +274,90 @@ class AbstractReportXlsx(ReportXlsx):
         theader_yellow = dict(theader, bg_color=bg_yellow)
         theader_blue = dict(theader, bg_color=bg_blue)
 
-        # format for worksheet title
-        self.format_ws_title = workbook.add_format(
-            {'bold': True, 'font_size': 14})
-
-        # no border formats
-        self.format_left = workbook.add_format({'align': 'left'})
-        self.format_center = workbook.add_format({'align': 'center'})
-        self.format_right = workbook.add_format({'align': 'right'})
-        self.format_amount = workbook.add_format(
-            {'align': 'right', 'num_format': num_format})
-        self.format_amount_conditional = workbook.add_format(
-            {'align': 'right', 'num_format': num_format_conditional})
-        self.format_percent = workbook.add_format(
-            {'align': 'right', 'num_format': pct_format})
-        self.format_percent_conditional = workbook.add_format(
-            {'align': 'right', 'num_format': pct_format_conditional})
-        self.format_integer = workbook.add_format(
-            {'align': 'right', 'num_format': int_format})
-        self.format_integer_conditional = workbook.add_format(
-            {'align': 'right', 'num_format': int_format_conditional})
-        self.format_date = workbook.add_format(
-            {'align': 'left', 'num_format': date_format})
-
-        self.format_left_bold = workbook.add_format(
-            {'align': 'left', 'bold': True})
-        self.format_center_bold = workbook.add_format(
-            {'align': 'center', 'bold': True})
-        self.format_right_bold = workbook.add_format(
-            {'align': 'right', 'bold': True})
-        self.format_amount_bold = workbook.add_format(
-            {'align': 'right', 'bold': True, 'num_format': num_format})
-        self.format_amount_bold_conditional = workbook.add_format(
-            {'align': 'right', 'bold': True,
-             'num_format': num_format_conditional})
-        self.format_percent_bold = workbook.add_format(
-            {'align': 'right', 'bold': True, 'num_format': pct_format})
-        self.format_percent_bold_conditional = workbook.add_format(
-            {'align': 'right', 'bold': True,
-             'num_format': pct_format_conditional})
-        self.format_integer_bold = workbook.add_format(
-            {'align': 'right', 'bold': True, 'num_format': int_format})
-        self.format_integer_bold_conditional = workbook.add_format(
-            {'align': 'right', 'bold': True,
-             'num_format': int_format_conditional})
-        self.format_date_bold = workbook.add_format(
-            {'align': 'left', 'bold': True, 'num_format': date_format})
-
-        # formats for worksheet table column headers
-        self.format_theader_yellow = workbook.add_format(theader_yellow)
-        self.format_theader_yellow_center = workbook.add_format(
-            dict(theader_yellow, align='center'))
-        self.format_theader_yellow_right = workbook.add_format(
-            dict(theader_yellow, align='right'))
-        self.format_theader_yellow_amount = workbook.add_format(
-            dict(theader_yellow, num_format=num_format))
-        self.format_theader_yellow_amount_conditional = workbook.add_format(
-            dict(theader_yellow, num_format=num_format_conditional))
-        self.format_theader_yellow_percent = workbook.add_format(
-            dict(theader_yellow, num_format=pct_format))
-        self.format_theader_yellow_percent_conditional = workbook.add_format(
-            dict(theader_yellow, num_format=pct_format_conditional))
-        self.format_theader_yellow_integer = workbook.add_format(
-            dict(theader_yellow, num_format=int_format))
-        self.format_theader_yellow_integer_conditional = workbook.add_format(
-            dict(theader_yellow, num_format=int_format_conditional))
-
-        self.format_theader_blue = workbook.add_format(theader_blue)
-        self.format_theader_blue_center = workbook.add_format(
-            dict(theader_blue, align='center'))
-        self.format_theader_blue_right = workbook.add_format(
-            dict(theader_blue, align='right'))
-        self.format_theader_blue_amount = workbook.add_format(
-            dict(theader_blue, num_format=num_format))
-        self.format_theader_blue_amount_conditional = workbook.add_format(
-            dict(theader_blue, num_format=num_format_conditional))
-        self.format_theader_blue_percent = workbook.add_format(
-            dict(theader_blue, num_format=pct_format))
-        self.format_theader_blue_percent_conditional = workbook.add_format(
-            dict(theader_blue, num_format=pct_format_conditional))
-        self.format_theader_blue_integer = workbook.add_format(
-            dict(theader_blue, num_format=int_format))
-        self.format_theader_blue_integer_conditional = workbook.add_format(
-            dict(theader_blue, num_format=int_format_conditional))
-
-        # formats for worksheet table cells
-        self.format_tleft = workbook.add_format(
-            dict(border, align='left'))
-        self.format_tcenter = workbook.add_format(
-            dict(border, align='center'))
-        self.format_tright = workbook.add_format(
-            dict(border, align='right'))
-        self.format_tamount = workbook.add_format(
-            dict(border, num_format=num_format))
-        self.format_tamount_conditional = workbook.add_format(
-            dict(border, num_format=num_format_conditional))
-        self.format_tpercent = workbook.add_format(
-            dict(border, num_format=pct_format))
-        self.format_tpercent_conditional = workbook.add_format(
-            dict(border, num_format=pct_format_conditional))
-        self.format_tinteger = workbook.add_format(
-            dict(border, num_format=int_format))
-        self.format_tinteger_conditional = workbook.add_format(
-            dict(border, num_format=int_format_conditional))
-        self.format_tdate = workbook.add_format(
-            dict(border, align='left', num_format=date_format))
-
-        self.format_tleft_bold = workbook.add_format(
-            dict(border, align='left', bold=True))
-        self.format_tcenter_bold = workbook.add_format(
-            dict(border, align='center', bold=True))
-        self.format_tright_bold = workbook.add_format(
-            dict(border, align='right', bold=True))
-        self.format_tamount_bold = workbook.add_format(
-            dict(border, bold=True, num_format=num_format))
-        self.format_tamount_bold_conditional = workbook.add_format(
-            dict(border, bold=True, num_format=num_format_conditional))
-        self.format_tpercent_bold = workbook.add_format(
-            dict(border, bold=True, num_format=pct_format))
-        self.format_tpercent_bold_conditional = workbook.add_format(
-            dict(border, bold=True, num_format=pct_format_conditional))
-        self.format_tinteger_bold = workbook.add_format(
-            dict(border, bold=True, num_format=int_format))
-        self.format_tinteger_bold_conditional = workbook.add_format(
-            dict(border, bold=True, num_format=int_format_conditional))
-        self.format_tdate_bold = workbook.add_format(
-            dict(border, align='left', bold=True, num_format=date_format))
+        res = {
+            # format for worksheet title
+            'format_ws_title': {'bold': True, 'font_size': 14},
+            # no border formats
+            'format_left': {'align': 'left'},
+            'format_center': {'align': 'center'},
+            'format_right': {'align': 'right'},
+            'format_date': {'align': 'left', 'num_format': date_format},
+            'format_left_bold': {'align': 'left', 'bold': True},
+            'format_center_bold': {'align': 'center', 'bold': True},
+            'format_right_bold': {'align': 'right', 'bold': True},
+            'format_date_bold': {
+                'align': 'left', 'bold': True, 'num_format': date_format},
+            # formats for worksheet table column headers
+            'format_theader_yellow': theader_yellow,
+            'format_theader_yellow_center': dict(
+                theader_yellow, align='center'),
+            'format_theader_yellow_right': dict(
+                theader_yellow, align='right'),
+            'format_theader_blue': theader_blue,
+            'format_theader_blue_center': dict(theader_blue, align='center'),
+            'format_theader_blue_right': dict(theader_blue, align='right'),
+            # formats for worksheet table cells
+            'format_tleft': dict(border, align='left'),
+            'format_tcenter': dict(border, align='center'),
+            'format_tright': dict(border, align='right'),
+            'format_tdate': dict(
+                border, align='left', num_format=date_format),
+            'format_tleft_bold': dict(border, align='left', bold=True),
+            'format_tcenter_bold': dict(border, align='center', bold=True),
+            'format_tright_bold': dict(border, align='right', bold=True),
+            'format_tdate_bold': dict(
+                border, align='left', bold=True, num_format=date_format),
+        }
+
+        # amount, percent and integer formats
+        num_formats = [
+            ('amount', num_format, num_format_conditional),
+            ('percent', pct_format, pct_format_conditional),
+            ('integer', int_format, int_format_conditional),
+        ]
+        for name, fmt, fmt_conditional in num_formats:
+            for suffix, f in [('', fmt), ('_conditional', fmt_conditional)]:
+                res.update({
+                    'format_%s%s' % (name, suffix): {
+                        'align': 'right', 'num_format': f},
+                    'format_%s_bold%s' % (name, suffix): {
+                        'align': 'right', 'bold': True, 'num_format': f},
+                    'format_theader_yellow_%s%s' % (name, suffix): dict(
+                        theader_yellow, num_format=f),
+                    'format_theader_blue_%s%s' % (name, suffix): dict(
+                        theader_blue, num_format=f),
+                    'format_t%s%s' % (name, suffix): dict(
+                        border, num_format=f),
+                    'format_t%s_bold%s' % (name, suffix): dict(
+                        border, bold=True, num_format=f),
+                })
+        return res
+
+    def _get_format(self, name):
+        """
+        Return the workbook format with name 'name'.
+        The format is added to the workbook on first use.
+        Format definitions with identical properties share the same
+        workbook format.
+        """
+        fmt = self._formats.get(name)
+        if fmt is None:
+            properties = self._format_definitions[name]
+            key = tuple(sorted(properties.items()))
+            fmt = self._formats_by_properties.get(key)
+            if fmt is None:
+                fmt = self._workbook.add_format(properties)
+                self._formats_by_properties[key] = fmt
+            self._formats[name] = fmt
+        return fmt
+
+    def __getattr__(self, name):
+        # pre-defined formats are available as 'self.format_xxx' attributes
+        if name.startswith('format_'):
+            definitions = self.__dict__.get('_format_definitions')
+            if definitions and name in definitions:
+                return self._get_format(name)
+        raise AttributeError(name)
 
     def _set_column_width(self, ws, ws_params):
         """
@@ -284,8 +405,53 @@ class AbstractReportXlsx(ReportXlsx):
         An empty cell will be written if no col_specs_section entry
         for a column.
         """
+        writers, defaults = self._get_line_writers(
+            ws, ws_params, col_specs_section, default_format)
+        if render_space is None:
+            render_space = {}
+        for k in defaults:
+            if k not in render_space:
+                render_space[k] = defaults[k]
+        for writer in writers:
+            writer(row_pos, render_space)
+        report_progress()
+        return row_pos + 1
+
+    def _get_line_writers(self, ws, ws_params, col_specs_section,
+                          default_format):
+        """
+        Return the compiled writers of a line and the default
+        render_space entries of these writers.
+        The writers are cached in the ws_params dict since
+        the report object is shared between report runs.
+        """
+        cache = ws_params.setdefault('_line_writers', {})
+        key = (ws, col_specs_section, default_format)
+        res = cache.get(key)
+        if res is None:
+            res = cache[key] = self._compile_line(
+                ws, ws_params, col_specs_section, default_format)
+        return res
+
+    def _compile_line(self, ws, ws_params, col_specs_section,
+                      default_format):
+        """
+        Compile the columns included in the 'wanted_list' into a tuple
+        of writer functions with signature (row_pos, render_space).
+        The col_specs lookups, the cell type of static values and the
+        worksheet write method are resolved once per line definition.
+        CodeType values and formats are evaluated against the render_space
+        of the line, cf. _eval for the use of eval.
+
+        Returns the writers and the default render_space entries:
+        'datetime' and the pre-defined formats referred to by name
+        in the CodeType cells.
+        """
         col_specs = ws_params.get('col_specs')
         wl = ws_params.get('wanted_list') or []
+        definitions = self.__dict__.get('_format_definitions') or {}
+        defaults = {'datetime': datetime}
+        writers = []
         pos = 0
         for col in wl:
             if col not in col_specs:
@@ -296,53 +462,104 @@ class AbstractReportXlsx(ReportXlsx):
                     % (__name__, col))
             colspan = col_specs[col].get('colspan') or 1
             cell_spec = col_specs[col].get(col_specs_section) or {}
-            if not cell_spec:
-                cell_value = None
-                cell_type = 'blank'
-                cell_format = default_format
-            else:
-                cell_value = cell_spec.get('value')
-                if isinstance(cell_value, CodeType):
-                    cell_value = self._eval(cell_value, render_space)
-                cell_type = cell_spec.get('type')
-                cell_format = cell_spec.get('format') or default_format
-                if not cell_type:
-                    if isinstance(cell_value, basestring):
-                        cell_type = 'string'
-                    elif isinstance(cell_value, (int, float)):
-                        cell_type = 'number'
-                    elif isinstance(cell_value, bool):
-                        cell_type = 'boolean'
-                    elif isinstance(cell_value, datetime):
-                        cell_type = 'datetime'
-                    else:
-                        if not cell_value:
-                            cell_type = 'blank'
-                        else:
-                            msg = _(
-                                "%s, _write_line : programming error "
-                                "detected while processing "
-                                "col_specs_section %s, column %s"
-                            ) % (__name__, col_specs_section, col)
-                            if cell_value:
-                                msg += _(", cellvalue %s")
-                            raise UserError(msg)
             colspan = cell_spec.get('colspan') or colspan
-            args_pos = [row_pos, pos]
-            args_data = [cell_value]
+            writers.append(self._compile_cell(
+                ws, pos, colspan, cell_spec, default_format,
+                col_specs_section, col))
+            for code in [cell_spec.get('value'), cell_spec.get('format')]:
+                if isinstance(code, CodeType):
+                    for name in code.co_names:
+                        if name in definitions:
+                            defaults[name] = self._get_format(name)
+            pos += colspan
+        return tuple(writers), defaults
+
+    def _compile_cell(self, ws, pos, colspan, cell_spec, default_format,
+                      col_specs_section, col):
+        if not cell_spec:
+            cell_value = None
+            cell_type = 'blank'
+            cell_format = default_format
+        else:
+            cell_value = cell_spec.get('value')
+            cell_type = cell_spec.get('type')
+            cell_format = cell_spec.get('format') or default_format
+        if isinstance(cell_format, basestring):
+            # pre-defined format name
+            cell_format = self._get_format(cell_format)
+        value_code = isinstance(cell_value, CodeType)
+        format_code = isinstance(cell_format, CodeType)
+        if not cell_type and not value_code:
+            cell_type = self._get_cell_type(
+                cell_value, col_specs_section, col)
+
+        if colspan == 1 and cell_type and not format_code:
+            ws_method = getattr(ws, 'write_%s' % cell_type)
+            if not value_code:
+                # static cell
+                args = [cell_value]
+                if cell_format:
+                    args.append(cell_format)
+
+                def writer(row_pos, render_space):
+                    ws_method(row_pos, pos, *args)
+
+            elif cell_format:
+
+                def writer(row_pos, render_space):
+                    ws_method(row_pos, pos, eval(cell_value, render_space),
+                              cell_format)
+
+            else:
+
+                def writer(row_pos, render_space):
+                    ws_method(row_pos, pos, eval(cell_value, render_space))
+
+            return writer
+
+        get_cell_type = self._get_cell_type
+
+        def writer(row_pos, render_space):
+            if value_code:
+                value = eval(cell_value, render_space)
+            else:
+                value = cell_value
+            args_data = [value]
             if cell_format:
-                args_data.append(cell_format)
+                if format_code:
+                    args_data.append(eval(cell_format, render_space))
+                else:
+                    args_data.append(cell_format)
             if colspan > 1:
-                args_pos += [row_pos, pos + colspan - 1]
-                args = args_pos + args_data
-                ws.merge_range(*args)
+                ws.merge_range(
+                    row_pos, pos, row_pos, pos + colspan - 1, *args_data)
             else:
-                ws_method = getattr(ws, 'write_%s' % cell_type)
-                args = args_pos + args_data
-                ws_method(*args)
-            pos += colspan
+                ws_type = cell_type \
+                    or get_cell_type(value, col_specs_section, col)
+                getattr(ws, 'write_%s' % ws_type)(row_pos, pos, *args_data)
 
-        return row_pos + 1
+        return writer
+
+    @staticmethod
+    def _get_cell_type(cell_value, col_specs_section, col):
+        if isinstance(cell_value, basestring):
+            return 'string'
+        elif isinstance(cell_value, (int, float)):
+            return 'number'
+        elif isinstance(cell_value, bool):
+            return 'boolean'
+        elif isinstance(cell_value, datetime):
+            return 'datetime'
+        elif not cell_value:
+            return 'blank'
+        msg = _(
+            "%s, _write_line : programming error "
+            "detected while processing "
+            "col_specs_section %s, column %s"
+        ) % (__name__, col_specs_section, col)
+        if cell_value:
+            msg += _(", cellvalue %s")
+        raise UserError(msg)
 
     @staticmethod
     def _render(code):
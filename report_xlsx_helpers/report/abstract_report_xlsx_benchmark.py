@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""
+Benchmark of the xlsx rendering throughput of xlsx reports.
+
+The report lines are generated and written to an in-memory workbook,
+nothing is stored in the database.
+
+    python abstract_report_xlsx_benchmark.py -c <odoo config> -d <database>
+        [--template synthetic|stock_level|vat_listing]
+        [--rows 100000] [--cols 20] [--constant-memory]
+
+The synthetic template has 'cols' columns with a mix of string, number,
+formula and CodeType cells and measures the AbstractReportXlsx class
+of this module.
+The stock_level and vat_listing templates write generated lines via the
+report classes of the stock_level_export_xls and l10n_be_coa_multilang
+modules, including their _write_line methods, and require these modules
+to be installed in the database.
+The peak memory is the maximum resident set size of the process.
+"""
+
+import argparse
+from io import BytesIO
+import resource
+import time
+
+import xlsxwriter
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.report.interface import report_int
+
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import AbstractReportXlsx
+
+
+class BenchmarkReportXlsx(AbstractReportXlsx):
+
+    def _get_ws_params(self, workbook, data, objects):
+        cols = data['cols']
+        col_specs = {}
+        for i in xrange(cols):
+            kind = i % 4
+            if kind == 0:
+                lines = {'type': 'string', 'value': 'string %s' % i}
+            elif kind == 1:
+                lines = {
+                    'type': 'number',
+                    'value': self._render("line['amount']"),
+                    'format': self.format_tamount,
+                }
+            elif kind == 2:
+                lines = {
+                    'type': 'formula',
+                    'value': self._render("formula"),
+                    'format': self.format_tamount,
+                }
+            else:
+                lines = {
+                    'value': self._render("line['name']"),
+                    'format': self._render("format_tleft"),
+                }
+            col_specs['col%s' % i] = {
+                'header': {'value': 'Column %s' % i},
+                'lines': lines,
+                'width': 14,
+            }
+        return [{
+            'ws_name': 'Benchmark',
+            'generate_ws_method': '_generate_benchmark',
+            'title': 'Benchmark',
+            'wanted_list': ['col%s' % i for i in xrange(cols)],
+            'col_specs': col_specs,
+        }]
+
+
+BenchmarkReportXlsx(
+    'report.report_xlsx_helpers.benchmark', 'res.users')
+
+
+class _Record(object):
+    """
+    Stand-in for the records in the render_space of the report lines.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def _synthetic(env, report, workbook, args):
+    ws_params = report._get_ws_params(workbook, {'cols': args.cols}, None)[0]
+
+    def lines():
+        for i in xrange(args.rows):
+            yield {
+                'line': {'name': u'Line %s' % i, 'amount': i * 1.5},
+                'formula': report._rowcol_to_cell(i + 1, 1) + '*2',
+            }
+    return ws_params, lines(), (
+        report.format_theader_yellow, report.format_tleft)
+
+
+def _stock_level(env, report, workbook, args):
+    products = env['product.product'].search([], limit=1000)
+    locations = env['stock.location'].search(
+        [('usage', '=', 'internal')], limit=10)
+    if not products or not locations:
+        raise SystemExit("No products or internal locations in the database")
+    wl = env['product.product']._stock_level_export_xls_fields()
+    for x in ['location', 'location_id', 'product_id', 'product_uom_id']:
+        if x not in wl:
+            wl.append(x)
+    ws_params = {
+        'wanted_list': wl,
+        'col_specs': report._get_template(),
+    }
+    cost_pos = 'cost_at_date' in wl and wl.index('cost_at_date')
+    quantity_pos = 'quantity' in wl and wl.index('quantity')
+
+    def lines():
+        for i in xrange(args.rows):
+            row_pos = i + 1
+            yield {
+                'line': {
+                    'product': products[i % len(products)],
+                    'location': locations[i % len(locations)],
+                    'qty_available_at_date': float(i % 100),
+                    'cost_at_date': 1.25,
+                },
+                'stock_value_formula': '%s*%s' % (
+                    report._rowcol_to_cell(row_pos, cost_pos),
+                    report._rowcol_to_cell(row_pos, quantity_pos)),
+                'format_tcell_center': report.format_tcell_center,
+                'format_tcell_right': report.format_tcell_right,
+                'format_tcell_amount_right':
+                    report.format_tcell_amount_right,
+            }
+    return ws_params, lines(), (
+        report.format_theader_yellow_left, report.format_tcell_left)
+
+
+def _vat_listing(env, report, workbook, args):
+    listing = _Record(year='2018', _description='Benchmark')
+    ws_params = report._get_ws_params(workbook, {}, listing)[0]
+
+    def lines():
+        for i in xrange(args.rows):
+            yield {
+                'seq': i + 1,
+                'c': _Record(
+                    vat='BE%010d' % i,
+                    partner_id=_Record(name=u'Partner %s' % i),
+                    base_amount=i * 10.0,
+                    vat_amount=i * 2.1),
+            }
+    return ws_params, lines(), (
+        report.format_theader_yellow_left, report.format_tcell_left)
+
+
+TEMPLATES = {
+    'synthetic': ('report.report_xlsx_helpers.benchmark', _synthetic),
+    'stock_level': ('report.stock.level.xls', _stock_level),
+    'vat_listing': (
+        'report.l10n_be_coa_multilang.report_l10n_be_vat_listing_xlsx',
+        _vat_listing),
+}
+
+
+def _maxrss():
+    # ru_maxrss is expressed in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(env, args):
+    report_name, get_lines = TEMPLATES[args.template]
+    report = report_int._reports.get(report_name)
+    if not report:
+        raise SystemExit("Report %s is not installed" % report_name)
+    report.env = env
+    fp = BytesIO()
+    if args.constant_memory:
+        options = {'constant_memory': True}
+    else:
+        options = {'in_memory': True}
+    workbook = xlsxwriter.Workbook(fp, options)
+    report._define_formats(workbook)
+    ws_params, lines, formats = get_lines(env, report, workbook, args)
+    header_format, line_format = formats
+    ws = workbook.add_worksheet('Benchmark')
+    report._set_column_width(ws, ws_params)
+    rss_start = _maxrss()
+
+    start = time.time()
+    row_pos = report._write_line(
+        ws, 0, ws_params, col_specs_section='header',
+        default_format=header_format)
+    for render_space in lines:
+        row_pos = report._write_line(
+            ws, row_pos, ws_params, col_specs_section='lines',
+            render_space=render_space,
+            default_format=line_format)
+    write_duration = time.time() - start
+    start = time.time()
+    workbook.close()
+    close_duration = time.time() - start
+
+    rows = row_pos - 1
+    cols = len(ws_params['wanted_list'])
+    duration = write_duration + close_duration
+    print('%s: %d rows x %d columns' % (args.template, rows, cols))
+    print('write %.2fs (%d rows/s), close %.2fs, total %.2fs (%d rows/s)' % (
+        write_duration, rows / write_duration, close_duration,
+        duration, rows / duration))
+    print('file size %.1f MB, peak memory %.1f MB (+%.1f MB)' % (
+        fp.tell() / 1048576.0, _maxrss(), _maxrss() - rss_start))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of xlsx reports")
+    parser.add_argument(
+        '--template', choices=sorted(TEMPLATES), default='synthetic')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument(
+        '--cols', type=int, default=20,
+        help="number of columns of the synthetic template")
+    parser.add_argument('--constant-memory', action='store_true')
+    args, odoo_args = parser.parse_known_args()
+    odoo.tools.config.parse_config(odoo_args)
+    dbname = odoo.tools.config['db_name']
+    if not dbname:
+        raise SystemExit("Specify the database via -d")
+    registry = odoo.registry(dbname)
+    cr = registry.cursor()
+    try:
+        env = api.Environment(cr, SUPERUSER_ID, {'lang': 'en_US'})
+        run(env, args)
+    finally:
+        cr.rollback()
+        cr.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+from . import test_report_xlsx_queue
+from . import test_report_xlsx_cache
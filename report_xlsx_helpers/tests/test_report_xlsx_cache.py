@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from datetime import datetime, timedelta
+
+from mock import patch
+
+import odoo
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import AbstractReportXlsx, CACHE_RES_MODEL
+
+
+class CacheTestReportXlsx(AbstractReportXlsx):
+    _cache_ttl = 3600
+    _cache_size = 2
+    _cache_models = ['res.partner']
+
+    def _get_ws_params(self, workbook, data, objects):
+        col_specs = {
+            'login': {
+                'header': {'value': 'Login'},
+                'lines': {'value': self._render("user.login")},
+                'width': 20,
+            },
+        }
+        return [{
+            'ws_name': 'Users',
+            'generate_ws_method': '_generate_users',
+            'wanted_list': ['login'],
+            'col_specs': col_specs,
+        }]
+
+    def _generate_users(self, workbook, ws, ws_params, data, objects):
+        self._set_column_width(ws, ws_params)
+        row_pos = self._write_line(
+            ws, 0, ws_params, col_specs_section='header',
+            default_format=self.format_theader_yellow)
+        for user in objects:
+            row_pos = self._write_line(
+                ws, row_pos, ws_params, col_specs_section='lines',
+                render_space={'user': user},
+                default_format=self.format_tleft)
+
+
+CacheTestReportXlsx(
+    'report.report_xlsx_helpers.cache_test', 'res.users')
+
+
+class TestReportXlsxCache(TransactionCase):
+
+    def setUp(self):
+        super(TestReportXlsxCache, self).setUp()
+        self.users = self.env['res.users'].search([], limit=3)
+        patcher = patch.object(
+            CacheTestReportXlsx, 'create_xlsx_report', autospec=True,
+            side_effect=AbstractReportXlsx.create_xlsx_report)
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _render(self, data=None):
+        return odoo.report.render_report(
+            self.env.cr, self.env.uid, self.users.ids,
+            'report_xlsx_helpers.cache_test', data or {},
+            context={'xlsx_export': True})
+
+    def _get_cached(self):
+        return self.env['ir.attachment'].search(
+            [('res_model', '=', CACHE_RES_MODEL)], order='id')
+
+    def _set_dates(self, cached, hours, fname='write_date'):
+        date = fields.Datetime.to_string(
+            datetime.now() - timedelta(hours=hours))
+        self.env.cr.execute(
+            "UPDATE ir_attachment SET %s = %%s WHERE id IN %%s" % fname,
+            (date, tuple(cached.ids)))
+        cached.invalidate_cache()
+
+    def test_cache_hit(self):
+        content, fmt = self._render()
+        self.assertEqual(fmt, 'xlsx')
+        self.assertEqual(content[:4], 'PK\x03\x04')
+        self.assertEqual(len(self._get_cached()), 1)
+        self.assertEqual(self._render(), (content, fmt))
+        self.assertEqual(self.generate.call_count, 1)
+        self._render(data={'option': 1})
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertEqual(len(self._get_cached()), 2)
+
+    def test_cache_version(self):
+        self._render()
+        self.env['res.partner'].create({'name': 'Report Cache Test'})
+        self._render()
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_cache_ttl_expiry(self):
+        self._render()
+        cached = self._get_cached()
+        self._set_dates(cached, 2, fname='create_date')
+        self._render()
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertFalse(cached.exists())
+        self.assertEqual(len(self._get_cached()), 1)
+
+    def test_cache_lru_eviction(self):
+        self._render(data={'option': 1})
+        self._render(data={'option': 2})
+        cached_1, cached_2 = self._get_cached()
+        self._set_dates(cached_1, 0.2)
+        self._set_dates(cached_2, 0.1)
+        # cache hit, cached_1 becomes the most recently used file
+        self._render(data={'option': 1})
+        self.assertEqual(self.generate.call_count, 2)
+        self._render(data={'option': 3})
+        self.assertEqual(self.generate.call_count, 3)
+        self.assertTrue(cached_1.exists())
+        self.assertFalse(cached_2.exists())
+        self.assertEqual(len(self._get_cached()), 2)
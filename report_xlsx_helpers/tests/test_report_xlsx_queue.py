@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import base64
+
+from mock import patch
+
+from odoo.exceptions import AccessError
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import AbstractReportXlsx
+
+
+class QueueTestReportXlsx(AbstractReportXlsx):
+
+    def _get_ws_params(self, workbook, data, objects):
+        col_specs = {
+            'login': {
+                'header': {'value': 'Login'},
+                'lines': {'value': self._render("user.login")},
+                'width': 20,
+            },
+            'name': {
+                'header': {'value': 'Name'},
+                'lines': {'value': self._render("user.name")},
+                'width': 40,
+            },
+        }
+        return [{
+            'ws_name': 'Users',
+            'generate_ws_method': '_generate_users',
+            'wanted_list': ['login', 'name'],
+            'col_specs': col_specs,
+        }]
+
+    def _generate_users(self, workbook, ws, ws_params, data, objects):
+        self._set_column_width(ws, ws_params)
+        row_pos = self._write_line(
+            ws, 0, ws_params, col_specs_section='header',
+            default_format=self.format_theader_yellow)
+        for user in objects:
+            row_pos = self._write_line(
+                ws, row_pos, ws_params, col_specs_section='lines',
+                render_space={'user': user},
+                default_format=self.format_tleft)
+
+
+QueueTestReportXlsx(
+    'report.report_xlsx_helpers.queue_test', 'res.users')
+
+
+class TestReportXlsxQueue(TransactionCase):
+
+    def setUp(self):
+        super(TestReportXlsxQueue, self).setUp()
+        self.queue_model = self.env['report.xlsx.queue']
+        # the queue processing commits after every report
+        for method in ['commit', 'rollback']:
+            patcher = patch.object(self.env.cr, method)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_progress(self, job):
+        """
+        The progress is written via a separate cursor,
+        hence it is not visible in the test transaction.
+        """
+        with self.registry.cursor() as cr:
+            cr.execute(
+                "SELECT rows_written FROM report_xlsx_queue_progress "
+                "WHERE queue_id = %s", (job.id,))
+            res = cr.fetchone()
+            cr.execute(
+                "DELETE FROM report_xlsx_queue_progress "
+                "WHERE queue_id = %s", (job.id,))
+        return res and res[0]
+
+    def test_cron_process_queue(self):
+        users = self.env['res.users'].search([], limit=3)
+        action = self.queue_model.enqueue(
+            'report_xlsx_helpers.queue_test', users.ids, name='Users')
+        job = self.queue_model.browse(action['res_id'])
+        self.assertEqual(job.state, 'queued')
+
+        self.queue_model._cron_process_queue()
+        self.assertEqual(job.state, 'done', job.error)
+        self.assertEqual(job.attachment_id.datas_fname, 'Users.xlsx')
+        content = base64.b64decode(job.attachment_id.datas)
+        self.assertEqual(content[:4], 'PK\x03\x04')
+        self.assertTrue(job.message_ids)
+        # header line and a line per user
+        self.assertEqual(self._get_progress(job), len(users) + 1)
+
+    def test_user_access(self):
+        user = self.env['res.users'].create({
+            'name': 'Report Queue Test User',
+            'login': 'report_xlsx_queue_test_user',
+            'groups_id': [(6, 0, [self.env.ref('base.group_user').id])],
+        })
+        queue_model = self.queue_model.sudo(user)
+        action = queue_model.enqueue(
+            'report_xlsx_helpers.queue_test', user.ids, name='User')
+        job = queue_model.browse(action['res_id'])
+        self.assertEqual(job.user_id, user)
+        self.assertEqual(job.state, 'queued')
+        with self.assertRaises(AccessError):
+            job.write({'state': 'done'})
@@ -9,7 +9,7 @@
     'author': 'Noviat',
     'website': 'http://www.noviat.com',
     'category': 'Warehouse Management',
-    'depends': ['stock', 'report_xlsx_helper'],
+    'depends': ['stock', 'report_xlsx_helper', 'report_xlsx_helpers'],
     'data': [
         'wizard/wiz_export_stock_level.xml',
     ],
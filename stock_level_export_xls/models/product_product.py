@@ -3,7 +3,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import logging
-from odoo import api, models
+from odoo import api, fields, models
 # Copy commented lines infra to your custom module if you want
 # to modify the excel template for your own specific needs.
 # from odoo.addons.report_xlsx_helper.report.abstract_report_xlsx \
@@ -41,12 +41,28 @@ class ProductProduct(models.Model):
           A redesign of the 'stock.history' report is required
           to make this report usable on real production level databases.
         """
+        costs = self._get_history_prices(
+            self.env.context['force_company'], date=stock_level_date)
         for product in self:
-            # the get_history_price method has no proper multi record support
-            # hence we need this for loop
-            cost = product.get_history_price(self.env.context['force_company'],
-                                             date=stock_level_date)
-            res[product.id]['cost'] = cost
+            res[product.id]['cost'] = costs.get(product.id, 0.0)
+
+    @api.multi
+    def _get_history_prices(self, company_id, date=None):
+        """
+        Multi record version of the get_history_price method.
+        Returns a dict with the cost at date per product id,
+        products without price history are not included.
+        """
+        if not self.ids:
+            return {}
+        self.env.cr.execute(
+            "SELECT DISTINCT ON (product_id) product_id, cost "
+            "FROM product_price_history "
+            "WHERE company_id = %s AND product_id IN %s "
+            "AND datetime <= %s "
+            "ORDER BY product_id, datetime DESC, id DESC",
+            (company_id, tuple(self.ids), date or fields.Datetime.now()))
+        return {x[0]: x[1] or 0.0 for x in self.env.cr.fetchall()}
 
     @api.multi
     def _compute_cost_and_qty_available_at_date(self):
@@ -64,6 +80,86 @@ class ProductProduct(models.Model):
             self._get_cost_at_date(res, to_date)
         return res
 
+    @api.multi
+    def _compute_qty_available_per_warehouse(self, warehouses):
+        """
+        Quantity on hand per (product, warehouse) at the 'to_date' of the
+        context, computed with a single grouped query on the quants and,
+        for dates in the past, a grouped query on the incoming and
+        outgoing moves done after that date.
+        The result is equal to the 'qty_available' of the
+        _compute_quantities_dict method with a 'warehouse' context
+        (before rounding).
+        Only the non-zero quantities are returned.
+        """
+        if not self.ids or not warehouses:
+            return {}
+        ctx = self.env.context
+        to_date = ctx.get('to_date')
+        args = {
+            'product_ids': tuple(self.ids),
+            'warehouse_ids': tuple(warehouses.ids),
+            'company_id': ctx.get('force_company'),
+            'lot_id': ctx.get('lot_id'),
+            'owner_id': ctx.get('owner_id'),
+            'package_id': ctx.get('package_id'),
+            'to_date': to_date,
+        }
+        in_wh = "{0}.parent_left >= vl.parent_left " \
+                "AND {0}.parent_left < vl.parent_right"
+
+        quant_where = ""
+        if args['company_id']:
+            quant_where += "AND q.company_id = %(company_id)s "
+        if args['lot_id']:
+            quant_where += "AND q.lot_id = %(lot_id)s "
+        if args['owner_id']:
+            quant_where += "AND q.owner_id = %(owner_id)s "
+        if args['package_id']:
+            quant_where += "AND q.package_id = %(package_id)s "
+        self.env.cr.execute(
+            "SELECT q.product_id, w.id, SUM(q.qty) "
+            "FROM stock_quant q "
+            "JOIN stock_location l ON l.id = q.location_id "
+            "JOIN stock_warehouse w ON w.id IN %(warehouse_ids)s "
+            "JOIN stock_location vl ON vl.id = w.view_location_id "
+            "WHERE q.product_id IN %(product_ids)s "
+            "AND " + in_wh.format('l') + " " + quant_where +
+            "GROUP BY q.product_id, w.id",
+            args)
+        res = {}
+        for product_id, warehouse_id, qty in self.env.cr.fetchall():
+            res[(product_id, warehouse_id)] = qty
+
+        if to_date and to_date < fields.Datetime.now():
+            move_where = ""
+            if args['company_id']:
+                move_where += "AND m.company_id = %(company_id)s "
+            if args['owner_id']:
+                move_where += "AND m.restrict_partner_id = %(owner_id)s "
+            moves_in = (
+                in_wh.format('ld') + " AND NOT (" + in_wh.format('ls') + ")")
+            moves_out = (
+                in_wh.format('ls') + " AND NOT (" + in_wh.format('ld') + ")")
+            for move_cond, sign in [(moves_in, -1), (moves_out, 1)]:
+                self.env.cr.execute(
+                    "SELECT m.product_id, w.id, SUM(m.product_qty) "
+                    "FROM stock_move m "
+                    "JOIN stock_location ls ON ls.id = m.location_id "
+                    "JOIN stock_location ld ON ld.id = m.location_dest_id "
+                    "JOIN stock_warehouse w ON w.id IN %(warehouse_ids)s "
+                    "JOIN stock_location vl ON vl.id = w.view_location_id "
+                    "WHERE m.product_id IN %(product_ids)s "
+                    "AND m.state = 'done' AND m.date > %(to_date)s "
+                    "AND " + move_cond + " " + move_where +
+                    "GROUP BY m.product_id, w.id",
+                    args)
+                for product_id, warehouse_id, qty in self.env.cr.fetchall():
+                    key = (product_id, warehouse_id)
+                    res[key] = res.get(key, 0.0) + sign * qty
+
+        return {k: v for k, v in res.iteritems() if v}
+
     @api.model
     def _stock_level_export_xls_fields(self):
         """
@@ -5,13 +5,17 @@
 # TO REMOVE after merge of https://github.com/OCA/reporting-engine/pull/251
 from types import CodeType
 from datetime import datetime
+from itertools import chain
 
 import logging
 
 from odoo import fields, _
+from odoo.tools import float_round
 from odoo.tools.translate import translate
 from odoo.addons.report_xlsx_helper.report.abstract_report_xlsx \
     import AbstractReportXlsx
+from odoo.addons.report_xlsx_helpers.report.abstract_report_xlsx \
+    import report_progress
 from odoo.exceptions import UserError
 from odoo.report import report_sxw
 
@@ -29,6 +33,12 @@ class StockLevelXls(AbstractReportXlsx):
             self.env.cr, IR_TRANSLATION_NAME, 'report', lang, src) or src
         return val
 
+    def get_workbook_options(self):
+        options = super(StockLevelXls, self).get_workbook_options()
+        if self.env.context.get('xlsx_constant_memory'):
+            options = dict(options, constant_memory=True)
+        return options
+
     def _define_formats(self, wb):
         super(StockLevelXls, self)._define_formats(wb)
         # TODO: create PR on report_xlsx_helper to add
@@ -61,6 +71,7 @@ class StockLevelXls(AbstractReportXlsx):
         })
         ws_params = []
         if len(warehouses) > 1:
+            self._compute_warehouse_stock(data, wiz)
             # create "all warehouses" overview report
             ws_params.append(self._get_warehouse_ws_params(
                 wb, data, wiz, self.env['stock.warehouse']))
@@ -70,8 +81,62 @@ class StockLevelXls(AbstractReportXlsx):
                 ws_params.append(params)
         return ws_params
 
+    def _compute_warehouse_stock(self, data, wiz):
+        """
+        Compute the stock of all warehouses in a single pass.
+        The result is used for the "all warehouses" overview
+        as well as for the warehouse reports,
+        cf. _get_warehouse_cost_qty.
+        """
+        ctx = self._get_stock_data_context(data, wiz, False)
+        products = self.env['product.product'].with_context(ctx).search(
+            self._xls_export_domain(wiz))
+        data['warehouse_qtys'] = \
+            products._compute_qty_available_per_warehouse(data['warehouses'])
+        if wiz.add_cost:
+            data['costs'] = products._get_history_prices(
+                wiz.company_id.id, date=ctx['to_date'])
+
+    def _get_warehouse_cost_qty(self, products, data, warehouse):
+        """
+        Return cost and quantity per product in the format of the
+        _compute_cost_and_qty_available_at_date method
+        from the stock computed by _compute_warehouse_stock.
+        """
+        qtys = data['warehouse_qtys']
+        costs = data.get('costs')
+        warehouse_ids = warehouse and [warehouse.id] \
+            or data['warehouses'].ids
+        res = {}
+        for product in products:
+            qty = sum([qtys.get((product.id, wh_id), 0.0)
+                       for wh_id in warehouse_ids])
+            res[product.id] = {
+                'qty_available': float_round(
+                    qty, precision_rounding=product.uom_id.rounding),
+            }
+            if costs is not None:
+                res[product.id]['cost'] = costs.get(product.id, 0.0)
+        return res
+
     def _get_warehouse_ws_params(self, wb, data, wiz, warehouse):
-        report_lines = self._get_stock_data(data, wiz, warehouse)
+        if wiz.low_memory:
+            chunks = self._iter_stock_data(data, wiz, warehouse)
+        else:
+            chunks = [self._get_stock_data(data, wiz, warehouse)]
+        if wiz.import_compatible:
+            all_locations = self.env['stock.location'].search(
+                [('id', 'child_of', [wiz.location_id.id])])
+            if all_locations != wiz.location_id:
+                chunks = (
+                    self._report_lines_per_location(x, all_locations, wiz)
+                    for x in chunks)
+        if wiz.low_memory:
+            lines = chain.from_iterable(chunks)
+            first = next(lines, None)
+            report_lines = first and chain([first], lines) or []
+        else:
+            report_lines = list(chain.from_iterable(chunks))
         if warehouse:
             sheet_name = warehouse.name
             report_name = self._("Warehouse") + ' ' + sheet_name + ' - '
@@ -92,11 +157,6 @@ class StockLevelXls(AbstractReportXlsx):
                       'product_id', 'product_uom_id']:
                 if x not in wl:
                     wl.append(x)
-            all_locations = self.env['stock.location'].search(
-                [('id', 'child_of', [wiz.location_id.id])])
-            if all_locations != wiz.location_id:
-                report_lines = self._report_lines_per_location(
-                    report_lines, all_locations, wiz)
 
         if not wiz.add_cost:
             if 'cost_at_date' in wl:
@@ -159,10 +219,31 @@ class StockLevelXls(AbstractReportXlsx):
         product_domain = self._xls_export_domain(wiz)
         products = self.env['product.product'].with_context(ctx).search(
             product_domain)
+        return self._get_product_lines(products, wiz, data, warehouse)
+
+    def _iter_stock_data(self, data, wiz, warehouse, chunk_size=1000):
+        """
+        Generator of the report lines in chunks of 'chunk_size' products
+        in order to limit the memory usage of large exports.
+        """
+        ctx = self._get_stock_data_context(data, wiz, warehouse)
+        product_domain = self._xls_export_domain(wiz)
+        prod_mod = self.env['product.product'].with_context(ctx)
+        product_ids = prod_mod.search(product_domain).ids
+        for i in xrange(0, len(product_ids), chunk_size):
+            products = prod_mod.browse(product_ids[i:i + chunk_size])
+            yield self._get_product_lines(products, wiz, data, warehouse)
+            # release the records of this chunk from the cache
+            self.env.invalidate_all()
+
+    def _get_product_lines(self, products, wiz, data, warehouse):
         product_lines = [
             {'product': product, 'location': wiz.location_id}
             for product in products]
-        cost_qty = products._compute_cost_and_qty_available_at_date()
+        if 'warehouse_qtys' in data:
+            cost_qty = self._get_warehouse_cost_qty(products, data, warehouse)
+        else:
+            cost_qty = products._compute_cost_and_qty_available_at_date()
         report_lines = []
         for line in product_lines:
             product = line['product']
@@ -181,32 +262,42 @@ class StockLevelXls(AbstractReportXlsx):
         Query on quants to split out the lines per location.
         This is a refinement of the first query which sums up
         child location quantities into the parent location.
-        This approach is as a consequence not optimal from a performance
-        standpoint but acceptable since it's only called for
-        inventory update purposes ('import_compatible' flag set)
-        and hence never company wide (parent location is a required field
-        for inventory update export).
-        Combining this query into the first query would make this first query
-        more complex and as a consequence slower and harder to maintain.
+        The quantities of all products and locations are retrieved
+        with a single query grouped by (product_id, location_id),
+        the split per location is done in memory.
+        This method is only called for inventory update purposes
+        ('import_compatible' flag set) and hence never company wide
+        (parent location is a required field for inventory update export).
         """
-        if all_locations == wiz.location_id:
+        if all_locations == wiz.location_id or not lines_in:
             return lines_in
-        lines_out = []
-        dom = [('company_id', '=', wiz.company_id.id)]
+        query = (
+            "SELECT product_id, location_id, SUM(qty) "
+            "FROM stock_quant "
+            "WHERE company_id = %s "
+            "AND location_id IN %s AND product_id IN %s ")
+        args = [wiz.company_id.id, tuple(all_locations.ids),
+                tuple([l['product'].id for l in lines_in])]
         if wiz.lot_id:
-            dom.append(('prod_lot_id', '=', wiz.lot_id.id))
+            query += "AND lot_id = %s "
+            args.append(wiz.lot_id.id)
         if wiz.owner_id:
-            dom.append(('owner_id', '=', wiz.owner_id.id))
+            query += "AND owner_id = %s "
+            args.append(wiz.owner_id.id)
         if wiz.package_id:
-            dom.append(('package_id', '=', wiz.package_id.id))
+            query += "AND package_id = %s "
+            args.append(wiz.package_id.id)
+        query += "GROUP BY product_id, location_id"
+        self.env.cr.execute(query, args)
+        qtys = {}
+        for product_id, location_id, qty in self.env.cr.fetchall():
+            qtys[(product_id, location_id)] = qty
+        lines_out = []
         for line_in in lines_in:
-            pdom = dom + [('product_id', '=', line_in['product'].id)]
+            product_id = line_in['product'].id
             for location in all_locations:
-                ldom = pdom + [('location_id', '=', location.id)]
-                qty = self.env['stock.quant'].read_group(
-                    ldom, ['qty', 'product_id'], ['product_id'])
-                if qty:
-                    qty = qty[0]['qty']
+                qty = qtys.get((product_id, location.id))
+                if qty is not None:
                     line_out = dict(
                         line_in, qty_available_at_date=qty, location=location)
                     lines_out.append(line_out)
@@ -485,7 +576,9 @@ class StockLevelXls(AbstractReportXlsx):
         ws.freeze_panes(row_pos, 0)
 
         # Report lines
+        line_cnt = 0
         for line in report_lines:
+            line_cnt += 1
             cost_cell = self._rowcol_to_cell(row_pos, cost_pos)
             quantity_cell = self._rowcol_to_cell(row_pos, quantity_pos)
             stock_value_formula = cost_cell + '*' + quantity_cell
@@ -511,7 +604,6 @@ class StockLevelXls(AbstractReportXlsx):
                 default_format=default_format)
 
         # Totals
-        line_cnt = len(report_lines)
         stock_value_start = self._rowcol_to_cell(
             row_pos - line_cnt, stock_value_pos)
         stock_value_stop = self._rowcol_to_cell(row_pos - 1, stock_value_pos)
@@ -595,6 +687,7 @@ class StockLevelXls(AbstractReportXlsx):
                 ws_method(*args)
             pos += colspan
 
+        report_progress()
         return row_pos + 1
 
 
@@ -65,6 +65,17 @@ class WizExportStockLevel(models.TransientModel):
              "stock value at the selected date but can be different from "
              "the effective stock Valuation since product cost may vary "
              "over time.")
+    low_memory = fields.Boolean(
+        string='Low Memory Export',
+        help="Process the products in chunks and write the Excel file "
+             "in constant memory mode."
+             "\nUse this option for exports with a large number "
+             "of products.")
+    background = fields.Boolean(
+        string='Generate in Background',
+        help="Generate the Excel file via a scheduled action."
+             "\nYou receive a notification with a download link "
+             "when the file is ready.")
     company_id = fields.Many2one(
         'res.company', string='Company', required=True,
         default=lambda self: self.env['res.company']._company_default_get(
@@ -95,13 +106,20 @@ class WizExportStockLevel(models.TransientModel):
                       "Stock Location "))
             warehouse_ids = [warehouse.id]
 
+        ctx = dict(self.env.context,
+                   xlsx_export=True,
+                   xlsx_constant_memory=self.low_memory,
+                   warehouse_ids=warehouse_ids)
+        if self.background:
+            return self.env['report.xlsx.queue'].with_context(
+                ctx).enqueue('stock.level.xls', [self.id],
+                             data={'ids': [self.id]},
+                             name=_('Stock Levels'))
         report = {
             'type': 'ir.actions.report.xml',
             'report_type': 'xlsx',
             'report_name': 'stock.level.xls',
-            'context': dict(self.env.context,
-                            xlsx_export=True,
-                            warehouse_ids=warehouse_ids),
+            'context': ctx,
             'datas': {'ids': [self.id]},
         }
         return report
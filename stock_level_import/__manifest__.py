@@ -9,7 +9,10 @@
     'author': 'Noviat',
     'website': 'http://www.noviat.com',
     'category': 'Warehouse Management',
-    'depends': ['stock'],
+    'depends': [
+        'stock',
+        'import_xlsx_helpers',
+    ],
     'data': [
         'views/stock_inventory.xml',
         'wizard/import_stock_level.xml',
@@ -1,2 +1,3 @@
 # -*- coding: utf-8 -*-
 from . import stock_inventory
+from . import stock_inventory_line
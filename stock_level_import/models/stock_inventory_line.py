@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models, _
+from odoo.exceptions import UserError
+
+
+class StockInventoryLine(models.Model):
+    _inherit = 'stock.inventory.line'
+
+    @api.multi
+    @api.depends('location_id', 'product_id', 'package_id',
+                 'product_uom_id', 'company_id', 'prod_lot_id', 'partner_id')
+    def _compute_theoretical_qty(self):
+        """
+        The inventory lines created by the stock level import
+        are computed in batch.
+        """
+        if not self._context.get('stock_level_import'):
+            return super(StockInventoryLine, self)._compute_theoretical_qty()
+        qtys = self._get_theoretical_qtys()
+        for line in self:
+            if not line.product_id:
+                line.theoretical_qty = 0
+                continue
+            qty = qtys.get(line._theoretical_qty_key(), 0.0)
+            product_uom = line.product_id.uom_id
+            if qty and line.product_uom_id \
+                    and product_uom != line.product_uom_id:
+                qty = product_uom._compute_quantity(qty, line.product_uom_id)
+            line.theoretical_qty = qty
+
+    @api.multi
+    def _theoretical_qty_key(self):
+        self.ensure_one()
+        return (self.company_id.id or None,
+                self.location_id.id or None,
+                self.product_id.id or None,
+                self.prod_lot_id.id or None,
+                self.package_id.id or None,
+                self.partner_id.id or None)
+
+    @api.multi
+    def _get_theoretical_qtys(self):
+        """
+        Returns the quant quantities of the inventory lines,
+        keyed by _theoretical_qty_key, via a single grouped query.
+        """
+        lines = self.filtered('product_id')
+        if not lines:
+            return {}
+        self._cr.execute(
+            "SELECT company_id, location_id, product_id, "
+            "lot_id, package_id, owner_id, SUM(qty) "
+            "FROM stock_quant "
+            "WHERE location_id IN %s AND product_id IN %s "
+            "GROUP BY company_id, location_id, product_id, "
+            "lot_id, package_id, owner_id",
+            (tuple(lines.mapped('location_id').ids),
+             tuple(lines.mapped('product_id').ids)))
+        return {x[:6]: x[6] for x in self._cr.fetchall()}
+
+    @api.model
+    def _create_bulk(self, vals_list):
+        """
+        Create the inventory lines of vals_list with a single INSERT.
+        The default Unit of Measure and the check on lines of other
+        inventories in progress of the stock.inventory.line create()
+        method are performed for all lines at once.
+        The default values, python constraints and stored computed
+        fields are handled via the ORM.
+        The lines are created one by one via create() when the values
+        contain fields which are not stored in the table.
+        """
+        if not vals_list:
+            return self.browse()
+        fnames = set()
+        for vals in vals_list:
+            fnames.update(vals)
+        if any(not self._fields[f].store or not self._fields[f].column_type
+               for f in fnames):
+            return self.browse(
+                [self.create(vals).id for vals in vals_list])
+
+        defaults = self.default_get(
+            [f for f, field in self._fields.iteritems()
+             if field.store and field.column_type and not field.compute
+             and f not in models.MAGIC_COLUMNS])
+        products = self.env['product.product'].browse(
+            list(set([int(x['product_id']) for x in vals_list
+                      if x.get('product_id')])))
+        product_uoms = {x.id: x.uom_id.id for x in products}
+        all_vals = []
+        for vals in vals_list:
+            vals = dict(defaults, **vals)
+            if vals.get('product_id') and 'product_uom_id' not in vals:
+                vals['product_uom_id'] = product_uoms[int(vals['product_id'])]
+            all_vals.append(vals)
+        self._check_inventories_in_progress(all_vals)
+
+        columns = sorted(set(defaults) | fnames | set(['product_uom_id']))
+        row_sql = "(%s, now() at time zone 'UTC', %s, now() at time zone " \
+            "'UTC', " + ', '.join(['%s'] * len(columns)) + ")"
+        rows = []
+        for vals in all_vals:
+            rows.append(self._cr.mogrify(
+                row_sql, [self._uid, self._uid] + [
+                    self._fields[f].convert_to_column(vals.get(f), self)
+                    for f in columns]))
+        self._cr.execute(
+            'INSERT INTO "%s" (create_uid, create_date, write_uid, '
+            'write_date, %s) VALUES %s RETURNING id' % (
+                self._table, ', '.join(['"%s"' % f for f in columns]),
+                ', '.join(rows)))
+        lines = self.browse([x[0] for x in self._cr.fetchall()])
+        lines.modified(columns)
+        lines.recompute()
+        lines._validate_fields(columns)
+        return lines
+
+    @api.model
+    def _check_inventories_in_progress(self, vals_list):
+        """
+        Inventory lines of an inventory in progress may not have the
+        product, location, owner, package and lot of another line of an
+        inventory in progress, cf. stock.inventory.line create().
+        """
+        fnames = ['product_id', 'location_id', 'partner_id',
+                  'package_id', 'prod_lot_id']
+        keys = {}
+        for vals in vals_list:
+            key = tuple([vals.get(f) and int(vals[f]) or None
+                         for f in fnames])
+            keys[key] = keys.get(key, 0) + 1
+        product_ids = tuple(set([x[0] for x in keys]))
+        location_ids = tuple(set([x[1] for x in keys]))
+        duplicates = [x for x in keys if keys[x] > 1]
+        if not duplicates and product_ids and location_ids:
+            self._cr.execute(
+                "SELECT sil.product_id, sil.location_id, sil.partner_id, "
+                "sil.package_id, sil.prod_lot_id "
+                "FROM stock_inventory_line sil "
+                "JOIN stock_inventory si ON si.id = sil.inventory_id "
+                "WHERE si.state = 'confirm' "
+                "AND sil.product_id IN %s AND sil.location_id IN %s",
+                (product_ids, location_ids))
+            duplicates = [x for x in self._cr.fetchall() if x in keys]
+        if duplicates:
+            product = self.env['product.product'].browse(duplicates[0][0])
+            location = self.env['stock.location'].browse(duplicates[0][1])
+            raise UserError(_(
+                "You cannot have two inventory adjustements in state "
+                "'in Progess' with the same product(%s), same location(%s), "
+                "same package, same owner and same lot. Please first "
+                "validate the first inventory adjustement with this "
+                "product before creating another one.")
+                % (product.display_name, location.display_name))
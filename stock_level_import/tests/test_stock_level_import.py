@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright 2009-2018 Noviat.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import unittest
+
+from odoo.tests.common import TransactionCase
+from odoo.modules.module import get_module_resource
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class TestStockLevelImport(TransactionCase):
+
+    def setUp(self):
+        super(TestStockLevelImport, self).setUp()
+        self.module_name = __name__.split('addons.')[1].split('.')[0]
+        self.location = self.env.ref('stock.stock_location_stock')
+        product_mod = self.env['product.product']
+        self.product_1 = product_mod.create({
+            'name': 'Stock Level Import Test 1',
+            'default_code': 'SLI-TEST-1',
+            'type': 'product',
+        })
+        self.product_2 = product_mod.create({
+            'name': 'Stock Level Import Test 2',
+            'default_code': '12345',
+            'type': 'product',
+        })
+        self.inventory = self.env['stock.inventory'].create({
+            'name': 'Stock Level Import Test',
+            'location_id': self.location.id,
+            'filter': 'partial',
+        })
+
+    @unittest.skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_stock_level_xlsx_import(self):
+        """
+        The numeric product code is matched with the Internal Reference,
+        the quantity stored as text uses the decimal separator.
+        """
+        file_path = get_module_resource(
+            self.module_name, 'tests', 'test_stock_level.xlsx')
+        data = open(file_path, 'rb').read().encode('base64')
+        wizard = self.env['stock.level.import'].create({
+            'stock_level_data': data,
+            'csv_separator': ';',
+            'decimal_separator': ',',
+        })
+        wizard.with_context(
+            active_id=self.inventory.id).stock_level_import()
+        self.assertEquals(self.inventory.state, 'confirm')
+        qtys = {l.product_id: l.product_qty for l in self.inventory.line_ids}
+        self.assertEquals(qtys, {self.product_1: 10.0, self.product_2: 2.5})
+        self.assertEquals(
+            self.inventory.line_ids.mapped('location_id'), self.location)
+
+    def _create_quants(self):
+        quant_mod = self.env['stock.quant']
+        self.owner = self.env['res.partner'].create({
+            'name': 'Stock Level Import Test Owner'})
+        for product, qty, owner in [(self.product_1, 7.0, False),
+                                    (self.product_1, 3.0, self.owner),
+                                    (self.product_2, 12.0, False)]:
+            quant_mod.create({
+                'product_id': product.id,
+                'location_id': self.location.id,
+                'qty': qty,
+                'owner_id': owner and owner.id,
+            })
+
+    def _import_csv(self, chunk_size):
+        data = '\n'.join([
+            'Stock Location;Product;Product UOM;Quantity',
+            '%s;SLI-TEST-1;;5' % self.location.complete_name,
+            '%s;12345;Dozen(s);1.5' % self.location.complete_name,
+        ])
+        wizard = self.env['stock.level.import'].create({
+            'stock_level_data': data.encode('base64'),
+            'csv_separator': ';',
+            'chunk_size': chunk_size,
+        })
+        wizard.with_context(
+            active_id=self.inventory.id).stock_level_import()
+        self.assertEquals(self.inventory.state, 'confirm')
+        return self.inventory.line_ids
+
+    def _get_standard_theoretical_qty(self, line):
+        qty = sum(line._get_quants().mapped('qty'))
+        product_uom = line.product_id.uom_id
+        if qty and line.product_uom_id \
+                and product_uom != line.product_uom_id:
+            qty = product_uom._compute_quantity(qty, line.product_uom_id)
+        return qty
+
+    def test_theoretical_qty_batch(self):
+        """
+        The theoretical quantities computed in batch are equal to
+        the ones of the standard compute method.
+        """
+        self._create_quants()
+        lines = self._import_csv(chunk_size=0)
+        self.assertEquals(len(lines), 2)
+        qtys = lines._get_theoretical_qtys()
+        for line in lines:
+            quants = line._get_quants()
+            self.assertEquals(
+                qtys[line._theoretical_qty_key()],
+                sum(quants.mapped('qty')))
+            self.assertAlmostEqual(
+                line.theoretical_qty,
+                self._get_standard_theoretical_qty(line))
+        line_1 = lines.filtered(lambda l: l.product_id == self.product_1)
+        self.assertAlmostEqual(line_1.theoretical_qty, 7.0)
+        line_2 = lines.filtered(lambda l: l.product_id == self.product_2)
+        self.assertAlmostEqual(line_2.theoretical_qty, 1.0)
+
+    def test_chunked_import(self):
+        """
+        The lines created in chunks of one line have the same values
+        as the lines created in a single chunk.
+        """
+        self._create_quants()
+        lines = self._import_csv(chunk_size=1)
+        self.assertEquals(len(lines), 2)
+        qtys = {l.product_id: l.product_qty for l in lines}
+        self.assertEquals(qtys, {self.product_1: 5.0, self.product_2: 1.5})
+        line_2 = lines.filtered(lambda l: l.product_id == self.product_2)
+        self.assertEquals(
+            line_2.product_uom_id, self.env.ref('product.product_uom_dozen'))
+        line_1 = lines.filtered(lambda l: l.product_id == self.product_1)
+        self.assertEquals(line_1.product_uom_id, self.product_1.uom_id)
+        for line in lines:
+            self.assertAlmostEqual(
+                line.theoretical_qty,
+                self._get_standard_theoretical_qty(line))
+            self.assertEquals(line.create_uid, self.env.user)
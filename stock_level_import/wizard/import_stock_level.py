@@ -9,11 +9,15 @@ except ImportError:
 import base64
 import csv
 import time
+from functools import partial
 from sys import exc_info
 from traceback import format_exception
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.addons.import_xlsx_helpers.xlsx_helpers import \
+    NumericCell, is_xlsx, iter_xlsx_rows
+from odoo.tools import float_compare
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -41,6 +45,17 @@ class StockLevelImport(models.TransientModel):
         default=lambda self: self._default_codepage(),
         help="Code Page of the system that has generated the csv file."
              "\nE.g. Windows-1252, utf-8")
+    chunk_size = fields.Integer(
+        string='Chunk Size', default=1000,
+        help="Number of inventory lines that are created at once."
+             "\nThe theoretical quantities of the lines of a chunk "
+             "are computed with a single query."
+             "\nKeep empty to create all lines at once.")
+    delta_only = fields.Boolean(
+        string='Only Differences',
+        help="Only create inventory lines for the input lines "
+             "with a quantity that differs from the current "
+             "quantity on hand.")
     note = fields.Text('Log')
 
     @api.model
@@ -58,7 +73,10 @@ class StockLevelImport(models.TransientModel):
     @api.one
     @api.depends('lines', 'csv_separator')
     def _compute_dialect(self):
-        if self.lines:
+        if self.stock_level_data and self._is_xlsx():
+            # xlsx input is not parsed with the csv module
+            self.dialect = csv.excel()
+        elif self.lines:
             try:
                 self.dialect = csv.Sniffer().sniff(
                     self.lines[:128], delimiters=';,')
@@ -76,16 +94,52 @@ class StockLevelImport(models.TransientModel):
 
     @api.onchange('stock_level_data')
     def _onchange_stock_level_data(self):
-        if self.lines:
+        if self.stock_level_data and self._is_xlsx():
+            # the separators are only used for the log
+            # and for numbers stored as text
+            self.csv_separator = self.csv_separator or ','
+        elif self.lines:
             self.csv_separator = self.dialect.delimiter
             if self.csv_separator == ';':
                 self.decimal_separator = ','
 
     @api.onchange('csv_separator')
     def _onchange_csv_separator(self):
-        if self.csv_separator and self.stock_level_data:
+        if self.csv_separator and self.stock_level_data \
+                and not self._is_xlsx():
             self.dialect.delimiter = self.csv_separator
 
+    def _is_xlsx(self):
+        return is_xlsx(self.stock_level_data)
+
+    def _iter_xlsx_rows(self):
+        return iter_xlsx_rows(self.stock_level_data)
+
+    def _read_input(self):
+        """
+        Returns the header fields and an iterator over the
+        rows after the header line.
+        """
+        self._xlsx = self._is_xlsx()
+        if self._xlsx:
+            input_fields = self._input_fields()
+            rows = self._iter_xlsx_rows()
+            for row in rows:
+                # remove leading blank or comment lines
+                if not row or row[0] == '' or row[0][:1] == '#':
+                    continue
+                header_fields = [x.lower() for x in row]
+                if not set(header_fields).intersection(input_fields):
+                    continue
+                return header_fields, rows
+            raise UserError(
+                _("No header line found in the input file !"))
+        lines, header = self._remove_leading_lines(self.lines)
+        header_fields = csv.reader(
+            StringIO.StringIO(header), dialect=self.dialect).next()
+        return header_fields, csv.reader(
+            StringIO.StringIO(lines), dialect=self.dialect)
+
     def _remove_leading_lines(self, lines):
         """ remove leading blank or comment lines """
         input = StringIO.StringIO(lines)
@@ -112,15 +166,25 @@ class StockLevelImport(models.TransientModel):
         Extend this dictionary if you want to add support for
         fields requiring pre-processing before being added to
         the inventory line values dict.
+        The 'prefetch' method resolves all distinct values of the
+        column with a minimum number of queries before processing
+        the input lines. The prefetch is skipped when the 'id_column'
+        is present in the input file.
         """
         res = {
-            'stock location': {'method': self._handle_location},
+            'stock location': {'method': self._handle_location,
+                               'prefetch': self._prefetch_locations,
+                               'id_column': 'location_id'},
             'location_id': {'method': self._handle_location_id,
                             'required': True},
-            'product': {'method': self._handle_product},
+            'product': {'method': self._handle_product,
+                        'prefetch': self._prefetch_products,
+                        'id_column': 'product_id'},
             'product_id': {'method': self._handle_product_id,
                            'required': True},
-            'product uom': {'method': self._handle_product_uom},
+            'product uom': {'method': self._handle_product_uom,
+                            'prefetch': self._prefetch_uoms,
+                            'id_column': 'product_uom_id'},
             'product_uom_id': {'method': self._handle_product_uom_id,
                                'required': True},
             'quantity': {'method': self._handle_quantity},
@@ -285,16 +349,31 @@ class StockLevelImport(models.TransientModel):
     def _handle_location_id(self, field, line, inventory, sil_vals):
         sil_vals['location_id'] = line[field]
 
+    def _location_domain(self, inventory):
+        return [('usage', '=', 'internal'),
+                ('company_id', '=', inventory.company_id.id)]
+
+    def _prefetch_locations(self, inventory, values):
+        locations = self.env['stock.location'].search(
+            self._location_domain(inventory)
+            + [('complete_name', 'in', values)])
+        self._locations_dict.update(
+            self._group_by_keys(values, locations, ['complete_name']))
+
+    def _get_locations(self, inventory, input):
+        if input in self._locations_dict:
+            return self._locations_dict[input]
+        locations = self.env['stock.location'].search(
+            self._location_domain(inventory)
+            + [('complete_name', '=', input)])
+        return locations.ids
+
     def _handle_location(self, field, line, inventory, sil_vals):
         if not sil_vals.get('location_id'):
-            loc_mod = self.env['stock.location']
             input = line[field]
-            domain = [('usage', '=', 'internal'),
-                      ('company_id', '=', inventory.company_id.id),
-                      ('complete_name', '=', input)]
-            locations = loc_mod.search(domain)
+            locations = self._get_locations(inventory, input)
             if len(locations) == 1:
-                sil_vals['location_id'] = locations.id
+                sil_vals['location_id'] = locations[0]
             elif len(locations) > 1:
                 msg = _("Multiple locations found "
                         "that match with '%s' !") % input
@@ -306,15 +385,27 @@ class StockLevelImport(models.TransientModel):
     def _handle_product_id(self, field, line, inventory, sil_vals):
         sil_vals['product_id'] = line[field]
 
+    def _prefetch_products(self, inventory, values):
+        products = self.env['product.product'].search(
+            ['|', ('default_code', 'in', values), ('name', 'in', values)])
+        self._products_dict.update(
+            self._group_by_keys(values, products, ['default_code', 'name']))
+
+    def _get_products(self, input):
+        if input in self._products_dict:
+            return self._products_dict[input]
+        prod_mod = self.env['product.product']
+        products = prod_mod.search([
+            ('default_code', '=', input)])
+        if not products:
+            products = prod_mod.search(
+                [('name', '=', input)])
+        return products.ids
+
     def _handle_product(self, field, line, inventory, sil_vals):
         if not sil_vals.get('product_id'):
             input = line[field]
-            prod_mod = self.env['product.product']
-            products = prod_mod.search([
-                ('default_code', '=', input)])
-            if not products:
-                products = prod_mod.search(
-                    [('name', '=', input)])
+            products = self._get_products(input)
             if not products:
                 msg = _("Product '%s' not found !") % input
                 self._log_line_error(line, msg)
@@ -325,19 +416,36 @@ class StockLevelImport(models.TransientModel):
                 self._log_line_error(line, msg)
                 return
             else:
-                product = products[0]
-                sil_vals['product_id'] = product.id
+                sil_vals['product_id'] = products[0]
 
     def _handle_product_uom_id(self, field, line, inventory, sil_vals):
         sil_vals['product_uom_id'] = line[field]
 
+    def _prefetch_uoms(self, inventory, values):
+        """
+        The Units of Measure are matched case insensitive.
+        Values without match are looked up via _get_uoms.
+        """
+        uoms = {}
+        for uom in self.env['product.uom'].search([]):
+            uoms.setdefault(uom.name.lower(), uom.id)
+        for value in values:
+            if value.lower() in uoms:
+                self._uoms_dict[value] = [uoms[value.lower()]]
+
+    def _get_uoms(self, name):
+        if name in self._uoms_dict:
+            return self._uoms_dict[name]
+        uoms = self.env['product.uom'].search([
+            ('name', '=ilike', name)])
+        return uoms.ids
+
     def _handle_product_uom(self, field, line, inventory, sil_vals):
         if not sil_vals.get('product_uom_id'):
             name = line[field]
-            uom = self.env['product.uom'].search([
-                ('name', '=ilike', name)])
-            if uom:
-                sil_vals['product_uom_id'] = uom[0].id
+            uoms = self._get_uoms(name)
+            if uoms:
+                sil_vals['product_uom_id'] = uoms[0]
             else:
                 msg = _("Unit of Measure with name '%s' not found !") % name
                 self._log_line_error(line, msg)
@@ -348,15 +456,73 @@ class StockLevelImport(models.TransientModel):
             sil_vals['product_qty'] = str2float(qty, self.decimal_separator) \
                 or 0.0
 
+    def _group_by_keys(self, values, records, keys):
+        """
+        Map the input values to the ids of the records that match
+        with the first key (in the order of 'keys') that gives a result.
+        """
+        res = {}
+        for value in values:
+            res[value] = []
+        for key in keys:
+            key_map = {}
+            for record in records:
+                key_map.setdefault(record[key], []).append(record.id)
+            for value in values:
+                if not res[value]:
+                    res[value] = key_map.get(value, [])
+        return res
+
+    def _prefetch(self, inventory, rows):
+        """
+        Collect the distinct values of the columns with a 'prefetch'
+        method in the input rows and resolve those with a single
+        query per column.
+        """
+        self._locations_dict = {}
+        self._products_dict = {}
+        self._uoms_dict = {}
+        prefetch_cols = []
+        for i, hf in enumerate(self._header_fields):
+            if hf in self._skip_fields:
+                continue
+            field_method = self._field_methods[hf]
+            if field_method.get('prefetch') \
+                    and field_method.get('id_column') \
+                    not in self._header_fields:
+                prefetch_cols.append((i, field_method['prefetch']))
+        if not prefetch_cols:
+            return
+
+        values = {}
+        for i, method in prefetch_cols:
+            values[method] = set()
+        for row in rows:
+            if row and row[0][:1] == '#':
+                continue
+            for i, method in prefetch_cols:
+                if i < len(row):
+                    if self._xlsx:
+                        value = row[i]
+                    else:
+                        try:
+                            value = row[i].decode(self.codepage).strip()
+                        except UnicodeError:
+                            # reported while processing the input lines
+                            continue
+                    if value:
+                        values[method].add(value)
+
+        for method in values:
+            if values[method]:
+                method(inventory, list(values[method]))
+
     def _process_line_vals(self, line, inventory, sil_vals):
         """
         Use this method if you want to check/modify the
         line input values dict before calling the inventory write() method
         """
-        all_fields = self._field_methods
-        required_fields = [x for x in all_fields
-                           if all_fields[x].get('required')]
-        for rf in required_fields:
+        for rf in self._required_fields:
             if rf not in sil_vals:
                 msg = _("The '%s' field is a required field "
                         "that must be correctly set.") % rf
@@ -369,98 +535,228 @@ class StockLevelImport(models.TransientModel):
         """
         return vals
 
-    @api.multi
-    def stock_level_import(self):
+    def _compile_row_processor(self):
+        """
+        Compile the processed header into a tuple of
+        (column index, header field, handler) in order to avoid
+        the evaluation of the header field definitions for every line.
+
+        We process the header in reversed order for performance reasons.
+        By doing so, the *_id fields generated by the
+        stock_level_export_xls module are processed first,
+        thereby removing the need for database lookups.
+        """
+        processor = []
+        skip_fields = set(self._skip_fields)
+        for i, hf in reversed(list(enumerate(self._header_fields))):
+            if hf in skip_fields:
+                continue
+            field_method = self._field_methods[hf]
+            if field_method.get('orm_field'):
+                handler = partial(
+                    field_method['method'],
+                    orm_field=field_method['orm_field'])
+            else:
+                handler = field_method['method']
+            processor.append((i, hf, handler))
+        self._row_processor = tuple(processor)
+        all_fields = self._field_methods
+        self._required_fields = tuple(
+            [x for x in all_fields if all_fields[x].get('required')])
 
-        time_start = time.time()
-        self._err_log = ''
-        inventory = self.env['stock.inventory'].browse(
-            self._context['active_id'])
-        self._get_orm_fields()
-        lines, header = self._remove_leading_lines(self.lines)
-        header_fields = csv.reader(
-            StringIO.StringIO(header), dialect=self.dialect).next()
-        self._header_fields = self._process_header(header_fields)
-        reader = csv.DictReader(
-            StringIO.StringIO(lines), fieldnames=self._header_fields,
-            dialect=self.dialect)
+    def _iter_inventory_line_vals(self, inventory, reader):
+        """
+        generator of the inventory line values dicts of the input lines
+        """
+        self._compile_row_processor()
+        header_fields = self._header_fields
+        column_cnt = len(header_fields)
+        processor = self._row_processor
+        codepage = self.codepage
+        xlsx = self._xlsx
 
-        lines = []
-        for line in reader:
+        for row in reader:
 
+            if not row:
+                continue
+            if len(row) < column_cnt:
+                row += [''] * (column_cnt - len(row))
             sil_vals = {}
 
             # step 1: handle codepage
-            for i, hf in enumerate(self._header_fields):
-                try:
-                    line[hf] = line[hf].decode(self.codepage).strip()
-                except:
-                    tb = ''.join(format_exception(*exc_info()))
-                    raise UserError(
-                        _("Wrong Code Page"),
-                        _("Error while processing line '%s' :\n%s")
-                        % (line, tb))
+            try:
+                if xlsx:
+                    values = row[:column_cnt]
+                else:
+                    values = [
+                        x.decode(codepage).strip() for x in row[:column_cnt]]
+                line = dict(zip(header_fields, values))
+            except:
+                tb = ''.join(format_exception(*exc_info()))
+                raise UserError(
+                    _("Wrong Code Page"),
+                    _("Error while processing line '%s' :\n%s")
+                    % (row, tb))
 
             # step 2: process input fields
-            header_reversed = reversed(self._header_fields)
-            # we process the header in reversed order for performance reasons.
-            # By doing so, the *_id fields generated by the
-            # stock_level_export_xls module are processed first,
-            # thereby removing the need for database lookups.
-            for i, hf in enumerate(header_reversed):
-                if i == 0 and line[hf] and line[hf][0] == '#':
-                    # lines starting with # are considered as comment lines
-                    break
-                if hf in self._skip_fields:
-                    continue
+            if column_cnt and line[header_fields[0]][:1] == '#':
+                # lines starting with # are considered as comment lines
+                continue
+            for i, hf, handler in processor:
                 if line[hf] == '':
                     continue
-
-                if self._field_methods[hf].get('orm_field'):
-                    self._field_methods[hf]['method'](
-                        hf, line, inventory, sil_vals,
-                        orm_field=self._field_methods[hf]['orm_field'])
-                else:
-                    self._field_methods[hf]['method'](
-                        hf, line, inventory, sil_vals)
+                handler(hf, line, inventory, sil_vals)
 
             if sil_vals:
                 self._process_line_vals(line, inventory, sil_vals)
-                lines.append(sil_vals)
+                yield sil_vals
+
+    def _create_inventory_lines(self, inventory, vals):
+        """
+        Create the inventory lines in chunks of 'chunk_size' lines
+        with a single INSERT per chunk.
+        The theoretical quantities are computed per chunk,
+        cf. stock.inventory.line, _create_bulk and
+        _compute_theoretical_qty.
+        """
+        sil_mod = self.env['stock.inventory.line'].with_context(
+            novalidate=True, stock_level_import=True)
+        chunk_size = self.chunk_size > 0 and self.chunk_size or len(vals)
+        for i in xrange(0, len(vals), chunk_size):
+            sil_mod._create_bulk(
+                [dict(x[2], inventory_id=inventory.id)
+                 for x in vals[i:i + chunk_size]])
+            # release the records of this chunk from the cache
+            self.env.invalidate_all()
+
+    def _get_quant_qtys(self, inventory, lines):
+        """
+        Returns the quant quantities of the locations and products
+        of the inventory line values dicts, keyed by
+        (location, product, lot, package, owner), via a single
+        grouped query.
+        """
+        if not lines:
+            return {}
+        location_ids = set()
+        product_ids = set()
+        for sil_vals in lines:
+            location_ids.add(int(sil_vals['location_id']))
+            product_ids.add(int(sil_vals['product_id']))
+        self._cr.execute(
+            "SELECT location_id, product_id, "
+            "lot_id, package_id, owner_id, SUM(qty) "
+            "FROM stock_quant "
+            "WHERE company_id = %s "
+            "AND location_id IN %s AND product_id IN %s "
+            "GROUP BY location_id, product_id, "
+            "lot_id, package_id, owner_id",
+            (inventory.company_id.id,
+             tuple(location_ids), tuple(product_ids)))
+        return {x[:5]: x[5] for x in self._cr.fetchall()}
+
+    def _remove_unchanged_lines(self, inventory, lines):
+        """
+        Remove the inventory line values dicts with a quantity that
+        is equal to the current quantity on hand.
+        The skipped lines are summarised in self._skip_log.
+        """
+        qtys = self._get_quant_qtys(inventory, lines)
+        products = self.env['product.product'].browse(
+            list(set([int(x['product_id']) for x in lines])))
+        product_uoms = {p.id: p.uom_id for p in products}
+        uom_mod = self.env['product.uom']
+        res = []
+        skipped = {}
+        for sil_vals in lines:
+            key = tuple([
+                sil_vals.get(f) and int(sil_vals[f]) or None
+                for f in ['location_id', 'product_id', 'prod_lot_id',
+                          'package_id', 'partner_id']])
+            product_uom = product_uoms[key[1]]
+            uom = sil_vals.get('product_uom_id') \
+                and uom_mod.browse(int(sil_vals['product_uom_id'])) \
+                or product_uom
+            qty = qtys.get(key, 0.0)
+            if qty and uom != product_uom:
+                qty = product_uom._compute_quantity(qty, uom)
+            if float_compare(
+                    sil_vals.get('product_qty', 0.0), qty,
+                    precision_rounding=uom.rounding):
+                res.append(sil_vals)
+            else:
+                skipped[key[0]] = skipped.get(key[0], 0) + 1
+        self._skip_log = ''
+        if skipped:
+            self._skip_log = _(
+                "%s of %s input lines have been skipped since the "
+                "quantity is equal to the quantity on hand:"
+                ) % (len(lines) - len(res), len(lines)) + '\n'
+            locations = self.env['stock.location'].browse(skipped.keys())
+            for location in locations.sorted('complete_name'):
+                self._skip_log += '\n%s: %s' % (
+                    location.complete_name, skipped[location.id])
+        return res
+
+    def _action_result_view(self):
+        module = __name__.split('addons.')[1].split('.')[0]
+        result_view = self.env.ref(
+            '%s.stock_level_import_view_form_result' % module)
+        return {
+            'name': _("Import File result"),
+            'res_id': self.id,
+            'view_type': 'form',
+            'view_mode': 'form',
+            'res_model': 'stock.level.import',
+            'view_id': result_view.id,
+            'target': 'new',
+            'type': 'ir.actions.act_window',
+        }
+
+    @api.multi
+    def stock_level_import(self):
+
+        time_start = time.time()
+        self._err_log = ''
+        inventory = self.env['stock.inventory'].browse(
+            self._context['active_id'])
+        self._get_orm_fields()
+        header_fields, reader = self._read_input()
+        self._header_fields = self._process_header(header_fields)
+        rows = list(reader)
+        self._prefetch(inventory, rows)
+
+        lines = list(self._iter_inventory_line_vals(inventory, rows))
+        self._skip_log = ''
+        if self.delta_only and not self._err_log:
+            lines = self._remove_unchanged_lines(inventory, lines)
 
         vals = [(0, 0, l) for l in lines]
         vals = self._process_vals(inventory, vals)
 
         if self._err_log:
             self.note = self._err_log
-            module = __name__.split('addons.')[1].split('.')[0]
-            result_view = self.env.ref(
-                '%s.stock_level_import_view_form_result' % module)
-            return {
-                'name': _("Import File result"),
-                'res_id': self.id,
-                'view_type': 'form',
-                'view_mode': 'form',
-                'res_model': 'stock.level.import',
-                'view_id': result_view.id,
-                'target': 'new',
-                'type': 'ir.actions.act_window',
-            }
+            return self._action_result_view()
         else:
             ctx = dict(self._context, novalidate=True)
             inventory.with_context(ctx).write({
-                'line_ids': vals,
                 'state': 'confirm',
                 'date': fields.Datetime.now(),
                 })
+            self._create_inventory_lines(inventory, vals)
             import_time = time.time() - time_start
             _logger.warn(
                 'stock.inventory %s import time = %.3f seconds',
                 inventory.name, import_time)
+            if self._skip_log:
+                self.note = self._skip_log
+                return self._action_result_view()
             return {'type': 'ir.actions.act_window_close'}
 
 
 def str2float(amount, decimal_separator):
+    if isinstance(amount, NumericCell):
+        return float(amount.value)
     if not amount:
         return 0.0
     try:
@@ -473,6 +769,10 @@ def str2float(amount, decimal_separator):
 
 
 def str2int(amount, decimal_separator):
+    if isinstance(amount, NumericCell):
+        if float(amount.value).is_integer():
+            return int(amount.value)
+        return False
     if not amount:
         return 0
     try: